@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+log = logging.getLogger(__name__)
+
+# Tek mesajda duyurulacak en fazla kullanıcı (Discord'un 2000 karakter sınırının altında kalır)
+MAX_PER_MESSAGE = 20
+
+# Tüm kanallarda gönderilmeyi bekleyebilecek en fazla duyuru
+MAX_PENDING = 5000
+
+
+class TokenBucket:
+    """Kanal başına gönderim bütçesi: `capacity` mesaj, her `period` saniyede yenilenir"""
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Bir mesaj gönderebilmek için beklenecek süre"""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def time_to_full(self) -> float:
+        self._refill(time.monotonic())
+        return (self.capacity - self.tokens) / self.rate
+
+
+def level_up_text(mention: str, level: int) -> str:
+    return f"🎉 Tebrikler {mention}! Seviye {level}'e ulaştın!"
+
+
+class LevelUpAnnouncer:
+    """Seviye atlama duyurularını arka planda, kanal başına birleştirip hız sınırına uyarak gönderir"""
+
+    def __init__(self, window: float = 1.5, channel_messages: int = 5, channel_seconds: float = 5.0):
+        self.window = window
+        self.channel_messages = channel_messages
+        self.channel_seconds = channel_seconds
+        # channel_id -> user_id -> (mention, seviye); aynı kullanıcının ardışık seviyeleri birleşir
+        self._pending: Dict[int, 'OrderedDict[int, Tuple[str, int]]'] = {}
+        self._channels: Dict[int, object] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+        self.queued = 0
+        self.coalesced = 0
+        self.sent_messages = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    def announce(self, channel, member, level: int):
+        """Duyuruyu kuyruğa al ve hemen dön; gönderim kanalın görevinde yapılır"""
+        pending = self._pending.get(channel.id)
+        previous = pending.get(member.id) if pending else None
+        if previous is not None:
+            pending[member.id] = (member.mention, max(level, previous[1]))
+            self.coalesced += 1
+            return
+        if len(self) >= MAX_PENDING:
+            # Gönderim gerisinde kalındığında duyurular sessizce düşer; seviye zaten kaydedildi
+            self.dropped += 1
+            return
+        if pending is None:
+            pending = self._pending[channel.id] = OrderedDict()
+        pending[member.id] = (member.mention, level)
+        self.queued += 1
+        self._channels[channel.id] = channel
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._drain(channel.id))
+
+    async def _drain(self, channel_id: int):
+        bucket = self._buckets.setdefault(channel_id, TokenBucket(self.channel_messages, self.channel_seconds))
+        try:
+            # Kısa bir süre bekle; bu sürede gelen seviye atlamaları aynı mesaja girer
+            await asyncio.sleep(self.window)
+            while True:
+                pending = self._pending.get(channel_id)
+                if pending:
+                    wait = bucket.wait_time()
+                    if wait > 0:
+                        # Bütçe bitti; beklerken gelenler de sonraki mesajda birleşir
+                        await asyncio.sleep(wait)
+                        continue
+                    bucket.take()
+                    batch = [pending.popitem(last=False) for _ in range(min(MAX_PER_MESSAGE, len(pending)))]
+                    await self._send(channel_id, batch)
+                    continue
+                # Kova dolana kadar görev açık kalır; böylece yeni duyurular da bütçeye tabi olur
+                idle = bucket.time_to_full()
+                if idle <= 0:
+                    return
+                await asyncio.sleep(min(idle, self.window))
+        finally:
+            self._tasks.pop(channel_id, None)
+            self._buckets.pop(channel_id, None)
+            if not self._pending.get(channel_id):
+                self._pending.pop(channel_id, None)
+                self._channels.pop(channel_id, None)
+
+    async def _send(self, channel_id: int, batch):
+        channel = self._channels.get(channel_id)
+        text = '\n'.join(level_up_text(mention, level) for _, (mention, level) in batch)
+        try:
+            await channel.send(text)
+            self.sent_messages += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Kanal silinmiş ya da izin kaldırılmış olabilir; duyuru için tekrar denenmez
+            self.failed += 1
+            log.warning('Seviye duyurusu gönderilemedi (kanal %s)', channel_id, exc_info=True)
+
+    async def close(self):
+        """Bekleyen gönderim görevlerini durdur"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Hiç başlamadan iptal edilen görevlerin finally bloğu çalışmaz
+        self._tasks.clear()
+        self._buckets.clear()
+        self._pending.clear()
+        self._channels.clear()
+
+    def stats(self) -> Dict:
+        """Duyuru kuyruğu istatistiklerini getir"""
+        return {
+            'pending': len(self),
+            'channels': len(self._tasks),
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+            'sent_messages': self.sent_messages,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
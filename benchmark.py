@@ -0,0 +1,429 @@
+"""Discord bağlantısı olmadan Database üzerinde sentetik sunucu yüküyle performans ölçümü.
+
+Örnek:
+    python benchmark.py --guilds 5 --users 2000 --message-rate 20 --duration 3600 --output sonuc.json
+    python benchmark.py --compare onceki.json --output sonuc.json
+"""
+import argparse
+import asyncio
+import datetime
+import heapq
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database import Database
+
+PERIODS = ('günlük', 'haftalık', 'aylık')
+
+# Karşılaştırmada bu oranın üstündeki yavaşlama gerileme sayılır
+DEFAULT_THRESHOLD = 0.10
+
+# Bundan küçük gecikme farkları ölçüm gürültüsü sayılır
+NOISE_FLOOR_MS = 0.1
+
+
+class SyntheticGuild:
+    """Sentetik bir sunucunun kimlikleri ve kullanıcı etkinlik dağılımı"""
+    __slots__ = ('guild_id', 'user_ids', 'channel_ids', 'voice_channel_ids', 'emojis', '_user_weights',
+                 '_channel_weights', '_emoji_weights')
+
+    def __init__(self, rng: random.Random, index: int, users: int, channels: int, voice_channels: int,
+                 emojis: int, skew: float):
+        # Snowflake benzeri kimlikler; shard dağılımı (guild_id >> 22) gerçek sunuculardaki gibi olur
+        self.guild_id = ((1 << 40) + index * 7919 + rng.getrandbits(20)) << 22
+        self.user_ids = [rng.getrandbits(62) | (1 << 56) for _ in range(users)]
+        self.channel_ids = [rng.getrandbits(62) | (1 << 56) for _ in range(channels)]
+        self.voice_channel_ids = [rng.getrandbits(62) | (1 << 56) for _ in range(voice_channels)]
+        self.emojis = [(str(rng.getrandbits(62)), f'emoji_{number}') for number in range(emojis)]
+        # Etkinlik Zipf dağılımına uyar: az sayıda kullanıcı ve kanal mesajların çoğunu üretir
+        self._user_weights = zipf_weights(users, skew)
+        self._channel_weights = zipf_weights(channels, skew)
+        self._emoji_weights = zipf_weights(emojis, skew)
+
+    def user(self, rng: random.Random) -> int:
+        return rng.choices(self.user_ids, cum_weights=self._user_weights)[0]
+
+    def channel(self, rng: random.Random) -> int:
+        return rng.choices(self.channel_ids, cum_weights=self._channel_weights)[0]
+
+    def emoji(self, rng: random.Random) -> Tuple[str, str]:
+        return rng.choices(self.emojis, cum_weights=self._emoji_weights)[0]
+
+
+def zipf_weights(count: int, skew: float) -> List[float]:
+    """random.choices için kümülatif Zipf ağırlıkları"""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def guild_events(guild: SyntheticGuild, seed: int, start: datetime.datetime, duration: float,
+                 message_rate: float, voice_churn: float, reaction_ratio: float) -> Iterator[tuple]:
+    """Bir sunucunun zamana göre sıralı olay akışı: (zaman, tür, sunucu, kullanıcı, kanal, emoji)"""
+    rng = random.Random(seed)
+    # Ses değişiklikleri dakikada voice_churn kez, mesajlar saniyede message_rate kez (Poisson)
+    voice_rate = voice_churn / 60
+    total_rate = message_rate + voice_rate
+    if total_rate <= 0:
+        return
+    in_voice: Dict[int, int] = {}
+    elapsed = 0.0
+    while True:
+        elapsed += rng.expovariate(total_rate)
+        if elapsed >= duration:
+            break
+        timestamp = start + datetime.timedelta(seconds=elapsed)
+        if rng.random() < message_rate / total_rate:
+            user_id = guild.user(rng)
+            yield timestamp, 'message', guild.guild_id, user_id, guild.channel(rng), None
+            if rng.random() < reaction_ratio:
+                yield timestamp, 'reaction', guild.guild_id, guild.user(rng), None, guild.emoji(rng)
+            continue
+
+        user_id = guild.user(rng)
+        before = in_voice.get(user_id)
+        if before is None:
+            after = rng.choice(guild.voice_channel_ids)
+        elif rng.random() < 0.3 and len(guild.voice_channel_ids) > 1:
+            after = rng.choice([channel for channel in guild.voice_channel_ids if channel != before])
+        else:
+            after = None
+        if after is None:
+            in_voice.pop(user_id, None)
+        else:
+            in_voice[user_id] = after
+        yield timestamp, 'voice', guild.guild_id, user_id, (before, after), None
+
+
+def event_stream(guilds: Sequence[SyntheticGuild], seed: int, start: datetime.datetime, duration: float,
+                 message_rate: float, voice_churn: float, reaction_ratio: float) -> Iterator[tuple]:
+    """Tüm sunucuların olaylarını zaman sırasına göre birleştir (bellekte liste tutulmaz)"""
+    streams = [
+        guild_events(guild, seed + index, start, duration, message_rate, voice_churn, reaction_ratio)
+        for index, guild in enumerate(guilds)
+    ]
+    return heapq.merge(*streams, key=lambda event: event[0])
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Sıralı olmayan değerlerde en yakın sıra yöntemiyle yüzdelik"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(seconds: Sequence[float]) -> Dict:
+    """Gecikme ölçümlerini milisaniye cinsinden özetle"""
+    return {
+        'runs': len(seconds),
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3),
+        'mean_ms': round(sum(seconds) / len(seconds) * 1000, 3) if seconds else 0.0,
+        'max_ms': round(max(seconds) * 1000, 3) if seconds else 0.0,
+    }
+
+
+async def storage_bytes(db: Database) -> int:
+    """Veritabanının diskteki boyutu (SQLite: ana dosya + WAL, PostgreSQL: veritabanı boyutu)"""
+    if db.backend == 'postgres':
+        async with db.pool.reader() as conn:
+            async with conn.execute('SELECT pg_database_size(current_database())') as cursor:
+                row = await cursor.fetchone()
+        return int(row[0])
+    archive = os.path.splitext(db.db_name)[0] + '_archive.db'
+    total = 0
+    for path in (db.db_name, db.db_name + '-wal', archive, archive + '-wal'):
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+async def replay(db: Database, events: Iterator[tuple], speed: float) -> Dict:
+    """Olayları olay işleyicileriyle aynı yoldan geçir; speed > 0 ise simüle zamana göre bekle"""
+    latencies: Dict[str, List[float]] = {'message': [], 'voice': [], 'reaction': []}
+    level_ups = 0
+    began = time.perf_counter()
+    first: Optional[datetime.datetime] = None
+    for timestamp, kind, guild_id, user_id, channel, emoji in events:
+        if speed > 0:
+            first = first or timestamp
+            delay = (timestamp - first).total_seconds() / speed - (time.perf_counter() - began)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        started = time.perf_counter()
+        if kind == 'message':
+            leveled_up, _ = await db.record_message(user_id, channel, guild_id, f'Üye {user_id}', timestamp)
+            level_ups += leveled_up
+        elif kind == 'voice':
+            await db.record_voice_update(user_id, guild_id, channel[0], channel[1], timestamp)
+        else:
+            await db.log_emoji_usage(user_id=user_id, guild_id=guild_id, emoji_id=emoji[0], emoji_name=emoji[1])
+        latencies[kind].append(time.perf_counter() - started)
+
+    handled = time.perf_counter() - began
+    # Kuyrukta bekleyen olaylar ve bellekteki XP yazılana kadar alım bitmiş sayılmaz
+    await db.ingest.flush()
+    await db.xp.checkpoint()
+    elapsed = time.perf_counter() - began
+
+    count = sum(len(values) for values in latencies.values())
+    return {
+        'events': count,
+        'messages': len(latencies['message']),
+        'voice_updates': len(latencies['voice']),
+        'reactions': len(latencies['reaction']),
+        'level_ups': level_ups,
+        'handler_seconds': round(handled, 3),
+        'total_seconds': round(elapsed, 3),
+        'events_per_second': round(count / elapsed, 1) if elapsed else 0.0,
+        'handlers': {kind: summarize(values) for kind, values in latencies.items() if values},
+    }
+
+
+def query_plan(guild: SyntheticGuild) -> List[Tuple[str, object]]:
+    """Ölçülecek sıralama/istatistik sorguları: (ad, veritabanını alıp çağrı döndüren fonksiyon)"""
+    guild_id = guild.guild_id
+    user_id = guild.user_ids[0]
+    channel_id = guild.channel_ids[0]
+    plan = []
+    for period in PERIODS:
+        plan.append((f'message_leaderboard[{period}]',
+                     lambda db, period=period: db.get_message_leaderboard(guild_id, period)))
+        plan.append((f'voice_leaderboard[{period}]',
+                     lambda db, period=period: db.get_voice_leaderboard(guild_id, period)))
+    plan.extend([
+        ('message_count', lambda db: db.get_message_count(guild_id, 'günlük')),
+        ('active_users', lambda db: db.get_active_users_count(guild_id, 'günlük')),
+        ('active_users_exact', lambda db: db.get_active_users_count(guild_id, 'günlük', exact=True)),
+        ('channel_stats', lambda db: db.get_channel_stats(channel_id, guild_id, 'günlük')),
+        ('channels_overview', lambda db: db.get_channels_stats(guild_id, None, 'haftalık')),
+        ('emoji_stats', lambda db: db.get_emoji_stats(guild_id)),
+        ('level_leaderboard', lambda db: db.get_top_users(guild_id)),
+        ('permanent_stats', lambda db: db.get_permanent_stats(guild_id)),
+        ('user_level', lambda db: db.get_user_level(user_id, guild_id)),
+        ('user_message_count', lambda db: db.get_user_message_count(user_id, guild_id)),
+        ('user_voice_time', lambda db: db.get_user_voice_time(user_id, guild_id)),
+    ])
+    return plan
+
+
+async def measure_queries(db: Database, guilds: Sequence[SyntheticGuild], runs: int) -> Dict:
+    """Her sorguyu önbelleksiz (cold), bellekteki sıralamalardan (board) ve önbellekten (cached) ölç"""
+    cold: Dict[str, List[float]] = {}
+    board: Dict[str, List[float]] = {}
+    warm: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        for guild in guilds:
+            for name, call in query_plan(guild):
+                # Soğuk: sonuç önbelleği ve bellekteki sıralamalar boş, yanıt özet tablolardan gelir
+                db.cache.clear()
+                db.leaderboards.forget(guild.guild_id)
+                started = time.perf_counter()
+                await call(db)
+                cold.setdefault(name, []).append(time.perf_counter() - started)
+                # Yalnızca sonuç önbelleği boş; bellekteki sıralamadan yanıtlananlar ayrı raporlanır
+                db.cache.clear()
+                served = db.leaderboards.served
+                started = time.perf_counter()
+                await call(db)
+                if db.leaderboards.served > served:
+                    board.setdefault(name, []).append(time.perf_counter() - started)
+                started = time.perf_counter()
+                await call(db)
+                warm.setdefault(name, []).append(time.perf_counter() - started)
+
+    results = {}
+    for name, seconds in cold.items():
+        results[name] = summarize(seconds)
+        if name in board:
+            results[name]['board_p50_ms'] = summarize(board[name])['p50_ms']
+        results[name]['cached_p50_ms'] = summarize(warm[name])['p50_ms']
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    """Sentetik yükü oluştur, işle ve sonuçları topla"""
+    rng = random.Random(args.seed)
+    guilds = [
+        SyntheticGuild(rng, index, args.users, args.channels, args.voice_channels, args.emojis, args.skew)
+        for index in range(args.guilds)
+    ]
+
+    workdir = None
+    db_name = args.db
+    if args.backend == 'sqlite' and not db_name:
+        workdir = tempfile.mkdtemp(prefix='stats_benchmark_')
+        db_name = os.path.join(workdir, 'benchmark.db')
+
+    db = Database(db_name=db_name or 'discord_stats.db', backend=args.backend, dsn=args.dsn,
+                  profile=args.profile, batch_size=args.batch_size, flush_interval=args.flush_ms / 1000,
+                  shard_count=args.shards or None)
+    try:
+        await db.setup()
+        size_before = await storage_bytes(db)
+
+        # Olaylar "şimdi"de biter; günlük/haftalık/aylık pencereler üretilen veriyi kapsar
+        start = datetime.datetime.now() - datetime.timedelta(seconds=args.duration)
+        events = event_stream(guilds, args.seed, start, args.duration, args.message_rate,
+                              args.voice_churn, args.reaction_ratio)
+        ingest = await replay(db, events, args.speed)
+        size_after = await storage_bytes(db)
+
+        queries = await measure_queries(db, guilds, args.query_runs)
+
+        return {
+            'benchmark': 'discord_stats',
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'sqlite': sqlite3.sqlite_version,
+                'backend': args.backend,
+            },
+            'config': {key: value for key, value in vars(args).items()
+                       if key not in ('dsn', 'output', 'compare')},
+            'ingest': ingest,
+            'queries': queries,
+            'storage': {
+                'bytes_before': size_before,
+                'bytes_after': size_after,
+                'growth_bytes': size_after - size_before,
+                'bytes_per_event': round((size_after - size_before) / ingest['events'], 1)
+                if ingest['events'] else 0.0,
+            },
+            'pool': db.pool_stats(),
+            'cache': db.cache_stats(),
+            'queues': db.ingest.stats(),
+        }
+    finally:
+        await db.close()
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(previous: Dict, current: Dict, threshold: float) -> List[str]:
+    """İki sonucu karşılaştır, eşiği aşan gerilemeleri döndür"""
+    regressions = []
+
+    def check(name: str, old: float, new: float, higher_is_better: bool = False, floor: float = 0.0):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold and abs(new - old) >= floor:
+            flag = '  << GERİLEME'
+            regressions.append(name)
+        print(f'{name:<42} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}')
+
+    print(f'{"ölçüm":<42} {"önceki":>12} {"şimdiki":>12} {"fark":>8}')
+    check('ingest.events_per_second', previous['ingest']['events_per_second'],
+          current['ingest']['events_per_second'], higher_is_better=True)
+    for kind, stats in current['ingest']['handlers'].items():
+        old = previous['ingest']['handlers'].get(kind)
+        if old:
+            check(f'handler.{kind}.p99_ms', old['p99_ms'], stats['p99_ms'], floor=NOISE_FLOOR_MS)
+    for name, stats in current['queries'].items():
+        old = previous['queries'].get(name)
+        if old:
+            check(f'query.{name}.p50_ms', old['p50_ms'], stats['p50_ms'], floor=NOISE_FLOOR_MS)
+            check(f'query.{name}.p99_ms', old['p99_ms'], stats['p99_ms'], floor=NOISE_FLOOR_MS)
+            if 'board_p50_ms' in old and 'board_p50_ms' in stats:
+                check(f'query.{name}.board_p50_ms', old['board_p50_ms'], stats['board_p50_ms'],
+                      floor=NOISE_FLOOR_MS)
+    check('storage.bytes_per_event', previous['storage']['bytes_per_event'],
+          current['storage']['bytes_per_event'])
+    return regressions
+
+
+def report(result: Dict):
+    ingest = result['ingest']
+    print(f"Olaylar: {ingest['events']} ({ingest['messages']} mesaj, {ingest['voice_updates']} ses, "
+          f"{ingest['reactions']} tepki) - {ingest['events_per_second']} olay/sn")
+    for kind, stats in ingest['handlers'].items():
+        print(f"  {kind:<10} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms")
+    print('Sorgular:')
+    for name, stats in result['queries'].items():
+        board = f" sıralama p50={stats['board_p50_ms']}ms" if 'board_p50_ms' in stats else ''
+        print(f"  {name:<32} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms{board} "
+              f"önbellek p50={stats['cached_p50_ms']}ms")
+    storage = result['storage']
+    print(f"Depolama: +{storage['growth_bytes'] / 1024 / 1024:.1f} MB ({storage['bytes_per_event']} bayt/olay)")
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Sentetik sunucu yüküyle Database performans ölçümü')
+    parser.add_argument('--guilds', type=int, default=3, help='sunucu sayısı')
+    parser.add_argument('--users', type=int, default=1000, help='sunucu başına kullanıcı')
+    parser.add_argument('--channels', type=int, default=20, help='sunucu başına yazı kanalı')
+    parser.add_argument('--voice-channels', type=int, default=5, help='sunucu başına ses kanalı')
+    parser.add_argument('--emojis', type=int, default=50, help='sunucu başına emoji')
+    parser.add_argument('--message-rate', type=float, default=5.0, help='sunucu başına saniyede mesaj')
+    parser.add_argument('--voice-churn', type=float, default=10.0, help='sunucu başına dakikada ses değişikliği')
+    parser.add_argument('--reaction-ratio', type=float, default=0.1, help='tepki alan mesaj oranı')
+    parser.add_argument('--duration', type=float, default=3600.0, help='simüle edilen süre (saniye)')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf etkinlik eğimi')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='0: olabildiğince hızlı, 1: gerçek zaman, 10: 10 kat hızlı')
+    parser.add_argument('--query-runs', type=int, default=20, help='sunucu başına sorgu tekrarı')
+    parser.add_argument('--seed', type=int, default=1, help='rastgele üreteç tohumu')
+    parser.add_argument('--backend', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), help='PostgreSQL bağlantı adresi (boş bir veritabanı)')
+    parser.add_argument('--db', help='SQLite dosyası (verilmezse geçici dizinde oluşturulur)')
+    parser.add_argument('--keep', action='store_true', help='geçici SQLite dosyasını silme')
+    parser.add_argument('--profile', default='throughput', help='SQLite profili')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--flush-ms', type=int, default=250)
+    parser.add_argument('--shards', type=int, default=0, help='shard sayısı (0: tek bağlantı)')
+    parser.add_argument('--output', help='sonuçların yazılacağı JSON dosyası')
+    parser.add_argument('--compare', help='karşılaştırılacak önceki JSON sonucu')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='gerileme eşiği (0.10 = %%10)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.backend == 'postgres' and not args.dsn:
+        print('PostgreSQL için --dsn ya da DATABASE_URL gerekli', file=sys.stderr)
+        return 2
+
+    result = asyncio.run(run(args))
+    report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        print(f'Sonuçlar kaydedildi: {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            previous = json.load(file)
+        regressions = compare(previous, result, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} ölçümde gerileme var', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,40 @@
+import heapq
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class ChannelStats:
+    """Bir kanalın seçilen dönemdeki mesaj istatistikleri"""
+    __slots__ = ('channel_id', 'message_count', 'active_users', 'peak_hours', 'top_users')
+
+    def __init__(self, channel_id: int, message_count: int = 0, active_users: int = 0,
+                 peak_hours: Optional[List[Tuple[str, int]]] = None,
+                 top_users: Optional[List[Tuple[int, int]]] = None):
+        self.channel_id = channel_id
+        self.message_count = message_count
+        self.active_users = active_users
+        # (saat 'HH', mesaj) - en yoğundan başlayarak
+        self.peak_hours = peak_hours or []
+        # (user_id, mesaj) - en aktiften başlayarak
+        self.top_users = top_users or []
+
+
+def build_channel_stats(rows: Iterable[tuple], channel_ids: Optional[Iterable[int]] = None,
+                        limit: int = 5, top_users: Optional[int] = None) -> Dict[int, ChannelStats]:
+    """(channel_id, user_id, saat, mesaj) satırlarından tüm kanal metriklerini tek geçişte hesapla"""
+    users: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    hours: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for channel_id, user_id, hour_of_day, count in rows:
+        users[channel_id][user_id] += count
+        hours[channel_id][hour_of_day] += count
+
+    result = {channel_id: ChannelStats(channel_id) for channel_id in channel_ids or ()}
+    for channel_id, per_user in users.items():
+        result[channel_id] = ChannelStats(
+            channel_id,
+            message_count=sum(per_user.values()),
+            active_users=len(per_user),
+            peak_hours=heapq.nlargest(limit, hours[channel_id].items(), key=lambda item: item[1]),
+            top_users=heapq.nlargest(top_users or limit, per_user.items(), key=lambda item: item[1]),
+        )
+    return result
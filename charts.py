@@ -0,0 +1,121 @@
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, List, Optional
+
+
+class ChartQueueFull(Exception):
+    """Bekleyen grafik sayısı sınırı aşıldı"""
+
+
+def render_activity_graph(dates: List[str], counts: List[int]) -> bytes:
+    """Aktivite grafiğini PNG olarak çiz (işçi süreçte çalışır)"""
+    # matplotlib yalnızca işçi süreçte ve ilk çizimde yüklenir
+    from matplotlib.figure import Figure
+
+    # pyplot'un global durumu yerine nesne tabanlı Figure API'si
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    ax.plot(dates, counts, marker='o')
+    ax.set_title('Sunucu Aktivite Grafiği')
+    ax.set_xlabel('Tarih')
+    ax.set_ylabel('Mesaj Sayısı')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def _warm_up() -> bool:
+    """İşçi süreçte matplotlib'i önceden yükle"""
+    from matplotlib.figure import Figure  # noqa: F401
+    return True
+
+
+class ChartRenderer:
+    """Grafikleri olay döngüsünü bloklamadan ayrı süreçlerde çizen havuz"""
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, cache_size: int = 64):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        # (guild_id, gün, veri sürümü) -> PNG
+        self._cache: 'OrderedDict[Hashable, bytes]' = OrderedDict()
+
+        self.rendered = 0
+        self.cache_hits = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            # Bot süreci thread'ler çalıştırdığı için fork yerine spawn kullan
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def warm_up(self):
+        """İşçi süreçleri başlatıp matplotlib'i yükle (ilk grafik beklemesin)"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._executor, _warm_up) for _ in range(self.workers)
+        ])
+
+    def cached(self, key: Hashable) -> Optional[bytes]:
+        """Aynı veri sürümü için daha önce çizilmiş PNG'yi getir"""
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+        return png
+
+    async def render(self, key: Hashable, dates: List[str], counts: List[int]) -> bytes:
+        """Grafiği çiz; aynı anda en fazla `workers` çizim yapılır, fazlası sırada bekler"""
+        png = self.cached(key)
+        if png is not None:
+            return png
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise ChartQueueFull()
+
+        self._ensure_started()
+        self._pending += 1
+        try:
+            async with self._slots:
+                # Sırada beklerken başka bir istek aynı grafiği çizmiş olabilir
+                png = self.cached(key)
+                if png is None:
+                    loop = asyncio.get_running_loop()
+                    png = await loop.run_in_executor(self._executor, render_activity_graph, dates, counts)
+                    self.rendered += 1
+                    self._cache[key] = png
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        finally:
+            self._pending -= 1
+        return png
+
+    def close(self):
+        """İşçi süreçleri kapat"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        """Çizim havuzu istatistiklerini getir"""
+        return {
+            'workers': self.workers,
+            'pending': self._pending,
+            'rendered': self.rendered,
+            'cache_hits': self.cache_hits,
+            'cached_charts': len(self._cache),
+            'rejected': self.rejected,
+        }
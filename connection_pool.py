@@ -0,0 +1,155 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+import migrations
+
+# Dayanıklılık/performans profilleri. cache_mb tüm havuz için toplam bütçedir ve
+# bağlantılar arasında eşit bölünür; mmap_mb her bağlantının en fazla eşleyebileceği boyuttur.
+PROFILES: Dict[str, Dict] = {
+    # WAL + synchronous=NORMAL: okuyucular yazmayı beklemez, commit başına fsync yapılmaz.
+    # Elektrik kesintisinde son işlemler kaybolabilir ama veritabanı bozulmaz.
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_mb': 64,
+        'mmap_mb': 256,
+        'temp_store': 'MEMORY',
+        'busy_timeout_ms': 5000,
+    },
+    # WAL + synchronous=FULL: her commit diske yazılır
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_mb': 16,
+        'mmap_mb': 0,
+        'temp_store': 'MEMORY',
+        'busy_timeout_ms': 10000,
+    },
+}
+
+
+class ConnectionPool:
+    """Tek yazıcı ve N okuyucu bağlantısından oluşan kalıcı aiosqlite havuzu"""
+
+    dialect = 'sqlite'
+
+    def __init__(self, db_name: str, readers: int = 4, profile: str = 'throughput',
+                 cache_mb: Optional[int] = None, mmap_mb: Optional[int] = None):
+        if profile not in PROFILES:
+            raise ValueError(f"Bilinmeyen veritabanı profili: {profile} ({', '.join(PROFILES)})")
+        self.db_name = db_name
+        self.profile = profile
+        self.settings = dict(PROFILES[profile])
+        if cache_mb is not None:
+            self.settings['cache_mb'] = cache_mb
+        if mmap_mb is not None:
+            self.settings['mmap_mb'] = mmap_mb
+        self.reader_count = max(1, readers)
+        self.journal_mode: Optional[str] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+
+        # Havuz istatistikleri
+        self._checkouts = {'writer': 0, 'reader': 0}
+        self._wait_total = {'writer': 0.0, 'reader': 0.0}
+        self._wait_max = {'writer': 0.0, 'reader': 0.0}
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self, readonly: bool = False) -> aiosqlite.Connection:
+        """Yeni bir bağlantı aç ve profil ayarlarını uygula"""
+        settings = self.settings
+        conn = await aiosqlite.connect(self.db_name, timeout=settings['busy_timeout_ms'] / 1000)
+        cache_kib = settings['cache_mb'] * 1024 // (self.reader_count + 1)
+        await conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+        await conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        # Negatif değer KiB cinsindendir
+        await conn.execute(f'PRAGMA cache_size = -{max(cache_kib, 256)}')
+        await conn.execute(f"PRAGMA mmap_size = {settings['mmap_mb'] * 1024 * 1024}")
+        await conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+        if readonly:
+            await conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    async def open(self):
+        """Yazıcı ve okuyucu bağlantılarını aç"""
+        if self.is_open:
+            return
+        self._writer_lock = asyncio.Lock()
+        self._writer = await self._connect()
+        # journal_mode dosyaya kalıcı olarak yazılır, yazıcıda bir kez ayarlamak yeterli
+        async with self._writer.execute(f"PRAGMA journal_mode = {self.settings['journal_mode']}") as cursor:
+            self.journal_mode = (await cursor.fetchone())[0]
+        self._idle = asyncio.Queue()
+        for _ in range(self.reader_count):
+            conn = await self._connect(readonly=True)
+            self._readers.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        """Tüm bağlantıları kapat"""
+        if not self.is_open:
+            return
+        async with self._writer_lock:
+            await self._writer.close()
+            self._writer = None
+        for conn in self._readers:
+            await conn.close()
+        self._readers.clear()
+        self._idle = None
+
+    async def migrate(self) -> List[int]:
+        """Şemayı oluştur veya en son sürüme yükselt"""
+        async with self.writer() as db:
+            return await migrations.migrate(db)
+
+    def _record(self, kind: str, waited: float):
+        self._checkouts[kind] += 1
+        self._wait_total[kind] += waited
+        if waited > self._wait_max[kind]:
+            self._wait_max[kind] = waited
+
+    @asynccontextmanager
+    async def writer(self, shard: Optional[int] = None):
+        """Yazıcı bağlantısını özel olarak ödünç al"""
+        # SQLite'ta tek yazıcı vardır; tüm shard kuyrukları aynı sırayı bekler
+        started = time.perf_counter()
+        async with self._writer_lock:
+            self._record('writer', time.perf_counter() - started)
+            yield self._writer
+
+    @asynccontextmanager
+    async def reader(self):
+        """Boştaki bir okuyucu bağlantısını ödünç al"""
+        started = time.perf_counter()
+        conn = await self._idle.get()
+        self._record('reader', time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    def stats(self) -> Dict:
+        """Havuz kullanım istatistiklerini getir"""
+        stats = {
+            'profile': self.profile,
+            'journal_mode': self.journal_mode,
+            'readers': self.reader_count,
+            'idle_readers': self._idle.qsize() if self._idle else 0,
+            'writer_busy': self._writer_lock.locked() if self._writer_lock else False,
+        }
+        for kind in ('writer', 'reader'):
+            checkouts = self._checkouts[kind]
+            stats[f'{kind}_checkouts'] = checkouts
+            stats[f'{kind}_wait_total_ms'] = round(self._wait_total[kind] * 1000, 3)
+            stats[f'{kind}_wait_avg_ms'] = round(self._wait_total[kind] * 1000 / checkouts, 3) if checkouts else 0.0
+            stats[f'{kind}_wait_max_ms'] = round(self._wait_max[kind] * 1000, 3)
+        return stats
@@ -1,312 +1,326 @@
-import aiosqlite
 import datetime
-from typing import Optional, List, Dict
-import matplotlib.pyplot as plt
+from typing import Optional, List, Dict, Tuple
 import io
+from storage import create_pool
+from ingest import ShardedIngest
+from xp_engine import XPEngine
+from rollups import hour_bucket
+from periods import PeriodEngine, weekly_period_bounds
+from result_cache import ResultCache, cached
+from charts import ChartRenderer
+from channel_stats import ChannelStats, build_channel_stats
+from startup import StartupTimer
+from voice_sessions import VoiceSessionTracker
+from shards import MAX_SHARD_WRITERS
+from partitions import PartitionRouter
+from resets import ResetCompactor
+from names import NameResolver
+from sketches import ActiveUserSketches
+from leaderboards import LeaderboardTracker
 
 class Database:
-    def __init__(self, db_name: str = "discord_stats.db"):
+    def __init__(self, db_name: str = "discord_stats.db", readers: int = 4,
+                 batch_size: int = 500, flush_interval: float = 0.25,
+                 xp_checkpoint_interval: float = 5.0, profile: str = 'throughput',
+                 cache_mb: Optional[int] = None, mmap_mb: Optional[int] = None,
+                 cache_ttl: float = 30.0, cache_size: int = 2048, chart_workers: int = 2,
+                 voice_heartbeat_interval: float = 60.0, default_timezone: Optional[str] = None,
+                 backend: str = 'sqlite', dsn: Optional[str] = None,
+                 shard_count: Optional[int] = None, shard_ids: Optional[List[int]] = None,
+                 retention_days: Optional[int] = None, archive_partitions: bool = False,
+                 name_cache_size: int = 50000, leaderboard_capacity: int = 1000):
         self.db_name = db_name
-
-    async def setup(self):
-        """Veritabanı tablolarını oluştur"""
-        async with aiosqlite.connect(self.db_name) as db:
-            # Mesaj tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    channel_id INTEGER,
-                    guild_id INTEGER,
-                    timestamp DATETIME,
-                    content_length INTEGER
-                )
-            ''')
-
-            # Sesli kanal tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS voice_activity (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    channel_id INTEGER,
-                    guild_id INTEGER,
-                    join_time DATETIME,
-                    leave_time DATETIME
-                )
-            ''')
-
-            # Emoji tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS emoji_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    guild_id INTEGER,
-                    emoji_id TEXT,
-                    emoji_name TEXT,
-                    timestamp DATETIME
-                )
-            ''')
-
-            # Rol tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS role_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    guild_id INTEGER,
-                    role_id INTEGER,
-                    action TEXT,
-                    timestamp DATETIME
-                )
-            ''')
-
-            # Seviye tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS user_levels (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    guild_id INTEGER,
-                    xp INTEGER DEFAULT 0,
-                    level INTEGER DEFAULT 0,
-                    last_message_time DATETIME
-                )
-            ''')
-
-            # Haftalık periyot tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS weekly_periods (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    start_time DATETIME,
-                    end_time DATETIME,
-                    is_current BOOLEAN DEFAULT 0
-                )
-            ''')
-
-            # Kalıcı istatistik tablosu
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS permanent_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    guild_id INTEGER,
-                    total_messages INTEGER DEFAULT 0,
-                    total_voice_minutes INTEGER DEFAULT 0,
-                    last_updated DATETIME,
-                    UNIQUE(user_id, guild_id)
-                )
-            ''')
-
-            await db.commit()
+        self.backend = backend
+        self.pool = create_pool(backend, db_name, dsn=dsn, readers=readers, profile=profile,
+                                cache_mb=cache_mb, mmap_mb=mmap_mb)
+        self.cache = ResultCache(ttl=cache_ttl, max_entries=cache_size)
+        self.partitions = PartitionRouter(self.pool, retention_days=retention_days, archive=archive_partitions)
+        self.periods = PeriodEngine(self.pool, default_timezone=default_timezone)
+        self.sketches = ActiveUserSketches(self.pool)
+        self.resets = ResetCompactor(self.pool, self.partitions, sketches=self.sketches)
+        self.leaderboards = LeaderboardTracker(self.pool, self.periods, self.resets, capacity=leaderboard_capacity)
+        self.ingest = ShardedIngest(self.pool, max_rows=batch_size, max_delay=flush_interval, cache=self.cache,
+                                    partitions=self.partitions, leaderboards=self.leaderboards,
+                                    sketches=self.sketches)
+        self.leaderboards.ingest = self.ingest
+        self.xp = XPEngine(self.pool, checkpoint_interval=xp_checkpoint_interval, cache=self.cache)
+        self.names = NameResolver(self.pool, max_entries=name_cache_size)
+        self.charts = ChartRenderer(workers=chart_workers)
+        self.voice = VoiceSessionTracker(self.pool, self.ingest, self.cache,
+                                         heartbeat_interval=voice_heartbeat_interval)
+        self.shard_count: Optional[int] = None
+        self.shard_ids: Optional[List[int]] = None
+        self.configure_shards(shard_count, shard_ids)
+
+    def configure_shards(self, shard_count: Optional[int], shard_ids: Optional[List[int]] = None):
+        """Bu sürecin shard'larını ayarla (setup'tan önce çağrılmalı)"""
+        if self.pool.is_open:
+            raise RuntimeError('Shard ayarları bağlantı havuzu açıldıktan sonra değiştirilemez')
+        self.shard_count = shard_count or None
+        self.shard_ids = list(shard_ids) if shard_ids is not None and self.shard_count else None
+        # Her sunucu tek bir shard'a, her shard tek bir sürece aittir; böylece bir sunucunun
+        # olayları, XP'si ve ses oturumları hep aynı kuyruk ve yazıcı hattından geçer
+        self.ingest.configure(self.shard_count)
+        self.voice.configure(self.shard_count, self.shard_ids)
+        self.resets.configure(self.shard_count, self.shard_ids)
+        self.sketches.configure(self.shard_count, self.shard_ids)
+        if self.backend == 'postgres':
+            owned = len(self.shard_ids) if self.shard_ids is not None else (self.shard_count or 0)
+            self.pool.shard_writers = min(owned, MAX_SHARD_WRITERS)
+
+    def owns_shard(self, shard_id: int) -> bool:
+        """Bu süreç verilen shard'ı çalıştırıyor mu"""
+        if not self.shard_count:
+            return shard_id == 0
+        return self.shard_ids is None or shard_id in self.shard_ids
+    async def setup(self, timer: Optional[StartupTimer] = None):
+        """Bağlantı havuzunu aç ve veritabanı şemasını hazırla"""
+        if self.pool.is_open:
+            return
+        timer = timer or StartupTimer()
+        with timer.phase('db_open'):
+            await self.pool.open()
+        with timer.phase('migrations'):
+            # Şemayı oluştur veya mevcut veritabanını en son sürüme yükselt
+            await self.pool.migrate()
+        with timer.phase('partitions'):
+            # Ham olay bölümlerinin kaydını yükle, bu ayın ve gelecek ayın bölümlerini hazırla
+            await self.partitions.load()
+            await self.partitions.prepare()
+            # Yarım kalan sıfırlamaların işaretleri sorgularda hemen geçerli olsun
+            await self.resets.load()
+        with timer.phase('voice_recovery'):
+            # Önceki çalışmadan açık kalan ses oturumlarını son kalp atışında kapat
+            await self.voice.recover()
+
+        self.ingest.start()
+        self.xp.start()
+        self.voice.start()
+        self.resets.start()
+        self.names.start()
+        self.sketches.start()
+
+    async def close(self):
+        """Bekleyen olayları ve XP durumunu yaz, bağlantı havuzunu kapat"""
+        await self.ingest.close()
+        await self.xp.close()
+        await self.voice.close()
+        await self.resets.close()
+        await self.names.close()
+        await self.sketches.close()
+        await self.pool.close()
+        self.charts.close()
+
+    def pool_stats(self) -> Dict:
+        """Bağlantı havuzu istatistiklerini getir"""
+        return self.pool.stats()
+
+    def partition_stats(self) -> Dict:
+        """Ham olay bölümleme istatistiklerini getir"""
+        return self.partitions.stats()
+
+    def cache_stats(self) -> Dict:
+        """Sonuç önbelleği istatistiklerini getir"""
+        return self.cache.stats()
+
+    def component_stats(self) -> Dict[str, Dict]:
+        """Tüm bileşenlerin anlık istatistiklerini (kuyruk derinlikleri, önbellek, havuz) getir"""
+        return {
+            'pool': self.pool.stats(),
+            'cache': self.cache.stats(),
+            'ingest': self.ingest.stats(),
+            'xp': self.xp.stats(),
+            'voice': self.voice.stats(),
+            'charts': self.charts.stats(),
+            'partitions': self.partitions.stats(),
+            'resets': self.resets.stats(),
+            'names': self.names.stats(),
+            'sketches': self.sketches.stats(),
+            'leaderboards': self.leaderboards.stats(),
+        }
 
     async def log_message(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime):
-        """Mesaj kayıtlarını tut"""
-        async with aiosqlite.connect(self.db_name) as db:
-            await db.execute('''
-                INSERT INTO messages (user_id, channel_id, guild_id, timestamp)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, channel_id, guild_id, timestamp))
-            await db.commit()
+        """Mesaj kayıtlarını tut (toplu yazılmak üzere kuyruğa alınır)"""
+        self.ingest.add_message(user_id, channel_id, guild_id, timestamp)
+        await self.ingest.throttle(guild_id)
+
+    async def record_message(self, user_id: int, channel_id: int, guild_id: int, display_name: str,
+                             timestamp: datetime.datetime) -> Tuple[bool, int]:
+        """Bir mesajın tüm veritabanı işleri (olay işleyici ve benchmark aynı yolu kullanır)"""
+        # Sıralamalarda üye önbelleğine gerek kalmadan ad gösterebilmek için
+        self.names.remember(guild_id, user_id, display_name)
+        await self.log_message(user_id=user_id, channel_id=channel_id, guild_id=guild_id, timestamp=timestamp)
+        await self.update_permanent_stats(user_id=user_id, guild_id=guild_id, messages=1)
+        # Seviye atlandıysa (True, yeni_seviye)
+        return await self.update_user_xp(user_id=user_id, guild_id=guild_id)
+
+    async def record_voice_update(self, user_id: int, guild_id: int, before: Optional[int], after: Optional[int],
+                                  timestamp: datetime.datetime):
+        """Ses kanalı değişikliğini (önceki ve yeni kanal numarası) işle"""
+        if before == after:
+            return
+        if before and after:
+            # Kanal değiştirme: eski oturum kapanır, yenisi açılır
+            await self.log_voice_move(user_id=user_id, channel_id=after, guild_id=guild_id, timestamp=timestamp)
+        elif after:
+            await self.log_voice_join(user_id=user_id, channel_id=after, guild_id=guild_id, timestamp=timestamp)
+        elif before:
+            # Kapanan oturumun süresi kalıcı istatistiklere de işlenir
+            await self.log_voice_leave(user_id=user_id, channel_id=before, guild_id=guild_id, timestamp=timestamp)
 
     async def log_voice_join(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime):
         """Sesli kanala katılma kaydı"""
-        async with aiosqlite.connect(self.db_name) as db:
-            await db.execute('''
-                INSERT INTO voice_activity (user_id, channel_id, guild_id, join_time)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, channel_id, guild_id, timestamp))
-            await db.commit()
+        await self.voice.join(guild_id, user_id, channel_id, timestamp)
 
-    async def log_voice_leave(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime):
-        """Sesli kanaldan ayrılma kaydı"""
-        async with aiosqlite.connect(self.db_name) as db:
-            # En son giriş kaydını bul ve çıkış zamanını güncelle
-            await db.execute('''
-                UPDATE voice_activity
-                SET leave_time = ?
-                WHERE user_id = ? AND channel_id = ? AND guild_id = ? AND leave_time IS NULL
-            ''', (timestamp, user_id, channel_id, guild_id))
-            await db.commit()
+    async def log_voice_leave(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime) -> int:
+        """Sesli kanaldan ayrılma kaydı; kapanan oturumun dakikasını döndür"""
+        # Kapanan oturumun süresi saatlik özete ve kalıcı istatistiklere bir kez işlenir
+        return await self.voice.leave(guild_id, user_id, timestamp)
+
+    async def reconcile_voice(self, guild_id: int, members: Dict[int, int], timestamp: datetime.datetime):
+        """Sunucudaki anlık ses durumuna (user_id -> channel_id) göre açık oturumları eşitle"""
+        await self.voice.reconcile(guild_id, members, timestamp)
+
+    async def log_voice_move(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime) -> int:
+        """Sesli kanal değiştirme kaydı; eski kanaldaki oturumun dakikasını döndür"""
+        return await self.voice.move(guild_id, user_id, channel_id, timestamp)
 
     async def get_message_count(self, guild_id: int, period: str = 'günlük') -> int:
         """Belirli bir periyottaki mesaj sayısını getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            now = datetime.datetime.now()
-            if period == 'günlük':
-                start_time = now - datetime.timedelta(days=1)
-            elif period == 'haftalık':
-                start_time = now - datetime.timedelta(weeks=1)
-            elif period == 'aylık':
-                start_time = now - datetime.timedelta(days=30)
-            else:
-                start_time = datetime.datetime.min
-
-            async with db.execute('''
-                SELECT COUNT(*) FROM messages
-                WHERE guild_id = ? AND timestamp > ?
-            ''', (guild_id, start_time)) as cursor:
+        window = await self.periods.window(guild_id, period)
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT SUM(message_count) FROM message_rollup_hourly
+                WHERE guild_id = ? AND hour >= ? AND hour < ?
+                {self.resets.visible(guild_id, 'message_rollup_hourly')}
+            ''', (guild_id, *window.hours)) as cursor:
                 count = await cursor.fetchone()
-                return count[0] if count else 0
-
-    async def get_active_users_count(self, guild_id: int, period: str = 'günlük') -> int:
-        """Aktif kullanıcı sayısını getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            now = datetime.datetime.now()
-            if period == 'günlük':
-                start_time = now - datetime.timedelta(days=1)
-            elif period == 'haftalık':
-                start_time = now - datetime.timedelta(weeks=1)
-            elif period == 'aylık':
-                start_time = now - datetime.timedelta(days=30)
-            else:
-                start_time = datetime.datetime.min
-
-            async with db.execute('''
-                SELECT COUNT(DISTINCT user_id) FROM messages
-                WHERE guild_id = ? AND timestamp > ?
-            ''', (guild_id, start_time)) as cursor:
+                return count[0] if count and count[0] else 0
+
+    async def get_active_users_count(self, guild_id: int, period: str = 'günlük',
+                                     channel_id: Optional[int] = None, exact: bool = False) -> int:
+        """Aktif kullanıcı sayısını getir (varsayılan: HyperLogLog taslaklarından ~%1.6 hatayla)"""
+        window = await self.periods.window(guild_id, period)
+        # Taslaklar hazır değilse ya da bekleyen sıfırlama varsa tam sayım yapılır
+        if not exact and self.sketches.ready(guild_id) and not self.resets.pending(guild_id):
+            return await self.sketches.estimate(guild_id, *window.hours, channel_id=channel_id or 0)
+
+        channel_filter = ' AND channel_id = ?' if channel_id is not None else ''
+        channel_params = (channel_id,) if channel_id is not None else ()
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT COUNT(DISTINCT user_id) FROM message_rollup_hourly
+                WHERE guild_id = ? AND hour >= ? AND hour < ?{channel_filter}
+                {self.resets.visible(guild_id, 'message_rollup_hourly')}
+            ''', (guild_id, *window.hours, *channel_params)) as cursor:
                 count = await cursor.fetchone()
                 return count[0] if count else 0
 
     async def get_user_message_count(self, user_id: int, guild_id: int) -> int:
         """Kullanıcının toplam mesaj sayısını getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            async with db.execute('''
-                SELECT COUNT(*) FROM messages
-                WHERE user_id = ? AND guild_id = ?
-            ''', (user_id, guild_id)) as cursor:
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT SUM(message_count) FROM message_rollup_hourly
+                WHERE guild_id = ? AND user_id = ?
+                {self.resets.visible(guild_id, 'message_rollup_hourly')}
+            ''', (guild_id, user_id)) as cursor:
                 count = await cursor.fetchone()
-                return count[0] if count else 0
+                return count[0] if count and count[0] else 0
 
     async def get_user_voice_time(self, user_id: int, guild_id: int) -> int:
         """Kullanıcının toplam sesli kanal süresini dakika cinsinden getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            async with db.execute('''
-                SELECT SUM(
-                    CAST(
-                        (JULIANDAY(COALESCE(leave_time, CURRENT_TIMESTAMP)) - 
-                         JULIANDAY(join_time)) * 24 * 60 AS INTEGER)
-                    )
-                FROM voice_activity
-                WHERE user_id = ? AND guild_id = ?
-            ''', (user_id, guild_id)) as cursor:
-                minutes = await cursor.fetchone()
-                return minutes[0] if minutes and minutes[0] else 0 
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT COALESCE(SUM(voice_seconds), 0)
+                FROM voice_rollup_hourly
+                WHERE guild_id = ? AND user_id = ?
+                {self.resets.visible(guild_id, 'voice_rollup_hourly')}
+            ''', (guild_id, user_id)) as cursor:
+                (seconds,) = await cursor.fetchone()
+
+        # Açık oturumun şu ana kadarki süresi bellekten eklenir
+        session = self.voice.get(guild_id, user_id)
+        if session is not None:
+            seconds += max(0.0, (datetime.datetime.now() - session.join_time).total_seconds())
+        return int(seconds // 60)
 
     async def log_emoji_usage(self, user_id: int, guild_id: int, emoji_id: str, emoji_name: str):
-        """Emoji kullanımını kaydet"""
-        async with aiosqlite.connect(self.db_name) as db:
-            await db.execute('''
-                INSERT INTO emoji_usage (user_id, guild_id, emoji_id, emoji_name, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, guild_id, emoji_id, emoji_name, datetime.datetime.now()))
-            await db.commit()
+        """Emoji kullanımını kaydet (toplu yazılmak üzere kuyruğa alınır)"""
+        self.ingest.add_emoji(user_id, guild_id, emoji_id, emoji_name, datetime.datetime.now())
+        await self.ingest.throttle(guild_id)
 
     async def log_role_change(self, user_id: int, guild_id: int, role_id: int, action: str):
-        """Rol değişikliklerini kaydet"""
-        async with aiosqlite.connect(self.db_name) as db:
-            await db.execute('''
-                INSERT INTO role_history (user_id, guild_id, role_id, action, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, guild_id, role_id, action, datetime.datetime.now()))
-            await db.commit()
+        """Rol değişikliklerini kaydet (toplu yazılmak üzere kuyruğa alınır)"""
+        self.ingest.add_role_change(user_id, guild_id, role_id, action, datetime.datetime.now())
+        await self.ingest.throttle(guild_id)
 
     async def update_user_xp(self, user_id: int, guild_id: int, xp_amount: float = None):
-        """Kullanıcı XP'sini güncelle ve seviye kontrolü yap"""
-        async with aiosqlite.connect(self.db_name) as db:
-            # XP miktarı belirtilmemişse, sunucunun XP oranını kullan
-            if xp_amount is None:
-                xp_amount = await self.get_xp_rate(guild_id)
-
-            # Kullanıcıyı kontrol et veya oluştur
-            await db.execute('''
-                INSERT OR IGNORE INTO user_levels (user_id, guild_id, xp, level)
-                VALUES (?, ?, 0, 0)
-            ''', (user_id, guild_id))
-
-            # XP'yi güncelle
-            await db.execute('''
-                UPDATE user_levels
-                SET xp = ROUND(xp + ?, 2),
-                    last_message_time = ?
-                WHERE user_id = ? AND guild_id = ?
-            ''', (xp_amount, datetime.datetime.now(), user_id, guild_id))
-
-            # Seviye kontrolü
-            async with db.execute('''
-                SELECT xp, level FROM user_levels
-                WHERE user_id = ? AND guild_id = ?
-            ''', (user_id, guild_id)) as cursor:
-                data = await cursor.fetchone()
-                if data:
-                    current_xp, current_level = data
-                    new_level = int(current_xp / 100)  # Her 100 XP'de bir seviye
-                    if new_level > current_level:
-                        await db.execute('''
-                            UPDATE user_levels
-                            SET level = ?
-                            WHERE user_id = ? AND guild_id = ?
-                        ''', (new_level, user_id, guild_id))
-                        await db.commit()
-                        return True, new_level
-            await db.commit()
-            return False, 0
+        """Kullanıcı XP'sini güncelle ve seviye kontrolü yap (bellekte hesaplanır)"""
+        return await self.xp.add_xp(guild_id, user_id, xp_amount)
 
     async def get_user_level(self, user_id: int, guild_id: int) -> tuple:
         """Kullanıcının seviye bilgilerini getir"""
-        async with aiosqlite.connect(self.db_name) as db:
+        cached = self.xp.peek(guild_id, user_id)
+        if cached is not None:
+            return cached
+        async with self.pool.reader() as db:
             async with db.execute('''
                 SELECT xp, level FROM user_levels
                 WHERE user_id = ? AND guild_id = ?
             ''', (user_id, guild_id)) as cursor:
                 data = await cursor.fetchone()
-                return data if data else (0, 0)
+        # SQLite tam sayı XP'yi INTEGER saklar; bellekteki değerle aynı biçimde (10.0) gösterilsin
+        return (float(data[0]), data[1]) if data else (0.0, 0)
 
+    @cached('xp')
     async def get_top_users(self, guild_id: int, limit: int = 10) -> List[tuple]:
         """En yüksek seviyeli kullanıcıları getir"""
-        async with aiosqlite.connect(self.db_name) as db:
+        # Bellekteki XP değişiklikleri en geç bir kayıt aralığı sonra yansır;
+        # her kayıt önbellekteki sonucu geçersiz kılar
+        async with self.pool.reader() as db:
             async with db.execute('''
                 SELECT user_id, xp, level FROM user_levels
                 WHERE guild_id = ?
                 ORDER BY level DESC, xp DESC
                 LIMIT ?
             ''', (guild_id, limit)) as cursor:
-                return await cursor.fetchall()
+                rows = await cursor.fetchall()
+        return [(user_id, float(xp), level) for user_id, xp, level in rows]
 
     async def generate_activity_graph(self, guild_id: int, days: int = 7) -> io.BytesIO:
-        """Sunucu aktivite grafiği oluştur"""
-        async with aiosqlite.connect(self.db_name) as db:
-            start_date = datetime.datetime.now() - datetime.timedelta(days=days)
-            async with db.execute('''
-                SELECT DATE(timestamp) as date, COUNT(*) as count
-                FROM messages
-                WHERE guild_id = ? AND timestamp > ?
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            ''', (guild_id, start_date)) as cursor:
-                data = await cursor.fetchall()
-                
-                dates = [row[0] for row in data]
-                counts = [row[1] for row in data]
-
-                plt.figure(figsize=(10, 6))
-                plt.plot(dates, counts, marker='o')
-                plt.title('Sunucu Aktivite Grafiği')
-                plt.xlabel('Tarih')
-                plt.ylabel('Mesaj Sayısı')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png')
-                buf.seek(0)
-                plt.close()
-                
-                return buf
-
+        """Sunucu aktivite grafiği oluştur (çizim ayrı süreçte yapılır)"""
+        start_date = datetime.datetime.now() - datetime.timedelta(days=days)
+        # Veri değişmediyse daha önce çizilen grafiği sorgu yapmadan kullan
+        key = (guild_id, days, start_date.date(), self.cache.generation(guild_id, 'messages'))
+        png = self.charts.cached(key)
+        if png is None:
+            async with self.pool.reader() as db:
+                async with db.execute(f'''
+                    SELECT substr(hour, 1, 10) as date, SUM(message_count) as count
+                    FROM message_rollup_hourly
+                    WHERE guild_id = ? AND hour >= ?
+                    {self.resets.visible(guild_id, 'message_rollup_hourly')}
+                    GROUP BY date
+                    ORDER BY date
+                ''', (guild_id, hour_bucket(start_date))) as cursor:
+                    data = await cursor.fetchall()
+
+            dates = [row[0] for row in data]
+            counts = [row[1] for row in data]
+            png = await self.charts.render(key, dates, counts)
+
+        return io.BytesIO(png)
+
+    @cached('emoji')
     async def get_emoji_stats(self, guild_id: int) -> Dict:
         """Emoji kullanım istatistiklerini getir"""
-        async with aiosqlite.connect(self.db_name) as db:
+        ranked = await self.leaderboards.emoji_stats(guild_id, 10)
+        if ranked is not None:
+            return dict(ranked)
+        async with self.pool.reader() as db:
             async with db.execute('''
-                SELECT emoji_name, COUNT(*) as count
-                FROM emoji_usage
+                SELECT emoji_name, SUM(usage_count) as count
+                FROM emoji_rollup
                 WHERE guild_id = ?
                 GROUP BY emoji_name
                 ORDER BY count DESC
@@ -314,129 +328,103 @@ class Database:
             ''', (guild_id,)) as cursor:
                 return {row[0]: row[1] for row in await cursor.fetchall()} 
 
-    async def get_channel_stats(self, channel_id: int, guild_id: int, period: str = 'günlük') -> Dict:
+    @cached('messages')
+    async def get_channels_stats(self, guild_id: int, channel_ids: Optional[Tuple[int, ...]] = None,
+                                 period: str = 'günlük', top_users: int = 5) -> Dict[int, ChannelStats]:
+        """Birden çok kanalın istatistiklerini tek sorguda getir (channel_ids yoksa tüm kanallar)"""
+        window = await self.periods.window(guild_id, period)
+
+        # Toplam, aktif kullanıcı, yoğun saat ve en aktif kullanıcılar aynı satırlardan çıkar
+        query = f'''
+            SELECT channel_id, user_id, substr(hour, 12, 2) as hour_of_day, SUM(message_count)
+            FROM message_rollup_hourly
+            WHERE guild_id = ? AND hour >= ? AND hour < ?
+            {self.resets.visible(guild_id, 'message_rollup_hourly')}
+        '''
+        params = [guild_id, *window.hours]
+        if channel_ids is not None:
+            query += f' AND channel_id IN ({",".join("?" * len(channel_ids))})'
+            params.extend(channel_ids)
+        query += ' GROUP BY channel_id, user_id, hour_of_day'
+
+        async with self.pool.reader() as db:
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+        return build_channel_stats(rows, channel_ids, top_users=top_users)
+
+    async def get_channel_stats(self, channel_id: int, guild_id: int, period: str = 'günlük',
+                                top_users: int = 5) -> ChannelStats:
         """Kanal istatistiklerini detaylı olarak getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            now = datetime.datetime.now()
-            if period == 'günlük':
-                start_time = now - datetime.timedelta(days=1)
-            elif period == 'haftalık':
-                start_time = now - datetime.timedelta(weeks=1)
-            elif period == 'aylık':
-                start_time = now - datetime.timedelta(days=30)
-            else:
-                start_time = datetime.datetime.min
-
-            stats = {}
-            
-            # Mesaj sayısı
-            async with db.execute('''
-                SELECT COUNT(*) FROM messages
-                WHERE channel_id = ? AND guild_id = ? AND timestamp > ?
-            ''', (channel_id, guild_id, start_time)) as cursor:
-                stats['message_count'] = (await cursor.fetchone())[0]
-
-            # Aktif kullanıcılar
-            async with db.execute('''
-                SELECT COUNT(DISTINCT user_id) FROM messages
-                WHERE channel_id = ? AND guild_id = ? AND timestamp > ?
-            ''', (channel_id, guild_id, start_time)) as cursor:
-                stats['active_users'] = (await cursor.fetchone())[0]
-
-            # En aktif saatler
-            async with db.execute('''
-                SELECT strftime('%H', timestamp) as hour, COUNT(*) as count
-                FROM messages
-                WHERE channel_id = ? AND guild_id = ? AND timestamp > ?
-                GROUP BY hour
-                ORDER BY count DESC
-                LIMIT 5
-            ''', (channel_id, guild_id, start_time)) as cursor:
-                stats['peak_hours'] = await cursor.fetchall()
-
-            # En aktif kullanıcılar
-            async with db.execute('''
-                SELECT user_id, COUNT(*) as count
-                FROM messages
-                WHERE channel_id = ? AND guild_id = ? AND timestamp > ?
-                GROUP BY user_id
-                ORDER BY count DESC
-                LIMIT 5
-            ''', (channel_id, guild_id, start_time)) as cursor:
-                stats['top_users'] = await cursor.fetchall()
+        stats = await self.get_channels_stats(guild_id, (channel_id,), period, top_users)
+        return stats[channel_id]
 
-            return stats
-
-    async def get_voice_leaderboard(self, guild_id: int, period: str = 'günlük') -> List[tuple]:
+    @cached('voice')
+    async def get_voice_leaderboard(self, guild_id: int, period: str = 'günlük', limit: int = 10) -> List[tuple]:
         """Sesli kanal sıralamasını getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            now = datetime.datetime.now()
-            
-            if period == 'haftalık':
-                # Mevcut haftalık periyodu al
-                period_data = await self.get_current_weekly_period()
-                if period_data:
-                    start_time = period_data[0]
-                else:
-                    # Periyot yoksa varsayılan olarak son 7 gün
-                    start_time = now - datetime.timedelta(weeks=1)
-            elif period == 'günlük':
-                start_time = now - datetime.timedelta(days=1)
-            elif period == 'aylık':
-                start_time = now - datetime.timedelta(days=30)
-            else:
-                start_time = datetime.datetime.min
-
-            async with db.execute('''
-                SELECT 
-                    user_id,
-                    SUM(
-                        CAST(
-                            (JULIANDAY(COALESCE(leave_time, CURRENT_TIMESTAMP)) - 
-                             JULIANDAY(join_time)) * 24 * 60 AS INTEGER
-                        )
-                    ) as total_minutes
-                FROM voice_activity
-                WHERE guild_id = ? AND join_time > ?
+        # Haftalık sıralama mevcut haftalık periyoda göre (periyot yoksa son 7 gün)
+        window = await self.periods.window(guild_id, period, weekly=True)
+        now = datetime.datetime.now()
+
+        # Açık oturumlar tabloya dokunmadan bellekten hesaplanır
+        live = self.voice.open_seconds(guild_id, window.start, min(now, window.end or now))
+        async with self.pool.reader() as db:
+            # Kapanmış oturumlar saatlik özetten; açık oturumu olanlar ilk sıralara girebileceği
+            # için onların özet toplamları da ayrıca alınır
+            async with db.execute(f'''
+                SELECT user_id, SUM(voice_seconds) as seconds
+                FROM voice_rollup_hourly
+                WHERE guild_id = ? AND hour >= ? AND hour < ?
+                {self.resets.visible(guild_id, 'voice_rollup_hourly')}
                 GROUP BY user_id
-                ORDER BY total_minutes DESC
-                LIMIT 10
-            ''', (guild_id, start_time)) as cursor:
-                return await cursor.fetchall()
-
-    async def get_message_leaderboard(self, guild_id: int, period: str = 'günlük') -> List[tuple]:
+                ORDER BY seconds DESC
+                LIMIT ?
+            ''', (guild_id, *window.hours, limit)) as cursor:
+                totals = dict(await cursor.fetchall())
+
+            missing = [user_id for user_id in live if user_id not in totals]
+            if missing:
+                async with db.execute(f'''
+                    SELECT user_id, SUM(voice_seconds)
+                    FROM voice_rollup_hourly
+                    WHERE guild_id = ? AND hour >= ? AND hour < ? AND user_id IN ({','.join('?' * len(missing))})
+                    {self.resets.visible(guild_id, 'voice_rollup_hourly')}
+                    GROUP BY user_id
+                ''', (guild_id, *window.hours, *missing)) as cursor:
+                    totals.update(await cursor.fetchall())
+
+        for user_id, seconds in live.items():
+            totals[user_id] = totals.get(user_id, 0) + seconds
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(user_id, int(seconds // 60)) for user_id, seconds in ranked]
+
+    @cached('messages')
+    async def get_message_leaderboard(self, guild_id: int, period: str = 'günlük', limit: int = 10) -> List[tuple]:
         """Mesaj sıralamasını getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            now = datetime.datetime.now()
-            if period == 'günlük':
-                start_time = now - datetime.timedelta(days=1)
-            elif period == 'haftalık':
-                start_time = now - datetime.timedelta(weeks=1)
-            elif period == 'aylık':
-                start_time = now - datetime.timedelta(days=30)
-            else:
-                start_time = datetime.datetime.min
-
-            async with db.execute('''
-                SELECT user_id, COUNT(*) as message_count
-                FROM messages
-                WHERE guild_id = ? AND timestamp > ?
+        # İzlenen periyotlar bellekteki sıralamadan, diğerleri (ör. özel aralıklar) özetlerden
+        ranked = await self.leaderboards.message_leaderboard(guild_id, period, limit)
+        if ranked is not None:
+            return ranked
+        window = await self.periods.window(guild_id, period)
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT user_id, SUM(message_count) as message_count
+                FROM message_rollup_hourly
+                WHERE guild_id = ? AND hour >= ? AND hour < ?
+                {self.resets.visible(guild_id, 'message_rollup_hourly')}
                 GROUP BY user_id
                 ORDER BY message_count DESC
-                LIMIT 10
-            ''', (guild_id, start_time)) as cursor:
+                LIMIT ?
+            ''', (guild_id, *window.hours, limit)) as cursor:
                 return await cursor.fetchall() 
 
     async def update_weekly_period(self):
         """Haftalık periyodu güncelle"""
-        async with aiosqlite.connect(self.db_name) as db:
-            now = datetime.datetime.now()
-            # Pazar günü 23:30'u bul
-            days_until_sunday = (6 - now.weekday()) % 7
-            next_sunday = now + datetime.timedelta(days=days_until_sunday)
-            period_end = next_sunday.replace(hour=23, minute=30, second=0, microsecond=0)
-            period_start = period_end - datetime.timedelta(days=7)
+        # Pazar 23:30'da biten haftayı bul; değişmediyse yeni kayıt açma
+        period_start, period_end = weekly_period_bounds(datetime.datetime.now())
+        if await self.periods.weekly_period() == (period_start, period_end):
+            return
 
+        async with self.pool.writer() as db:
             # Mevcut periyodu kontrol et
             async with db.execute('SELECT id FROM weekly_periods WHERE is_current = 1') as cursor:
                 current_period = await cursor.fetchone()
@@ -451,48 +439,55 @@ class Database:
             ''', (period_start, period_end))
             
             await db.commit()
+        self.periods.set_weekly_period(period_start, period_end)
+        # Haftalık sıralamanın başlangıcı değişti
+        self.cache.clear()
 
     async def get_current_weekly_period(self) -> tuple:
         """Mevcut haftalık periyodu getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            async with db.execute('''
-                SELECT start_time, end_time FROM weekly_periods
-                WHERE is_current = 1
-            ''') as cursor:
-                return await cursor.fetchone()
+        return await self.periods.weekly_period()
+
+    async def get_timezone(self, guild_id: int) -> Optional[str]:
+        """Sunucunun saat dilimini getir (None: botun yerel saati)"""
+        return await self.periods.timezone(guild_id)
+
+    async def set_timezone(self, guild_id: int, timezone: Optional[str]):
+        """Sunucunun takvim periyotlarında kullanılacak saat dilimini ayarla"""
+        await self.periods.set_timezone(guild_id, timezone)
+        self.cache.invalidate_guild(guild_id)
+
+    async def get_retention(self, guild_id: int) -> Optional[int]:
+        """Sunucunun ham olay saklama süresini gün olarak getir (None: varsayılan)"""
+        async with self.pool.reader() as db:
+            async with db.execute('SELECT retention_days FROM guild_settings WHERE guild_id = ?',
+                                  (guild_id,)) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set_retention(self, guild_id: int, days: Optional[int]):
+        """Sunucunun ham olay saklama süresini ayarla (None: varsayılana dön)"""
+        async with self.pool.writer() as db:
+            await db.execute('''
+                INSERT INTO guild_settings (guild_id, retention_days) VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET retention_days = excluded.retention_days
+            ''', (guild_id, days))
+            await db.commit()
 
-    async def update_permanent_stats(self, user_id: int, guild_id: int, messages: int = 0, voice_minutes: int = 0):
-        """Kalıcı istatistikleri güncelle"""
-        async with aiosqlite.connect(self.db_name) as db:
-            # Önce kullanıcı var mı kontrol et
-            async with db.execute('''
-                SELECT id FROM permanent_stats 
-                WHERE user_id = ? AND guild_id = ?
-            ''', (user_id, guild_id)) as cursor:
-                user_exists = await cursor.fetchone()
-
-            if user_exists:
-                # Kullanıcı varsa güncelle
-                await db.execute('''
-                    UPDATE permanent_stats 
-                    SET total_messages = total_messages + ?,
-                        total_voice_minutes = total_voice_minutes + ?,
-                        last_updated = ?
-                    WHERE user_id = ? AND guild_id = ?
-                ''', (messages, voice_minutes, datetime.datetime.now(), user_id, guild_id))
-            else:
-                # Kullanıcı yoksa yeni kayıt oluştur
-                await db.execute('''
-                    INSERT INTO permanent_stats 
-                    (user_id, guild_id, total_messages, total_voice_minutes, last_updated)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, guild_id, messages, voice_minutes, datetime.datetime.now()))
+    async def apply_retention(self) -> Dict[str, int]:
+        """Gelecek ayın bölümlerini hazırla ve saklama süresi dolan ham olayları temizle"""
+        # Sayaçlar özet tablolarından okunduğu için istatistikler değişmez; önbellek geçersiz sayılmaz
+        await self.partitions.prepare()
+        return await self.partitions.apply_retention()
 
-            await db.commit()
+    async def update_permanent_stats(self, user_id: int, guild_id: int, messages: int = 0, voice_minutes: int = 0):
+        """Kalıcı istatistikleri güncelle (artışlar kuyrukta birleştirilir)"""
+        self.ingest.add_permanent(user_id, guild_id, messages, voice_minutes)
+        await self.ingest.throttle(guild_id)
 
+    @cached('permanent')
     async def get_permanent_stats(self, guild_id: int, limit: int = 10) -> List[tuple]:
         """Kalıcı istatistikleri getir"""
-        async with aiosqlite.connect(self.db_name) as db:
+        async with self.pool.reader() as db:
             async with db.execute('''
                 SELECT user_id, total_messages, total_voice_minutes
                 FROM permanent_stats
@@ -504,18 +499,23 @@ class Database:
 
     async def reset_user_stats(self, user_id: int, guild_id: int):
         """Kullanıcının tüm istatistiklerini sıfırla"""
-        async with aiosqlite.connect(self.db_name) as db:
-            # Mesajları sil
-            await db.execute('DELETE FROM messages WHERE user_id = ? AND guild_id = ?', 
-                           (user_id, guild_id))
-            
-            # Sesli aktiviteleri sil
-            await db.execute('DELETE FROM voice_activity WHERE user_id = ? AND guild_id = ?', 
-                           (user_id, guild_id))
-            
-            # Emoji kullanımlarını sil
-            await db.execute('DELETE FROM emoji_usage WHERE user_id = ? AND guild_id = ?', 
-                           (user_id, guild_id))
+        # Kuyruktaki olaylar da sıfırlamaya dahil olsun
+        await self.ingest.flush()
+        # Kullanıcının eski XP'sini zaten almış bir kayıt, sıfırlamadan sonra yazıp onu geri getirmesin
+        async with self.xp.checkpoint_lock():
+            self.xp.forget(guild_id, user_id)
+            await self._reset_user_rows(user_id, guild_id)
+
+    async def _reset_user_rows(self, user_id: int, guild_id: int):
+        """Kullanıcının kayıtlarını tek işlemde sıfırla"""
+        now = datetime.datetime.now()
+        async with self.pool.writer() as db:
+            # Ham kayıtlar ve saatlik özetler işaretle hemen gizlenir; fiziksel silme arka planda yapılır
+            await self.resets.mark(db, guild_id, user_id, None, now)
+
+            # Emoji özetleri kullanıcı başına birkaç satırdır, doğrudan silinir
+            await db.execute('DELETE FROM emoji_rollup WHERE guild_id = ? AND user_id = ?',
+                           (guild_id, user_id))
             
             # Seviye bilgilerini sıfırla
             await db.execute('''
@@ -530,59 +530,52 @@ class Database:
                 SET total_messages = 0, total_voice_minutes = 0 
                 WHERE user_id = ? AND guild_id = ?
             ''', (user_id, guild_id))
+
+            # Sesteyse oturumu sıfırlama anından yeniden başlat
+            restarted = await self.voice.restart(db, guild_id, now, user_id=user_id)
             
             await db.commit()
+        self.resets.marked(guild_id)
+        self.voice.adopt(guild_id, restarted)
+        self.leaderboards.forget(guild_id)
+        self.cache.invalidate_guild(guild_id)
 
     async def reset_period_stats(self, guild_id: int, period_type: str):
         """Belirli bir periyodun istatistiklerini sıfırla"""
-        async with aiosqlite.connect(self.db_name) as db:
+        # Kuyruktaki olaylar da sıfırlamaya dahil olsun
+        await self.ingest.flush()
+        if period_type not in ('haftalık', 'aylık'):
+            return
+        # Ham kayıtlar ve saatlik özetler aynı (saat başına yuvarlanmış) sınırdan gizlenir
+        window = await self.periods.window(guild_id, period_type)
+        async with self.pool.writer() as db:
             now = datetime.datetime.now()
-            
-            if period_type == 'haftalık':
-                start_time = now - datetime.timedelta(weeks=1)
-            elif period_type == 'aylık':
-                start_time = now - datetime.timedelta(days=30)
-            else:
-                return
-            
-            # Mesajları sil
-            await db.execute('''
-                DELETE FROM messages 
-                WHERE guild_id = ? AND timestamp > ?
-            ''', (guild_id, start_time))
-            
-            # Sesli aktiviteleri sil
-            await db.execute('''
-                DELETE FROM voice_activity 
-                WHERE guild_id = ? AND join_time > ?
-            ''', (guild_id, start_time))
+
+            # Periyodun başından bu ana kadarki kayıtlar işaretlenir; arka planda parça parça silinir
+            await self.resets.mark(db, guild_id, None, window.start, now)
+
+            # Açık oturumlar silinen süreyi tekrar işlemesin
+            restarted = await self.voice.restart(db, guild_id, now)
             
             await db.commit()
+        self.resets.marked(guild_id)
+        self.voice.adopt(guild_id, restarted)
+        self.leaderboards.forget(guild_id)
+        self.cache.invalidate_guild(guild_id)
 
     async def update_xp_rate(self, guild_id: int, xp_rate: float):
         """XP kazanma oranını güncelle"""
-        async with aiosqlite.connect(self.db_name) as db:
-            # XP oranları tablosunu oluştur (eğer yoksa)
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS xp_rates (
-                    guild_id INTEGER PRIMARY KEY,
-                    xp_per_message REAL DEFAULT 10.0
-                )
-            ''')
-            
+        async with self.pool.writer() as db:
             # XP oranını güncelle veya ekle
             await db.execute('''
-                INSERT OR REPLACE INTO xp_rates (guild_id, xp_per_message)
+                INSERT INTO xp_rates (guild_id, xp_per_message)
                 VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET xp_per_message = excluded.xp_per_message
             ''', (guild_id, xp_rate))
             
             await db.commit()
+        self.xp.set_rate(guild_id, xp_rate)
 
     async def get_xp_rate(self, guild_id: int) -> float:
         """Sunucunun XP kazanma oranını getir"""
-        async with aiosqlite.connect(self.db_name) as db:
-            async with db.execute('''
-                SELECT xp_per_message FROM xp_rates WHERE guild_id = ?
-            ''', (guild_id,)) as cursor:
-                result = await cursor.fetchone()
-                return float(result[0]) if result else 10.0  # Varsayılan: 10.0 XP 
\ No newline at end of file
+        return await self.xp.rate(guild_id)  # Varsayılan: 10.0 XP
@@ -0,0 +1,368 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from connection_pool import ConnectionPool
+from result_cache import ResultCache
+from partitions import PartitionRouter
+from rollups import UPSERT_EMOJI_ROLLUP, UPSERT_MESSAGE_ROLLUP, emoji_rollup_rows, message_rollup_rows
+from shards import shard_for
+
+log = logging.getLogger(__name__)
+
+MESSAGE_COLUMNS = ('user_id', 'channel_id', 'guild_id', 'timestamp')
+EMOJI_COLUMNS = ('user_id', 'guild_id', 'emoji_id', 'emoji_name', 'timestamp')
+ROLE_COLUMNS = ('user_id', 'guild_id', 'role_id', 'action', 'timestamp')
+
+# Bir parti bu kadar denemede yazılamazsa kayda geçirilip atlanır (kuyruk sonsuza dek büyümesin)
+MAX_FLUSH_ATTEMPTS = 5
+
+# Başarısız yazmalardan sonra beklenecek en uzun süre (saniye)
+MAX_RETRY_DELAY = 30.0
+
+UPSERT_PERMANENT = '''
+    INSERT INTO permanent_stats
+    (user_id, guild_id, total_messages, total_voice_minutes, last_updated)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        total_messages = permanent_stats.total_messages + excluded.total_messages,
+        total_voice_minutes = permanent_stats.total_voice_minutes + excluded.total_voice_minutes,
+        last_updated = excluded.last_updated
+'''
+
+
+async def append_rows(db, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+    """Yalnızca eklenen satırları yaz; arka uç destekliyorsa (PostgreSQL) COPY ile"""
+    copy_records = getattr(db, 'copy_records', None)
+    if copy_records is not None:
+        await copy_records(table, columns, rows)
+    else:
+        await db.executemany(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows
+        )
+
+
+class IngestQueue:
+    """Mesaj, emoji ve rol olaylarını bellekte toplayıp tek işlemde yazan kuyruk"""
+
+    def __init__(self, pool: ConnectionPool, max_rows: int = 500, max_delay: float = 0.25,
+                 cache: Optional[ResultCache] = None, shard: Optional[int] = None,
+                 partitions: Optional[PartitionRouter] = None, leaderboards=None, sketches=None):
+        self.pool = pool
+        self.cache = cache
+        # Verilirse (leaderboards.LeaderboardTracker) yazılan olaylar bellekteki sıralamalara eklenir
+        self.leaderboards = leaderboards
+        # Verilirse (sketches.ActiveUserSketches) yazılan mesajlar aktif kullanıcı taslaklarına eklenir
+        self.sketches = sketches
+        # Verilmezse ham olaylar bölümlenmemiş ana tablolara yazılır
+        self.partitions = partitions
+        # Bu kuyruğun yazdığı shard (None: shard'sız çalışma)
+        self.shard = shard
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        self._messages: List[tuple] = []
+        self._emojis: List[tuple] = []
+        self._roles: List[tuple] = []
+        # (user_id, guild_id) -> [mesaj, ses dakikası]
+        self._permanent: Dict[Tuple[int, int], List[int]] = {}
+        # Yazılamayan parti ve deneme sayısı; sonraki yazmada yeni olaylardan önce, ayrı işlemde denenir
+        self._retry: Optional[Tuple[List[tuple], List[tuple], List[tuple], Dict, int]] = None
+
+        # asyncio nesneleri olay döngüsü içinde, start() ile oluşturulur
+        self._pending = None
+        self._full = None
+        self._flush_lock = None
+        self._task = None
+
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+
+    def __len__(self) -> int:
+        pending = len(self._messages) + len(self._emojis) + len(self._roles) + len(self._permanent)
+        if self._retry is not None:
+            pending += sum(len(rows) for rows in self._retry[:4])
+        return pending
+
+    def _prepare(self):
+        if self._flush_lock is None:
+            self._pending = asyncio.Event()
+            self._full = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        """Arka plan yazıcı görevini başlat"""
+        if self._task is None:
+            self._prepare()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Yazıcı görevini (başlatıldıysa) durdur ve kalan olayları yaz"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # start() hiç çağrılmamış olsa da (kurulum hatası, komut satırı araçları) kuyruk boşalana dek yazılır
+        while len(self):
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            # Boyut eşiğine ulaşılana ya da süre dolana kadar bekle
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                log.exception('Olay kuyruğu yazılamadı, sonraki turda tekrar denenecek')
+                # Art arda başarısızlıklarda bekleme katlanarak uzar
+                attempts = self._retry[4] if self._retry is not None else 1
+                await asyncio.sleep(min(self.max_delay * 2 ** attempts, MAX_RETRY_DELAY))
+
+    def _added(self):
+        if self._pending is None:
+            return
+        self._pending.set()
+        if len(self) >= self.max_rows:
+            self._full.set()
+
+    def add_message(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime):
+        self._messages.append((user_id, channel_id, guild_id, timestamp))
+        self._added()
+
+    def add_emoji(self, user_id: int, guild_id: int, emoji_id: str, emoji_name: str, timestamp: datetime.datetime):
+        self._emojis.append((user_id, guild_id, emoji_id, emoji_name, timestamp))
+        self._added()
+
+    def add_role_change(self, user_id: int, guild_id: int, role_id: int, action: str, timestamp: datetime.datetime):
+        self._roles.append((user_id, guild_id, role_id, action, timestamp))
+        self._added()
+
+    def add_permanent(self, user_id: int, guild_id: int, messages: int = 0, voice_minutes: int = 0):
+        totals = self._permanent.setdefault((user_id, guild_id), [0, 0])
+        totals[0] += messages
+        totals[1] += voice_minutes
+        self._added()
+
+    async def throttle(self):
+        """Kuyruk eşiğin çok üstüne çıkarsa yazılmasını bekle"""
+        if self._flush_lock is not None and len(self) >= self.max_rows * 4:
+            await self.flush()
+
+    async def _append(self, db, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+        """Ham olayları (varsa) ait oldukları aylık bölümlere ekle"""
+        if self.partitions is None:
+            await append_rows(db, table, columns, rows)
+            return
+        for partition, partition_rows in await self.partitions.route(db, table, rows):
+            await append_rows(db, partition, columns, partition_rows)
+
+    async def flush(self):
+        """Varsa yazılamamış partiyi, ardından çağrı anında bekleyen olayları yaz"""
+        self._prepare()
+        async with self._flush_lock:
+            self._pending.clear()
+            self._full.clear()
+            # Yazma sürerken gelen olaylar sonraki partiye kalır; yoğun trafikte partiler küçülmez
+            batch = self._take()
+            if self._retry is not None:
+                retry, self._retry = self._retry, None
+                try:
+                    await self._write_batch(*retry)
+                except Exception:
+                    self._restore(*batch)
+                    raise
+            if any(batch):
+                await self._write_batch(*batch, 0)
+
+    def _take(self) -> Tuple[List[tuple], List[tuple], List[tuple], Dict]:
+        """Bekleyen olayları kuyruktan al"""
+        batch = self._messages, self._emojis, self._roles, self._permanent
+        self._messages, self._emojis, self._roles, self._permanent = [], [], [], {}
+        return batch
+
+    def _restore(self, messages: List[tuple], emojis: List[tuple], roles: List[tuple], permanent: Dict):
+        """Yazılmadan kalan olayları, sonradan gelenlerin önüne geri koy"""
+        self._messages[:0] = messages
+        self._emojis[:0] = emojis
+        self._roles[:0] = roles
+        for key, (sent, voice_minutes) in permanent.items():
+            totals = self._permanent.setdefault(key, [0, 0])
+            totals[0] += sent
+            totals[1] += voice_minutes
+
+    async def _write_batch(self, messages: List[tuple], emojis: List[tuple], roles: List[tuple],
+                           permanent: Dict, attempts: int):
+        """Tek partiyi tek işlemde yaz"""
+        now = datetime.datetime.now()
+        try:
+            async with self.pool.writer(self.shard) as db:
+                try:
+                    if messages:
+                        await self._append(db, 'messages', MESSAGE_COLUMNS, messages)
+                        await db.executemany(UPSERT_MESSAGE_ROLLUP, message_rollup_rows(messages))
+                    if emojis:
+                        await self._append(db, 'emoji_usage', EMOJI_COLUMNS, emojis)
+                        await db.executemany(UPSERT_EMOJI_ROLLUP, emoji_rollup_rows(emojis))
+                    if roles:
+                        await self._append(db, 'role_history', ROLE_COLUMNS, roles)
+                    if permanent:
+                        await db.executemany(UPSERT_PERMANENT, [
+                            (user_id, guild_id, totals[0], totals[1], now)
+                            for (user_id, guild_id), totals in permanent.items()
+                        ])
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    if self.partitions is not None:
+                        # Geri alınan işlemde oluşturulan bölümler kayıttan da düşer
+                        self.partitions.forget()
+                    raise
+        except Exception:
+            attempts += 1
+            self.failed_flushes += 1
+            rows = len(messages) + len(emojis) + len(roles) + len(permanent)
+            if attempts >= MAX_FLUSH_ATTEMPTS:
+                # Bozuk bir satır ya da kalıcı bir hata kuyruğu kilitlemesin; parti kayda geçirilip atlanır
+                self.dropped_rows += rows
+                log.error('Olay partisi %d denemede yazılamadı, %d satır atlandı: mesajlar=%r emojiler=%r '
+                          'roller=%r kalıcı=%r', attempts, rows, messages, emojis, roles, permanent)
+            else:
+                # Yeni olaylar partiye karışmaz; parti sonraki yazmada tek başına tekrar denenir
+                self._retry = (messages, emojis, roles, permanent, attempts)
+            self._pending.set()
+            raise
+
+        self.flushes += 1
+        self.flushed_rows += len(messages) + len(emojis) + len(roles) + len(permanent)
+
+        # Yazma kilidi hâlâ tutuluyor; sıralama yüklemeleri bu olayları iki kez saymaz
+        if self.leaderboards is not None:
+            self.leaderboards.record(messages, emojis)
+        if self.sketches is not None:
+            self.sketches.record(messages)
+
+        if self.cache is not None:
+            for guild_id in {row[2] for row in messages}:
+                self.cache.bump(guild_id, 'messages')
+            for guild_id in {row[1] for row in emojis}:
+                self.cache.bump(guild_id, 'emoji')
+            for guild_id in {guild_id for _, guild_id in permanent}:
+                self.cache.bump(guild_id, 'permanent')
+
+    def stats(self) -> Dict:
+        """Kuyruk istatistiklerini getir"""
+        return {
+            'pending_rows': len(self),
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failed_flushes': self.failed_flushes,
+            'dropped_rows': self.dropped_rows,
+        }
+
+
+class ShardedIngest:
+    """Her shard için ayrı kuyruk ve yazıcı kullanan, IngestQueue ile aynı arayüzdeki yönlendirici"""
+
+    def __init__(self, pool: ConnectionPool, max_rows: int = 500, max_delay: float = 0.25,
+                 cache: Optional[ResultCache] = None, partitions: Optional[PartitionRouter] = None,
+                 leaderboards=None, sketches=None):
+        self.pool = pool
+        self.cache = cache
+        self.partitions = partitions
+        self.leaderboards = leaderboards
+        self.sketches = sketches
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.shard_count: Optional[int] = None
+        # shard -> kuyruk; kuyruklar ilk olayda oluşturulur
+        self.queues: Dict[int, IngestQueue] = {}
+        self._started = False
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def configure(self, shard_count: Optional[int]):
+        """Shard sayısını ayarla (kuyruklar başlamadan önce çağrılmalı)"""
+        if self.queues:
+            raise RuntimeError('Shard sayısı kuyruklar oluştuktan sonra değiştirilemez')
+        self.shard_count = shard_count or None
+
+    def queue(self, guild_id: int) -> IngestQueue:
+        """Sunucunun shard'ına ait kuyruğu getir"""
+        shard = shard_for(guild_id, self.shard_count)
+        queue = self.queues.get(shard)
+        if queue is None:
+            queue = IngestQueue(self.pool, max_rows=self.max_rows, max_delay=self.max_delay,
+                                cache=self.cache, shard=shard if self.shard_count else None,
+                                partitions=self.partitions, leaderboards=self.leaderboards,
+                                sketches=self.sketches)
+            if self._started:
+                queue.start()
+            self.queues[shard] = queue
+        return queue
+
+    def flush_lock(self, guild_id: int) -> Optional[asyncio.Lock]:
+        """Sunucunun kuyruğunun yazma kilidi; tutulduğu sürece bu sunucunun olayları yazılmaz"""
+        return self.queue(guild_id)._flush_lock
+
+    def start(self):
+        """Yazıcı görevlerini başlat"""
+        self._started = True
+        for queue in self.queues.values():
+            queue.start()
+
+    async def close(self):
+        """Tüm yazıcı görevlerini durdur ve kalan olayları yaz"""
+        self._started = False
+        for queue in list(self.queues.values()):
+            await queue.close()
+
+    def add_message(self, user_id: int, channel_id: int, guild_id: int, timestamp: datetime.datetime):
+        self.queue(guild_id).add_message(user_id, channel_id, guild_id, timestamp)
+
+    def add_emoji(self, user_id: int, guild_id: int, emoji_id: str, emoji_name: str, timestamp: datetime.datetime):
+        self.queue(guild_id).add_emoji(user_id, guild_id, emoji_id, emoji_name, timestamp)
+
+    def add_role_change(self, user_id: int, guild_id: int, role_id: int, action: str, timestamp: datetime.datetime):
+        self.queue(guild_id).add_role_change(user_id, guild_id, role_id, action, timestamp)
+
+    def add_permanent(self, user_id: int, guild_id: int, messages: int = 0, voice_minutes: int = 0):
+        self.queue(guild_id).add_permanent(user_id, guild_id, messages, voice_minutes)
+
+    async def throttle(self, guild_id: Optional[int] = None):
+        """Sunucunun kuyruğu (verilmezse tüm kuyruklar) eşiğin çok üstündeyse yazılmasını bekle"""
+        if guild_id is not None:
+            await self.queue(guild_id).throttle()
+            return
+        for queue in list(self.queues.values()):
+            await queue.throttle()
+
+    async def flush(self):
+        """Tüm shard kuyruklarını yaz"""
+        for queue in list(self.queues.values()):
+            # Başlamış kuyrukta süren bir yazma da beklenir
+            if queue._flush_lock is not None or len(queue):
+                await queue.flush()
+
+    def stats(self) -> Dict:
+        """Kuyruk istatistiklerini (toplam ve shard bazında) getir"""
+        stats = {
+            'pending_rows': len(self),
+            'flushes': sum(queue.flushes for queue in self.queues.values()),
+            'flushed_rows': sum(queue.flushed_rows for queue in self.queues.values()),
+            'failed_flushes': sum(queue.failed_flushes for queue in self.queues.values()),
+            'dropped_rows': sum(queue.dropped_rows for queue in self.queues.values()),
+        }
+        if self.shard_count:
+            stats['shards'] = {shard: queue.stats() for shard, queue in sorted(self.queues.items())}
+        return stats
@@ -0,0 +1,273 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from operator import itemgetter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from periods import CALENDAR, ROLLING, PeriodEngine, Window
+from rollups import hour_bucket
+
+log = logging.getLogger(__name__)
+
+# Tüm zamanlar pencereleri (bilinmeyen periyot adları dahil) tek sıralamayı paylaşır
+ALL_TIME = '*'
+
+
+class TopK:
+    """Sınırlı kapasiteli Space-Saving sayacı; izlenmeyen anahtarların sayısı en fazla `floor`"""
+    __slots__ = ('capacity', 'counts', 'errors', 'floor', '_heap')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        # Tahliyeden sonra eklenen anahtarların olası fazla sayımı (yoksa sayı kesindir)
+        self.errors: Dict[Hashable, int] = {}
+        self.floor = 0
+        # (sayı, anahtar) en küçük yığını; güncel olmayan girdiler çekilirken atlanır
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    @classmethod
+    def from_rows(cls, capacity: int, rows: List[tuple]) -> 'TopK':
+        """Büyükten küçüğe sıralı en fazla capacity + 1 satırdan kur (fazla satır alt sınırı verir)"""
+        board = cls(capacity)
+        for key, count in rows[:capacity]:
+            board.counts[key] = count
+        if len(rows) > capacity:
+            board.floor = rows[capacity][1]
+        board._rebuild_heap()
+        return board
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _rebuild_heap(self):
+        self._heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _push(self, key: Hashable, count: int):
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 2 * self.capacity + 64:
+            self._rebuild_heap()
+
+    def _evict(self):
+        """En küçük sayılı anahtarı çıkar; gerçek sayısı o değeri aşamaz"""
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                break
+        del self.counts[key]
+        self.errors.pop(key, None)
+        self.floor = max(self.floor, count)
+
+    def add(self, key: Hashable, amount: int = 1):
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) >= self.capacity:
+                self._evict()
+            # İzlenmeyen anahtarın önceki sayısı en fazla floor kadardır
+            count = self.floor
+            if count:
+                self.errors[key] = count
+        count += amount
+        self.counts[key] = count
+        self._push(key, count)
+
+    def subtract(self, key: Hashable, amount: int):
+        """Pencereden çıkan sayımı düş (izlenmeyen anahtarlar zaten floor'un altındadır)"""
+        count = self.counts.get(key)
+        if count is None:
+            return
+        count -= amount
+        if count <= 0 and not self.errors.get(key):
+            del self.counts[key]
+            return
+        self.counts[key] = count
+        self._push(key, count)
+
+    def top(self, limit: int) -> Optional[List[Tuple[Hashable, int]]]:
+        """En yüksek `limit` anahtar; sıralama ve sayılar kesin değilse None"""
+        ranked = heapq.nlargest(limit, self.counts.items(), key=itemgetter(1))
+        if any(self.errors.get(key) for key, _ in ranked):
+            return None
+        if self.floor and (len(ranked) < limit or ranked[-1][1] < self.floor):
+            return None
+        return ranked
+
+
+class PeriodBoard:
+    """Bir periyot penceresinin mesaj sıralaması"""
+    __slots__ = ('window', 'start_hour', 'end_hour', 'board')
+
+    def __init__(self, window: Window, board: TopK):
+        self.window = window
+        self.start_hour, self.end_hour = window.hours
+        self.board = board
+
+
+class LeaderboardTracker:
+    """Sunucu ve periyot başına mesaj, sunucu başına emoji sıralamalarını bellekte günceller"""
+
+    def __init__(self, pool, periods: PeriodEngine, resets, capacity: int = 1000):
+        self.pool = pool
+        self.periods = periods
+        self.resets = resets
+        # Sunucu ve sıralama başına en fazla bu kadar anahtar tutulur
+        self.capacity = capacity
+        # Database atar; özet tabloları kuyruğun yazma kilidi altında okunur ki arada yazılan
+        # olaylar hem sorguya hem record()'a girmesin
+        self.ingest = None
+        self._messages: Dict[int, Dict[str, PeriodBoard]] = {}
+        self._emojis: Dict[int, TopK] = {}
+        # Sıfırlamada artar; sıfırlamadan önce başlamış yüklemeler sonucu kaydetmez
+        self._generations: Dict[int, int] = {}
+
+        self.served = 0
+        self.loads = 0
+        self.advances = 0
+        self.fallbacks = 0
+
+    def _lock(self, guild_id: int):
+        lock = self.ingest.flush_lock(guild_id) if self.ingest is not None else None
+        return lock if lock is not None else asyncio.Lock()
+
+    @staticmethod
+    def _key(period: str, window: Window) -> Optional[str]:
+        if period in ROLLING or period in CALENDAR:
+            return period
+        if window.start == datetime.datetime.min and window.end is None:
+            return ALL_TIME
+        # Özel aralıklar bellekte tutulmaz
+        return None
+
+    def record(self, messages: Iterable[tuple], emojis: Iterable[tuple]):
+        """Yazılan olayları (işlem commit edildikten sonra) izlenen sıralamalara ekle"""
+        for user_id, _channel_id, guild_id, timestamp in messages:
+            boards = self._messages.get(guild_id)
+            if not boards:
+                continue
+            hour = hour_bucket(timestamp)
+            for period_board in boards.values():
+                if period_board.start_hour <= hour < period_board.end_hour:
+                    period_board.board.add(user_id)
+        for _user_id, guild_id, _emoji_id, emoji_name, _timestamp in emojis:
+            board = self._emojis.get(guild_id)
+            if board is not None:
+                board.add(emoji_name)
+
+    def forget(self, guild_id: int):
+        """Sunucunun sıralamalarını bırak (sıfırlamadan sonra özetlerden yeniden yüklenir)"""
+        self._messages.pop(guild_id, None)
+        self._emojis.pop(guild_id, None)
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+
+    async def message_leaderboard(self, guild_id: int, period: str, limit: int) -> Optional[List[tuple]]:
+        """Mesaj sıralamasını bellekten getir; izlenmeyen periyotta ya da kesinlik yoksa None"""
+        if limit > self.capacity:
+            return None
+        window = await self.periods.window(guild_id, period)
+        key = self._key(period, window)
+        if key is None:
+            return None
+        period_board = self._messages.get(guild_id, {}).get(key)
+        if period_board is None or period_board.window is not window:
+            period_board = await self._refresh(guild_id, key, window)
+        ranked = period_board.board.top(limit)
+        if ranked is None:
+            # Tahliyeler sıralamayı belirsizleştirdi; özetlerden baştan yükle
+            period_board = await self._refresh(guild_id, key, window, reload=True)
+            ranked = period_board.board.top(limit)
+            if ranked is None:
+                self.fallbacks += 1
+                return None
+        self.served += 1
+        return ranked
+
+    async def _refresh(self, guild_id: int, key: str, window: Window, reload: bool = False) -> PeriodBoard:
+        """Pencere değiştiyse çıkan saatleri düş, aksi halde özetlerden yükle"""
+        generation = self._generations.get(guild_id, 0)
+        visible = self.resets.visible(guild_id, 'message_rollup_hourly')
+        async with self._lock(guild_id):
+            current = self._messages.get(guild_id, {}).get(key)
+            if current is not None and current.window is window and not reload:
+                return current
+            start_hour, end_hour = window.hours
+            async with self.pool.reader() as db:
+                if (current is not None and not reload and current.window.end is None
+                        and window.end is None and start_hour >= current.start_hour):
+                    # Kayan ya da yeni başlayan açık uçlu pencere: yalnızca çıkan saatler sorgulanır
+                    async with db.execute(f'''
+                        SELECT user_id, SUM(message_count) FROM message_rollup_hourly
+                        WHERE guild_id = ? AND hour >= ? AND hour < ?
+                        {visible}
+                        GROUP BY user_id
+                    ''', (guild_id, current.start_hour, start_hour)) as cursor:
+                        expired = await cursor.fetchall()
+                    board = current.board
+                    for user_id, count in expired:
+                        board.subtract(user_id, count)
+                    self.advances += 1
+                else:
+                    async with db.execute(f'''
+                        SELECT user_id, SUM(message_count) as message_count
+                        FROM message_rollup_hourly
+                        WHERE guild_id = ? AND hour >= ? AND hour < ?
+                        {visible}
+                        GROUP BY user_id
+                        ORDER BY message_count DESC
+                        LIMIT ?
+                    ''', (guild_id, start_hour, end_hour, self.capacity + 1)) as cursor:
+                        board = TopK.from_rows(self.capacity, await cursor.fetchall())
+                    self.loads += 1
+            period_board = PeriodBoard(window, board)
+            if self._generations.get(guild_id, 0) == generation:
+                self._messages.setdefault(guild_id, {})[key] = period_board
+            return period_board
+
+    async def emoji_stats(self, guild_id: int, limit: int) -> Optional[List[tuple]]:
+        """Emoji sıralamasını bellekten getir; kesinlik yoksa None"""
+        if limit > self.capacity:
+            return None
+        board = self._emojis.get(guild_id)
+        if board is None:
+            board = await self._load_emojis(guild_id)
+        ranked = board.top(limit)
+        if ranked is None:
+            ranked = (await self._load_emojis(guild_id)).top(limit)
+            if ranked is None:
+                self.fallbacks += 1
+                return None
+        self.served += 1
+        return ranked
+
+    async def _load_emojis(self, guild_id: int) -> TopK:
+        generation = self._generations.get(guild_id, 0)
+        async with self._lock(guild_id):
+            async with self.pool.reader() as db:
+                async with db.execute('''
+                    SELECT emoji_name, SUM(usage_count) as count
+                    FROM emoji_rollup
+                    WHERE guild_id = ?
+                    GROUP BY emoji_name
+                    ORDER BY count DESC
+                    LIMIT ?
+                ''', (guild_id, self.capacity + 1)) as cursor:
+                    board = TopK.from_rows(self.capacity, await cursor.fetchall())
+            self.loads += 1
+            if self._generations.get(guild_id, 0) == generation:
+                self._emojis[guild_id] = board
+            return board
+
+    def stats(self) -> Dict:
+        """Sıralama izleyici istatistiklerini getir"""
+        return {
+            'guilds': len(self._messages.keys() | self._emojis.keys()),
+            'boards': sum(len(boards) for boards in self._messages.values()) + len(self._emojis),
+            'entries': (sum(len(period_board.board) for boards in self._messages.values()
+                            for period_board in boards.values())
+                        + sum(len(board) for board in self._emojis.values())),
+            'served': self.served,
+            'loads': self.loads,
+            'advances': self.advances,
+            'fallbacks': self.fallbacks,
+        }
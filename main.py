@@ -1,69 +1,174 @@
+import time
+_imports_started = time.perf_counter()
 import os
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 import datetime
 from database import Database
+from charts import ChartQueueFull
+from metrics import Metrics
+from announcer import LevelUpAnnouncer
+from presence import PresenceCounters
+from startup import StartupTimer
+from shards import describe, parse_shard_ids, recommended_shard_count, run_shard_processes
+from names import fetch_size
 import io
 import asyncio
 
+# Başlangıç aşamalarının süreleri
+startup = StartupTimer(started=_imports_started)
+startup.record('imports', time.perf_counter() - _imports_started)
+
 # .env dosyasını yükle
 load_dotenv()
 
+
+def optional_int(name: str):
+    """Tanımlıysa ortam değişkenini tam sayı olarak getir"""
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# fast: ağır modüller (matplotlib) ilk kullanımda yüklenir
+# eager: bağlandıktan sonra grafik işçileri arka planda hazırlanır
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'fast')
+
+# Shard ayarları: SHARD_COUNT boşsa tek bağlantı, 'auto' ya da sayı ise AutoShardedBot.
+# SHARD_PROCESSES > 1 ise shard'lar bu kadar sürece bölünür (SHARD_IDS süreç başına atanır).
+SHARD_COUNT = os.getenv('SHARD_COUNT', '').strip().lower()
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES') or '1')
+SHARDED = bool(SHARD_COUNT) or SHARD_IDS is not None or SHARD_PROCESSES > 1
+
+# Belirli shard'lar yalnızca toplam shard sayısı bilindiğinde seçilebilir
+if SHARD_COUNT and SHARD_COUNT != 'auto' and not SHARD_COUNT.isdigit():
+    raise SystemExit(f"Yapılandırma hatası: SHARD_COUNT boş, 'auto' ya da bir sayı olmalı (verilen: {SHARD_COUNT!r})")
+if SHARD_IDS is not None:
+    if not SHARD_COUNT.isdigit():
+        raise SystemExit("Yapılandırma hatası: SHARD_IDS kullanılırken SHARD_COUNT sayı olarak verilmeli "
+                         "('auto' ya da boş olamaz)")
+    if SHARD_IDS[-1] >= int(SHARD_COUNT):
+        raise SystemExit(f'Yapılandırma hatası: SHARD_IDS içindeki shard numaraları SHARD_COUNT '
+                         f'({SHARD_COUNT}) değerinden küçük olmalı')
+
+# Presence intent'i kapalıysa çevrimiçi durum olayları hiç gelmez (daha az gateway trafiği ve bellek);
+# çevrimiçi üye sayısı Discord'un yaklaşık sayımından alınır
+PRESENCE_INTENT = os.getenv('PRESENCE_INTENT', 'true').lower() in ('1', 'true', 'evet')
+
 # Bot yapılandırması
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-intents.presences = True
+intents.presences = PRESENCE_INTENT
 intents.voice_states = True
 intents.reactions = True
 intents.emojis = True
 
+# Üye önbelleği: full (tüm üyeler) veya minimal (yalnızca sesli kanaldakiler; sıralama adları
+# names.NameResolver ile tablodan ve toplu üye sorgusuyla çözülür)
+member_options = {}
+if os.getenv('MEMBER_CACHE', 'full').lower() == 'minimal':
+    member_options = {
+        'member_cache_flags': discord.MemberCacheFlags(voice=True, joined=False),
+        'chunk_guilds_at_startup': False,
+    }
+
 # Prefix'i .env dosyasından al
-bot = commands.Bot(command_prefix=os.getenv('BOT_PREFIX', '!'), intents=intents)
-db = Database()
+if SHARDED:
+    bot = commands.AutoShardedBot(
+        command_prefix=os.getenv('BOT_PREFIX', '!'), intents=intents,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT.isdigit() else None, shard_ids=SHARD_IDS,
+        **member_options
+    )
+else:
+    bot = commands.Bot(command_prefix=os.getenv('BOT_PREFIX', '!'), intents=intents, **member_options)
+
+db = Database(
+    backend=os.getenv('DB_BACKEND', 'sqlite'),
+    dsn=os.getenv('DATABASE_URL') or None,
+    profile=os.getenv('DB_PROFILE', 'throughput'),
+    cache_mb=optional_int('DB_CACHE_MB'),
+    mmap_mb=optional_int('DB_MMAP_MB'),
+    readers=int(os.getenv('DB_READERS', '4')),
+    batch_size=int(os.getenv('INGEST_BATCH_SIZE', '500')),
+    flush_interval=int(os.getenv('INGEST_FLUSH_MS', '250')) / 1000,
+    xp_checkpoint_interval=float(os.getenv('XP_CHECKPOINT_SECONDS', '5')),
+    cache_ttl=float(os.getenv('CACHE_TTL_SECONDS', '30')),
+    cache_size=int(os.getenv('CACHE_MAX_ENTRIES', '2048')),
+    chart_workers=int(os.getenv('CHART_WORKERS', '2')),
+    voice_heartbeat_interval=float(os.getenv('VOICE_HEARTBEAT_SECONDS', '60')),
+    default_timezone=os.getenv('DEFAULT_TIMEZONE') or None,
+    retention_days=optional_int('RETENTION_DAYS'),
+    archive_partitions=os.getenv('ARCHIVE_PARTITIONS', '').lower() in ('1', 'true', 'evet'),
+    name_cache_size=int(os.getenv('NAME_CACHE_SIZE', '50000')),
+    leaderboard_capacity=int(os.getenv('LEADERBOARD_CAPACITY', '1000'))
+)
+
+# Performans metrikleri; kapalıyken hiçbir metot ya da işleyici sarmalanmaz
+metrics = Metrics(enabled=os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'evet'))
+metrics.collector(db.component_stats)
+
+# Seviye atlama duyuruları arka planda, kanal başına birleştirilip hız sınırıyla gönderilir
+announcer = LevelUpAnnouncer(
+    window=int(os.getenv('LEVELUP_COALESCE_MS', '1500')) / 1000,
+    channel_messages=int(os.getenv('LEVELUP_CHANNEL_MESSAGES', '5')),
+    channel_seconds=float(os.getenv('LEVELUP_CHANNEL_SECONDS', '5'))
+)
+metrics.collector(lambda: {'announcer': announcer.stats()})
+
+# !istatistik için sunucu başına çevrimiçi/bot sayaçları (üyeler her komutta taranmaz)
+presence = PresenceCounters(track_presence=PRESENCE_INTENT)
+metrics.collector(lambda: {'presence': presence.stats()})
 
 @bot.event
 async def on_ready():
     print(f'{bot.user} olarak giriş yapıldı!')
-    await db.setup()
-    check_weekly_reset.start()
+    # Bot kapalıyken ya da bağlantı koptuğunda kaçırılan ses olaylarını eşitle
+    now = datetime.datetime.now()
+    for guild in bot.guilds:
+        members = {}
+        for channel in guild.voice_channels + guild.stage_channels:
+            for user_id in channel.voice_states:
+                members[user_id] = channel.id
+        await db.reconcile_voice(guild.id, members, now)
+    if startup.end('gateway'):
+        startup.log()
+        if STARTUP_MODE == 'eager':
+            asyncio.create_task(db.charts.warm_up())
+    # Haftalık periyodu yalnızca 0. shard'ı çalıştıran süreç açar
+    if db.owns_shard(0) and not check_weekly_reset.is_running():
+        check_weekly_reset.start()
+    if db.owns_shard(0) and not apply_retention.is_running():
+        apply_retention.start()
 
 @tasks.loop(minutes=30)  # Her 30 dakikada bir kontrol et
 async def check_weekly_reset():
     """Haftalık periyodu kontrol et ve güncelle"""
     await db.update_weekly_period()
 
+@tasks.loop(hours=6)
+async def apply_retention():
+    """Gelecek ayın ham olay bölümlerini hazırla ve süresi dolan bölümleri temizle"""
+    await db.apply_retention()
+
 @bot.event
 async def on_message(message):
     if message.author.bot:
         return
 
-    # Mesaj istatistiklerini kaydet
-    await db.log_message(
+    # Mesaj, kalıcı istatistik ve XP kayıtları
+    leveled_up, new_level = await db.record_message(
         user_id=message.author.id,
         channel_id=message.channel.id,
         guild_id=message.guild.id,
+        display_name=message.author.display_name,
         timestamp=datetime.datetime.now()
     )
 
-    # Kalıcı istatistikleri güncelle
-    await db.update_permanent_stats(
-        user_id=message.author.id,
-        guild_id=message.guild.id,
-        messages=1
-    )
-
-    # XP ve seviye sistemi
-    leveled_up, new_level = await db.update_user_xp(
-        user_id=message.author.id,
-        guild_id=message.guild.id
-    )
-
     if leveled_up:
-        await message.channel.send(
-            f"🎉 Tebrikler {message.author.mention}! Seviye {new_level}'e ulaştın!"
-        )
+        # Gönderimi beklemeden komut işlemeye geç
+        announcer.announce(message.channel, message.author, new_level)
 
     await bot.process_commands(message)
 
@@ -71,30 +176,13 @@ async def on_message(message):
 async def on_voice_state_update(member, before, after):
     # Sesli kanal değişikliklerini izle
     if before.channel != after.channel:
-        if after.channel:
-            # Sesli kanala katılma
-            await db.log_voice_join(
-                user_id=member.id,
-                channel_id=after.channel.id,
-                guild_id=member.guild.id,
-                timestamp=datetime.datetime.now()
-            )
-        elif before.channel:
-            # Sesli kanaldan ayrılma
-            await db.log_voice_leave(
-                user_id=member.id,
-                channel_id=before.channel.id,
-                guild_id=member.guild.id,
-                timestamp=datetime.datetime.now()
-            )
-            
-            # Kalıcı istatistikleri güncelle (sesli kanal süresi)
-            voice_time = await db.get_user_voice_time(member.id, member.guild.id)
-            await db.update_permanent_stats(
-                user_id=member.id,
-                guild_id=member.guild.id,
-                voice_minutes=voice_time
-            )
+        await db.record_voice_update(
+            user_id=member.id,
+            guild_id=member.guild.id,
+            before=before.channel.id if before.channel else None,
+            after=after.channel.id if after.channel else None,
+            timestamp=datetime.datetime.now()
+        )
 
 @bot.event
 async def on_reaction_add(reaction, user):
@@ -112,9 +200,56 @@ async def on_reaction_add(reaction, user):
         emoji_name=emoji_name
     )
 
+@bot.event
+async def on_guild_available(guild):
+    """Sunucu (üyeleri yüklendikten sonra) hazır olduğunda sayaçları bir kez hesapla"""
+    presence.seed(guild)
+
+@bot.event
+async def on_guild_join(guild):
+    presence.seed(guild)
+
+@bot.event
+async def on_guild_unavailable(guild):
+    presence.forget(guild.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    presence.forget(guild.id)
+
+@bot.event
+async def on_presence_update(before, after):
+    """Çevrimiçi sayacını güncelle"""
+    presence.presence_changed(after.guild.id, before, after)
+
+@bot.event
+async def on_member_join(member):
+    """Yeni üyenin adını kaydet ve sayaçlara ekle"""
+    db.names.remember(member.guild.id, member.id, member.display_name)
+    presence.member_joined(member.guild.id, member)
+
+@bot.event
+async def on_raw_member_remove(payload):
+    """Ayrılan üye sıralamalarda atlanır (üye önbellekte olmasa da gelir)"""
+    db.names.left(payload.guild_id, payload.user.id)
+    presence.member_left(payload.guild_id, payload.user)
+
+@bot.event
+async def on_user_update(before, after):
+    """Kullanıcı adı değişikliğini ortak sunuculardaki kayıtlara yansıt"""
+    if before.display_name == after.display_name:
+        return
+    for guild in after.mutual_guilds:
+        member = guild.get_member(after.id)
+        if member is not None:
+            db.names.remember(guild.id, member.id, member.display_name)
+
 @bot.event
 async def on_member_update(before, after):
-    """Rol değişikliklerini takip et"""
+    """Rol ve takma ad değişikliklerini takip et"""
+    if before.display_name != after.display_name:
+        db.names.remember(after.guild.id, after.id, after.display_name)
+
     # Eklenen roller
     for role in after.roles:
         if role not in before.roles:
@@ -160,6 +295,24 @@ async def settings(ctx):
         inline=False
     )
     
+    # Saat dilimi
+    timezone = await db.get_timezone(ctx.guild.id)
+    embed.add_field(
+        name="🕒 Saat Dilimi",
+        value=f"Mevcut: {timezone or 'Botun yerel saati'}\n"
+              f"Değiştirmek için: `!saat-dilimi <Bölge/Şehir>`",
+        inline=False
+    )
+
+    # Ham olay saklama süresi (özet istatistikler silinmez)
+    retention = await db.get_retention(ctx.guild.id) or db.partitions.retention_days
+    embed.add_field(
+        name="🗄️ Ham Kayıt Saklama",
+        value=f"Mevcut: {f'{retention} gün' if retention else 'Süresiz'}\n"
+              f"Değiştirmek için: `!saklama <gün/varsayılan>`",
+        inline=False
+    )
+
     # İstatistik Sıfırlama
     embed.add_field(
         name="🗑️ İstatistik Sıfırlama",
@@ -182,6 +335,32 @@ async def set_xp_rate(ctx, amount: float):
     await db.update_xp_rate(ctx.guild.id, amount)
     await ctx.send(f"✅ Mesaj başına kazanılan XP miktarı {amount:.2f} olarak ayarlandı!")
 
+@bot.command(name='saat-dilimi')
+@is_owner()
+async def set_timezone(ctx, timezone: str):
+    """Takvim periyotlarının (bugün/bu-hafta/bu-ay) saat dilimini ayarla (Sadece sunucu sahibi kullanabilir)"""
+    if not db.periods.is_valid_timezone(timezone):
+        await ctx.send("❌ Geçersiz saat dilimi! Örnek: `Europe/Istanbul`")
+        return
+
+    await db.set_timezone(ctx.guild.id, timezone)
+    await ctx.send(f"✅ Saat dilimi {timezone} olarak ayarlandı!")
+
+@bot.command(name='saklama')
+@is_owner()
+async def set_retention(ctx, days: str):
+    """Ham mesaj/emoji/rol kayıtlarının saklanacağı gün sayısını ayarla (Sadece sunucu sahibi kullanabilir)"""
+    if days == 'varsayılan':
+        await db.set_retention(ctx.guild.id, None)
+        await ctx.send("✅ Saklama süresi varsayılana döndürüldü!")
+        return
+    if not days.isdigit() or not 7 <= int(days) <= 3650:
+        await ctx.send("❌ Saklama süresi 7 ile 3650 gün arasında olmalıdır!")
+        return
+
+    await db.set_retention(ctx.guild.id, int(days))
+    await ctx.send(f"✅ Ham kayıtlar {days} gün saklanacak! (İstatistik sayaçları etkilenmez)")
+
 @bot.command(name='stats-sifirla')
 @is_owner()
 async def reset_user_stats(ctx, member: discord.Member):
@@ -261,13 +440,16 @@ async def server_stats(ctx, period: str = 'günlük'):
         color=discord.Color.blue()
     )
     
-    # Sunucu bilgileri
+    # Sunucu bilgileri (sayaçlardan; üye listesi taranmaz)
+    online = await presence.online(guild.id, lambda: bot.fetch_guild(guild.id, with_counts=True))
+    bots = presence.bots(guild.id)
     stats_embed.set_thumbnail(url=guild.icon.url if guild.icon else None)
     stats_embed.add_field(
         name="👥 Üye Bilgileri",
         value=f"👤 Toplam: {guild.member_count}\n"
-              f"🟢 Çevrimiçi: {sum(1 for m in guild.members if m.status != discord.Status.offline)}\n"
-              f"🤖 Bot: {sum(1 for m in guild.members if m.bot)}",
+              f"🟢 Çevrimiçi: {'?' if online is None else online}"
+              f"{'' if presence.track_presence and bots is not None else ' (yaklaşık)'}\n"
+              f"🤖 Bot: {'?' if bots is None else bots}",
         inline=True
     )
     
@@ -319,21 +501,20 @@ async def level(ctx, member: discord.Member = None):
 @bot.command(name='liderlik')
 async def leaderboard(ctx):
     """Sunucu liderlik tablosunu gösterir"""
-    top_users = await db.get_top_users(ctx.guild.id)
+    # Ayrılan kullanıcılar atlanır, liste fazladan çekilen satırlarla 10'a tamamlanır
+    top_users = await db.names.rank(ctx.guild, lambda limit: db.get_top_users(ctx.guild.id, limit))
     
     leaderboard_embed = discord.Embed(
         title="Sunucu Liderlik Tablosu",
         color=discord.Color.gold()
     )
     
-    for i, (user_id, xp, level) in enumerate(top_users, 1):
-        member = ctx.guild.get_member(user_id)
-        if member:
-            leaderboard_embed.add_field(
-                name=f"{i}. {member.name}",
-                value=f"Seviye: {level} | XP: {xp}",
-                inline=False
-            )
+    for i, (name, (user_id, xp, level)) in enumerate(top_users, 1):
+        leaderboard_embed.add_field(
+            name=f"{i}. {name}",
+            value=f"Seviye: {level} | XP: {xp}",
+            inline=False
+        )
     
     await ctx.send(embed=leaderboard_embed)
 
@@ -344,7 +525,11 @@ async def activity_graph(ctx, days: int = 7):
         await ctx.send("En fazla 30 günlük grafik görüntüleyebilirsiniz.")
         return
 
-    buf = await db.generate_activity_graph(ctx.guild.id, days)
+    try:
+        buf = await db.generate_activity_graph(ctx.guild.id, days)
+    except ChartQueueFull:
+        await ctx.send("⏳ Şu anda çok fazla grafik hazırlanıyor, lütfen biraz sonra tekrar deneyin.")
+        return
     
     file = discord.File(buf, filename="activity_graph.png")
     await ctx.send(f"Son {days} günün aktivite grafiği:", file=file)
@@ -377,7 +562,13 @@ async def channel_stats(ctx, channel: discord.TextChannel = None, period: str =
     if channel is None:
         channel = ctx.channel
     
-    stats = await db.get_channel_stats(channel.id, ctx.guild.id, period)
+    # Tek sorgu: en aktif kullanıcılar ayrılanlar atlanabilsin diye fazladan getirilir
+    stats = await db.get_channel_stats(channel.id, ctx.guild.id, period, fetch_size(5))
+
+    async def channel_top_users(limit):
+        return (await db.get_channel_stats(channel.id, ctx.guild.id, period, limit)).top_users
+
+    top_users = await db.names.rank(ctx.guild, channel_top_users, limit=5, rows=stats.top_users)
     
     channel_embed = discord.Embed(
         title=f"#{channel.name} İstatistikleri ({period})",
@@ -387,17 +578,17 @@ async def channel_stats(ctx, channel: discord.TextChannel = None, period: str =
     # Temel istatistikler
     channel_embed.add_field(
         name="Toplam Mesaj",
-        value=str(stats['message_count']),
+        value=str(stats.message_count),
         inline=True
     )
     channel_embed.add_field(
         name="Aktif Kullanıcılar",
-        value=str(stats['active_users']),
+        value=str(stats.active_users),
         inline=True
     )
     
     # En aktif saatler
-    peak_hours_text = "\n".join([f"{hour}:00 - {count} mesaj" for hour, count in stats['peak_hours']])
+    peak_hours_text = "\n".join([f"{hour}:00 - {count} mesaj" for hour, count in stats.peak_hours])
     channel_embed.add_field(
         name="En Aktif Saatler",
         value=peak_hours_text or "Veri yok",
@@ -406,10 +597,8 @@ async def channel_stats(ctx, channel: discord.TextChannel = None, period: str =
     
     # En aktif kullanıcılar
     top_users_text = ""
-    for user_id, count in stats['top_users']:
-        member = ctx.guild.get_member(user_id)
-        if member:
-            top_users_text += f"{member.name}: {count} mesaj\n"
+    for name, (user_id, count) in top_users:
+        top_users_text += f"{name}: {count} mesaj\n"
     
     channel_embed.add_field(
         name="En Aktif Kullanıcılar",
@@ -419,6 +608,37 @@ async def channel_stats(ctx, channel: discord.TextChannel = None, period: str =
     
     await ctx.send(embed=channel_embed)
 
+@bot.command(name='kanallar')
+async def channels_overview(ctx, period: str = 'günlük'):
+    """
+    Sunucudaki en aktif metin kanallarını gösterir
+    Kullanım: !kanallar günlük/haftalık/aylık
+    """
+    # Tüm kanalların istatistikleri tek sorguda hesaplanır
+    stats = await db.get_channels_stats(ctx.guild.id, None, period)
+    ranked = sorted(stats.values(), key=lambda item: item.message_count, reverse=True)
+
+    overview_embed = discord.Embed(
+        title=f"Kanal Genel Bakışı ({period})",
+        color=discord.Color.green()
+    )
+
+    lines = []
+    for channel_stats in ranked:
+        channel = ctx.guild.get_channel(channel_stats.channel_id)
+        if channel is None:
+            continue
+        peak = f", en yoğun saat {channel_stats.peak_hours[0][0]}:00" if channel_stats.peak_hours else ""
+        lines.append(
+            f"#{channel.name}: {channel_stats.message_count} mesaj, "
+            f"{channel_stats.active_users} aktif kullanıcı{peak}"
+        )
+        if len(lines) == 10:
+            break
+
+    overview_embed.description = "\n".join(lines) or "Veri yok"
+    await ctx.send(embed=overview_embed)
+
 # Sesli sıralama komutları
 @bot.command(name='g-s')
 async def daily_voice(ctx):
@@ -453,44 +673,44 @@ async def monthly_messages(ctx):
 
 async def send_voice_leaderboard(ctx, period: str):
     """Sesli sıralama gönderme yardımcı fonksiyonu"""
-    leaderboard = await db.get_voice_leaderboard(ctx.guild.id, period)
+    leaderboard = await db.names.rank(
+        ctx.guild, lambda limit: db.get_voice_leaderboard(ctx.guild.id, period, limit)
+    )
     
     embed = discord.Embed(
         title=f"Sesli Sıralama ({period})",
         color=discord.Color.purple()
     )
     
-    for i, (user_id, minutes) in enumerate(leaderboard, 1):
-        member = ctx.guild.get_member(user_id)
-        if member:
-            hours = minutes // 60
-            remaining_minutes = minutes % 60
-            time_str = f"{hours} saat {remaining_minutes} dakika" if hours > 0 else f"{minutes} dakika"
-            embed.add_field(
-                name=f"{i}. {member.name}",
-                value=time_str,
-                inline=False
-            )
+    for i, (name, (user_id, minutes)) in enumerate(leaderboard, 1):
+        hours = minutes // 60
+        remaining_minutes = minutes % 60
+        time_str = f"{hours} saat {remaining_minutes} dakika" if hours > 0 else f"{minutes} dakika"
+        embed.add_field(
+            name=f"{i}. {name}",
+            value=time_str,
+            inline=False
+        )
     
     await ctx.send(embed=embed)
 
 async def send_message_leaderboard(ctx, period: str):
     """Mesaj sıralaması gönderme yardımcı fonksiyonu"""
-    leaderboard = await db.get_message_leaderboard(ctx.guild.id, period)
+    leaderboard = await db.names.rank(
+        ctx.guild, lambda limit: db.get_message_leaderboard(ctx.guild.id, period, limit)
+    )
     
     embed = discord.Embed(
         title=f"Mesaj Sıralaması ({period})",
         color=discord.Color.blue()
     )
     
-    for i, (user_id, message_count) in enumerate(leaderboard, 1):
-        member = ctx.guild.get_member(user_id)
-        if member:
-            embed.add_field(
-                name=f"{i}. {member.name}",
-                value=f"{message_count} mesaj",
-                inline=False
-            )
+    for i, (name, (user_id, message_count)) in enumerate(leaderboard, 1):
+        embed.add_field(
+            name=f"{i}. {name}",
+            value=f"{message_count} mesaj",
+            inline=False
+        )
     
     await ctx.send(embed=embed)
 
@@ -508,8 +728,10 @@ async def custom_help(ctx):
         name="📊 Genel İstatistikler",
         value="""
         `!istatistik [günlük/haftalık/aylık]` - Sunucu istatistikleri
+        Periyot olarak `bugün`, `bu-hafta`, `bu-ay` ya da `2024-01-01..2024-01-31` de kullanılabilir
         `!kullanıcı [@kullanıcı]` - Kullanıcı istatistikleri
         `!kanal [#kanal] [günlük/haftalık/aylık]` - Kanal detaylı istatistikleri
+        `!kanallar [günlük/haftalık/aylık]` - En aktif kanalların genel bakışı
         """,
         inline=False
     )
@@ -556,25 +778,23 @@ async def custom_help(ctx):
 @bot.command(name='top-stats')
 async def permanent_stats(ctx):
     """Tüm zamanların en iyi istatistiklerini gösterir"""
-    stats = await db.get_permanent_stats(ctx.guild.id)
+    stats = await db.names.rank(ctx.guild, lambda limit: db.get_permanent_stats(ctx.guild.id, limit))
     
     embed = discord.Embed(
         title="🏆 Tüm Zamanların En İyileri",
         color=discord.Color.gold()
     )
     
-    for i, (user_id, messages, voice_minutes) in enumerate(stats, 1):
-        member = ctx.guild.get_member(user_id)
-        if member:
-            hours = voice_minutes // 60
-            remaining_minutes = voice_minutes % 60
-            voice_str = f"{hours}s {remaining_minutes}d" if hours > 0 else f"{voice_minutes}d"
-            
-            embed.add_field(
-                name=f"{i}. {member.name}",
-                value=f"📝 {messages} mesaj\n🎤 {voice_str}",
-                inline=False
-            )
+    for i, (name, (user_id, messages, voice_minutes)) in enumerate(stats, 1):
+        hours = voice_minutes // 60
+        remaining_minutes = voice_minutes % 60
+        voice_str = f"{hours}s {remaining_minutes}d" if hours > 0 else f"{voice_minutes}d"
+        
+        embed.add_field(
+            name=f"{i}. {name}",
+            value=f"📝 {messages} mesaj\n🎤 {voice_str}",
+            inline=False
+        )
     
     await ctx.send(embed=embed)
 
@@ -614,5 +834,110 @@ async def clear(ctx, amount: int):
     await asyncio.sleep(5)
     await info_message.delete()
 
-# Botu çalıştır
-bot.run(os.getenv('DISCORD_TOKEN')) 
\ No newline at end of file
+@bot.command(name='perf')
+@commands.is_owner()
+async def perf(ctx):
+    """Süre, kuyruk ve önbellek ölçümlerinin özetini gösterir (Sadece bot sahibi kullanabilir)"""
+    if not metrics.enabled:
+        await ctx.send("❌ Metrikler kapalı! `.env` dosyasında `METRICS_ENABLED=true` ayarlayın.")
+        return
+
+    def timings(name: str, limit: int) -> str:
+        rows = metrics.summary(name, limit)
+        if not rows:
+            return "Henüz ölçüm yok"
+        return "\n".join(
+            f"`{label}` {count}× ort. {mean * 1000:.1f}ms p99 {p99 * 1000:.1f}ms"
+            for label, count, mean, p99 in rows
+        )
+
+    embed = discord.Embed(
+        title="⏱️ Performans Özeti",
+        description="Toplam süreye göre en pahalı işler",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="📨 Olaylar", value=timings('event_handler_seconds', 5), inline=False)
+    embed.add_field(name="💬 Komutlar", value=timings('command_seconds', 5), inline=False)
+    embed.add_field(name="🗄️ Veritabanı", value=timings('database_method_seconds', 8), inline=False)
+
+    stats = db.component_stats()
+    embed.add_field(
+        name="📥 Kuyruklar",
+        value=f"Yazılmayı bekleyen olay: {stats['ingest']['pending_rows']}\n"
+              f"Kaydedilmemiş XP: {stats['xp']['dirty_users']}\n"
+              f"Açık ses oturumu: {stats['voice']['open_sessions']}\n"
+              f"Grafik kuyruğu: {stats['charts']['pending']}\n"
+              f"Seviye duyurusu: {len(announcer)}\n"
+              f"Sıfırlama işareti: {stats['resets']['pending_markers']}",
+        inline=True
+    )
+    embed.add_field(
+        name="🎯 Önbellek ve Havuz",
+        value=f"İsabet oranı: %{stats['cache']['hit_rate'] * 100:.1f}\n"
+              f"Kayıt: {stats['cache']['size']}\n"
+              f"Okuyucu bekleme: {stats['pool']['reader_wait_avg_ms']}ms\n"
+              f"Yazıcı bekleme: {stats['pool']['writer_wait_avg_ms']}ms",
+        inline=True
+    )
+    lag = metrics.summary('event_loop_lag_seconds', 1)
+    embed.add_field(
+        name="🔁 Olay Döngüsü",
+        value=f"Son gecikme: {metrics.loop_lag * 1000:.1f}ms\n"
+              f"p99: {lag[0][3] * 1000 if lag else 0:.1f}ms",
+        inline=True
+    )
+
+    await ctx.send(embed=embed)
+
+if metrics.enabled:
+    # Tüm olay işleyicileri ve komutlar tanımlandıktan sonra sarmalanır
+    metrics.instrument(db, 'database_method_seconds')
+    metrics.instrument_events(bot, ('on_ready', 'on_message', 'on_voice_state_update', 'on_reaction_add',
+                                    'on_guild_available', 'on_guild_join', 'on_guild_unavailable',
+                                    'on_guild_remove', 'on_presence_update', 'on_member_join',
+                                    'on_raw_member_remove', 'on_user_update', 'on_member_update'))
+    metrics.instrument_commands(bot)
+
+async def main():
+    """Botu başlat ve kapanışta veritabanı bağlantılarını kapat"""
+    token = os.getenv('DISCORD_TOKEN')
+    async with bot:
+        if SHARDED:
+            # Shard sayısı, kuyruklar ve ses kurtarma shard'lara göre ayarlanabilsin diye önce öğrenilir
+            await bot.login(token)
+            if bot.shard_count is None:
+                bot.shard_count, _ = await bot.http.get_bot_gateway()
+            db.configure_shards(bot.shard_count, bot.shard_ids)
+            print(f'Shard düzeni: {describe(bot.shard_count, bot.shard_ids)}')
+        # Olaylar gelmeden önce veritabanı hazır olmalı
+        await db.setup(startup)
+        # Shard süreçleri aynı makinede çalışabilir: her süreç port + ilk shard numarasını dinler
+        metrics_port = optional_int('METRICS_PORT')
+        if metrics_port and SHARD_IDS:
+            metrics_port += SHARD_IDS[0]
+        await metrics.start(os.getenv('METRICS_HOST') or '127.0.0.1', metrics_port)
+        try:
+            startup.begin('gateway')
+            if SHARDED:
+                await bot.connect()
+            else:
+                await bot.start(token)
+        finally:
+            await announcer.close()
+            await metrics.close()
+            await db.close()
+
+def run_supervisor():
+    """Shard gruplarını ayrı süreçlerde başlat"""
+    shard_count = int(SHARD_COUNT) if SHARD_COUNT.isdigit() else asyncio.run(
+        recommended_shard_count(os.getenv('DISCORD_TOKEN'))
+    )
+    raise SystemExit(run_shard_processes(os.path.abspath(__file__), shard_count, SHARD_PROCESSES))
+
+# Botu çalıştır (grafik işçi süreçleri bu dosyayı içe aktardığında bot başlamasın)
+if __name__ == '__main__':
+    discord.utils.setup_logging()
+    if SHARD_PROCESSES > 1 and SHARD_IDS is None:
+        run_supervisor()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,260 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# Prometheus metrik adlarının ortak öneki
+PREFIX = 'discord_stats_'
+
+# Gecikme histogramlarının üst sınırları (saniye)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Olay döngüsü gecikmesinin ölçülme aralığı (saniye)
+LOOP_LAG_INTERVAL = 0.5
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Sabit kovalı gecikme histogramı"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # Son kova +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction: float) -> float:
+        """Kovalardan doğrusal ara değerle yaklaşık yüzdelik (Prometheus histogram_quantile gibi)"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def _labels(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def flatten(prefix: str, stats: Dict, labels: Optional[Dict[str, object]] = None) -> List[Tuple[str, Dict, float]]:
+    """İç içe istatistik sözlüğünü (ad, etiketler, değer) göstergelerine çevir"""
+    gauges = []
+    labels = labels or {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            if all(isinstance(inner, int) for inner in value):
+                # {shard: {...}} biçimi: shard bir etiket olur
+                for shard, shard_stats in value.items():
+                    gauges.extend(flatten(prefix, shard_stats, dict(labels, shard=shard)))
+            else:
+                gauges.extend(flatten(f'{prefix}_{key}', value, labels))
+        elif isinstance(value, (bool, int, float)):
+            gauges.append((f'{prefix}_{key}', labels, float(value)))
+    return gauges
+
+
+class Metrics:
+    """Süre histogramları, sayaçlar ve anlık göstergeler; kapalıyken hiçbir şey sarmalanmaz"""
+
+    def __init__(self, enabled: bool = False, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+        # Her kazımada çağrılır ve {bileşen: istatistikler} sözlüğü döndürür
+        self._collectors: List[Callable[[], Dict]] = []
+        self.loop_lag = 0.0
+        self._lag_task = None
+        self._runner = None
+
+    def _histogram(self, key: Tuple[str, LabelKey]) -> Histogram:
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels):
+        self._histogram((name, _labels(labels))).observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def collector(self, func: Callable[[], Dict]):
+        """Kazıma anında okunacak bileşen istatistiklerini kaydet"""
+        self._collectors.append(func)
+
+    def wrap(self, func: Callable, name: str, **labels) -> Callable:
+        """Eşzamansız fonksiyonu süresini ölçen bir sarmalayıcıyla değiştir"""
+        key = (name, _labels(labels))
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self._histogram(key).observe(time.perf_counter() - started)
+        return wrapper
+
+    def instrument(self, obj, name: str, label: str = 'method'):
+        """Nesnenin herkese açık tüm eşzamansız metotlarını ölç (yalnızca açıkken çağrılır)"""
+        for attr in dir(obj):
+            if attr.startswith('_'):
+                continue
+            method = getattr(obj, attr)
+            if inspect.iscoroutinefunction(method):
+                setattr(obj, attr, self.wrap(method, name, **{label: attr}))
+
+    def instrument_events(self, bot, events: Iterable[str]):
+        """bot.event ile kaydedilmiş olay işleyicilerini ölç"""
+        for event in events:
+            handler = getattr(bot, event, None)
+            if handler is not None:
+                setattr(bot, event, self.wrap(handler, 'event_handler_seconds', event=event))
+
+    def instrument_commands(self, bot):
+        """Komut sürelerini ve hatalarını bot'un genel komut kancalarıyla ölç"""
+        async def before(ctx):
+            ctx.metrics_started = time.perf_counter()
+
+        async def after(ctx):
+            started = getattr(ctx, 'metrics_started', None)
+            if started is None:
+                return
+            command = ctx.command.qualified_name
+            self.observe('command_seconds', time.perf_counter() - started, command=command)
+            if ctx.command_failed:
+                self.inc('command_errors_total', command=command)
+
+        bot.before_invoke(before)
+        bot.after_invoke(after)
+
+    async def start(self, host: Optional[str] = None, port: Optional[int] = None):
+        """Olay döngüsü gecikmesi ölçümünü ve (port verildiyse) /metrics sunucusunu başlat"""
+        if not self.enabled:
+            return
+        if self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._measure_lag())
+        if port and self._runner is None:
+            from aiohttp import web
+
+            app = web.Application()
+            app.router.add_get('/metrics', self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, host or '127.0.0.1', port).start()
+            log.info('Metrikler http://%s:%d/metrics adresinde', host or '127.0.0.1', port)
+
+    async def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            # Uyanmadaki gecikme, döngüyü tıkayan işlerin süresidir
+            self.loop_lag = max(0.0, loop.time() - expected)
+            self.observe('event_loop_lag_seconds', self.loop_lag)
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    def gauges(self) -> List[Tuple[str, Dict, float]]:
+        """Kayıtlı bileşenlerin anlık göstergeleri"""
+        gauges = [('event_loop_lag_last_seconds', {}, self.loop_lag)]
+        for collect in self._collectors:
+            try:
+                for component, stats in collect().items():
+                    gauges.extend(flatten(component, stats))
+            except Exception:
+                log.exception('Metrik toplayıcı başarısız oldu')
+        return gauges
+
+    def render(self) -> str:
+        """Prometheus metin biçiminde tüm metrikler"""
+        lines = []
+        typed = set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            full = PREFIX + name
+            declare(full, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{full}_bucket{_format_labels(labels, ("le", repr(bound)))} {cumulative}')
+            lines.append(f'{full}_bucket{_format_labels(labels, ("le", "+Inf"))} {histogram.count}')
+            lines.append(f'{full}_sum{_format_labels(labels)} {histogram.sum}')
+            lines.append(f'{full}_count{_format_labels(labels)} {histogram.count}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            full = PREFIX + name
+            declare(full, 'counter')
+            lines.append(f'{full}{_format_labels(labels)} {value}')
+
+        for name, labels, value in self.gauges():
+            full = PREFIX + name
+            declare(full, 'gauge')
+            lines.append(f'{full}{_format_labels(_labels(labels))} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, name: str, limit: int = 5) -> List[Tuple[str, int, float, float]]:
+        """Histogramları en yüksek toplam süreye göre sırala: (etiket, sayı, ortalama, p99)"""
+        rows = [
+            (','.join(value for _, value in labels) or name, histogram.count, histogram.mean,
+             histogram.quantile(0.99), histogram.sum)
+            for (metric, labels), histogram in self.histograms.items()
+            if metric == name and histogram.count
+        ]
+        rows.sort(key=lambda row: row[4], reverse=True)
+        return [row[:4] for row in rows[:limit]]
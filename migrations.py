@@ -0,0 +1,289 @@
+import logging
+from typing import Awaitable, Callable, List, Tuple, Union
+
+import aiosqlite
+
+import rollups
+
+log = logging.getLogger(__name__)
+
+# Bir adım ya düz SQL ya da bağlantıyı alan bir async fonksiyondur
+Step = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+# (sürüm, açıklama, adımlar) - sürümler PRAGMA user_version ile takip edilir.
+# Yeni şema değişiklikleri her zaman listenin sonuna yeni bir sürüm olarak eklenir;
+# aynı sürüm storage_postgres.MIGRATIONS listesine de PostgreSQL söz dizimiyle eklenmelidir.
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, 'Temel tablolar', [
+        # Mesaj tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            channel_id INTEGER,
+            guild_id INTEGER,
+            timestamp DATETIME,
+            content_length INTEGER
+        )
+        ''',
+        # Sesli kanal tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS voice_activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            channel_id INTEGER,
+            guild_id INTEGER,
+            join_time DATETIME,
+            leave_time DATETIME
+        )
+        ''',
+        # Emoji tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS emoji_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            guild_id INTEGER,
+            emoji_id TEXT,
+            emoji_name TEXT,
+            timestamp DATETIME
+        )
+        ''',
+        # Rol tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS role_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            guild_id INTEGER,
+            role_id INTEGER,
+            action TEXT,
+            timestamp DATETIME
+        )
+        ''',
+        # Seviye tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS user_levels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            guild_id INTEGER,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 0,
+            last_message_time DATETIME
+        )
+        ''',
+        # Haftalık periyot tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS weekly_periods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_time DATETIME,
+            end_time DATETIME,
+            is_current BOOLEAN DEFAULT 0
+        )
+        ''',
+        # Kalıcı istatistik tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS permanent_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            guild_id INTEGER,
+            total_messages INTEGER DEFAULT 0,
+            total_voice_minutes INTEGER DEFAULT 0,
+            last_updated DATETIME,
+            UNIQUE(user_id, guild_id)
+        )
+        ''',
+        # XP oranları tablosu
+        '''
+        CREATE TABLE IF NOT EXISTS xp_rates (
+            guild_id INTEGER PRIMARY KEY,
+            xp_per_message REAL DEFAULT 10.0
+        )
+        ''',
+    ]),
+    (2, 'İstatistik sorguları için indeksler', [
+        # Sunucu geneli mesaj sayıları ve sıralamalar
+        'CREATE INDEX IF NOT EXISTS idx_messages_guild_time ON messages (guild_id, timestamp, user_id)',
+        # Kanal istatistikleri
+        'CREATE INDEX IF NOT EXISTS idx_messages_guild_channel_time ON messages (guild_id, channel_id, timestamp, user_id)',
+        # Kullanıcı mesaj sayısı
+        'CREATE INDEX IF NOT EXISTS idx_messages_guild_user ON messages (guild_id, user_id)',
+        # Sesli sıralama
+        'CREATE INDEX IF NOT EXISTS idx_voice_guild_join ON voice_activity (guild_id, join_time, user_id, leave_time)',
+        # Kullanıcı ses süresi ve açık oturumları kapatma
+        'CREATE INDEX IF NOT EXISTS idx_voice_guild_user ON voice_activity (guild_id, user_id, channel_id, leave_time)',
+        'CREATE INDEX IF NOT EXISTS idx_emoji_guild_name ON emoji_usage (guild_id, emoji_name)',
+        'CREATE INDEX IF NOT EXISTS idx_emoji_guild_user ON emoji_usage (guild_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_roles_guild_user ON role_history (guild_id, user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_levels_guild_user ON user_levels (guild_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_levels_guild_rank ON user_levels (guild_id, level DESC, xp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_weekly_current ON weekly_periods (is_current)',
+        'ANALYZE',
+    ]),
+    (3, 'Saatlik mesaj ve ses özet tabloları', [
+        '''
+        CREATE TABLE IF NOT EXISTS message_rollup_hourly (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            hour TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, channel_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS voice_rollup_hourly (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            hour TEXT NOT NULL,
+            voice_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, channel_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_msg_rollup_channel ON message_rollup_hourly (guild_id, channel_id, hour)',
+        'CREATE INDEX IF NOT EXISTS idx_msg_rollup_user ON message_rollup_hourly (guild_id, user_id, hour)',
+        'CREATE INDEX IF NOT EXISTS idx_voice_rollup_user ON voice_rollup_hourly (guild_id, user_id, hour)',
+        rollups.backfill,
+    ]),
+    (4, 'user_levels tekrar eden satırları temizle ve benzersiz anahtar ekle', [
+        # Eski INSERT OR IGNORE her mesajda yeni satır ekliyordu; kullanıcı başına en yüksek değerleri tut
+        '''
+        CREATE TEMP TABLE user_levels_dedup AS
+        SELECT MIN(id) as id, user_id, guild_id, MAX(xp) as xp, MAX(level) as level,
+               MAX(last_message_time) as last_message_time
+        FROM user_levels
+        GROUP BY user_id, guild_id
+        ''',
+        'DELETE FROM user_levels',
+        '''
+        INSERT INTO user_levels (id, user_id, guild_id, xp, level, last_message_time)
+        SELECT id, user_id, guild_id, xp, level, last_message_time FROM temp.user_levels_dedup
+        ''',
+        'DROP TABLE temp.user_levels_dedup',
+        'DROP INDEX IF EXISTS idx_levels_guild_user',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_levels_user_guild ON user_levels (user_id, guild_id)',
+    ]),
+    (5, 'Ses oturumu kurtarma için kalp atışı tablosu ve açık oturum indeksi', [
+        '''
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+        ''',
+        # Yalnızca açık oturumları içerir; kurtarma taraması tablo boyutundan bağımsız kalır
+        '''
+        CREATE INDEX IF NOT EXISTS idx_voice_open ON voice_activity (guild_id, user_id, join_time, channel_id)
+        WHERE leave_time IS NULL
+        ''',
+    ]),
+    (6, 'Sunucu ayarları (saat dilimi)', [
+        '''
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id INTEGER PRIMARY KEY,
+            timezone TEXT
+        )
+        ''',
+    ]),
+    (7, 'Aylık ham olay bölümleri, saklama süresi ve emoji özeti', [
+        # Ham olaylar partitions.PartitionRouter ile aylık tablolara yazılır; bu tablo bölümlerin kaydıdır
+        '''
+        CREATE TABLE IF NOT EXISTS event_partitions (
+            base TEXT NOT NULL,
+            month TEXT NOT NULL,
+            PRIMARY KEY (base, month)
+        ) WITHOUT ROWID
+        ''',
+        # Ham olayların gün cinsinden saklama süresi (NULL: varsayılan)
+        'ALTER TABLE guild_settings ADD COLUMN retention_days INTEGER',
+        '''
+        CREATE TABLE IF NOT EXISTS emoji_rollup (
+            guild_id INTEGER NOT NULL,
+            emoji_name TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, emoji_name, user_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO emoji_rollup (guild_id, emoji_name, user_id, usage_count)
+        SELECT COALESCE(guild_id, 0), COALESCE(emoji_name, ''), COALESCE(user_id, 0), COUNT(*)
+        FROM emoji_usage
+        GROUP BY 1, 2, 3
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_emoji_rollup_user ON emoji_rollup (guild_id, user_id)',
+    ]),
+    (8, 'Sıfırlama işaretleri', [
+        # resets.ResetCompactor: işaretli aralıklar sorgularda gizlenir, arka planda silinir
+        '''
+        CREATE TABLE IF NOT EXISTS reset_markers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER,
+            since DATETIME,
+            until DATETIME NOT NULL,
+            since_hour TEXT,
+            until_hour TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_reset_markers_guild ON reset_markers (guild_id, user_id)',
+    ]),
+    (9, 'Üye adları', [
+        # names.NameResolver: sıralamalarda üye önbelleğinde olmayan kullanıcıların adları
+        '''
+        CREATE TABLE IF NOT EXISTS member_names (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            display_name TEXT,
+            is_member INTEGER NOT NULL DEFAULT 1,
+            updated_at DATETIME,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (10, 'Aktif kullanıcı taslakları', [
+        # sketches.ActiveUserSketches: sunucu (channel_id = 0) ve kanal başına saatlik/günlük
+        # HyperLogLog taslakları; eski özet satırlarının taslakları açılışta arka planda üretilir
+        '''
+        CREATE TABLE IF NOT EXISTS active_user_sketches (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            grain INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (guild_id, grain, bucket, channel_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_version(db: aiosqlite.Connection) -> int:
+    """Veritabanının şema sürümünü getir"""
+    async with db.execute('PRAGMA user_version') as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def migrate(db: aiosqlite.Connection) -> List[int]:
+    """Bekleyen sürümleri sırayla uygula, uygulanan sürümleri döndür"""
+    current = await get_version(db)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        log.info('Şema sürümü %d uygulanıyor: %s', version, description)
+        # DDL komutları da geri alınabilsin diye işlemi açıkça başlat
+        await db.execute('BEGIN')
+        try:
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+            await db.execute(f'PRAGMA user_version = {version}')
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        applied.append(version)
+    return applied
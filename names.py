@@ -0,0 +1,222 @@
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from connection_pool import ConnectionPool
+
+log = logging.getLogger(__name__)
+
+# guild.query_members tek istekte en fazla 100 kullanıcı kabul eder
+QUERY_BATCH = 100
+
+# Sıralamalar ayrılmış kullanıcılar için limitin bu katı satırla istenir
+FETCH_FACTOR = 2
+
+# Sıralamada eksik kalan satırlar için en fazla bu kadar satır istenir
+MAX_FETCH = 200
+
+UPSERT_NAME = '''
+    INSERT INTO member_names (guild_id, user_id, display_name, is_member, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+        display_name = COALESCE(excluded.display_name, member_names.display_name),
+        is_member = excluded.is_member,
+        updated_at = excluded.updated_at
+'''
+
+
+def fetch_size(limit: int) -> int:
+    """`limit` satırlık sıralama için ilk istekte getirilen satır sayısı"""
+    return limit * FETCH_FACTOR
+
+
+class NameResolver:
+    """Sıralamalardaki kullanıcı adlarını üye önbelleği, LRU, member_names tablosu ve toplu üye sorgusuyla çözer"""
+
+    def __init__(self, pool: ConnectionPool, checkpoint_interval: float = 30.0, max_entries: int = 50000):
+        self.pool = pool
+        self.checkpoint_interval = checkpoint_interval
+        self.max_entries = max_entries
+
+        # (guild_id, user_id) -> görünen ad (None: sunucudan ayrılmış), en son kullanılan sonda
+        self._names: 'OrderedDict[Tuple[int, int], Optional[str]]' = OrderedDict()
+        # Veritabanına yazılmayı bekleyen değişiklikler
+        self._dirty: Dict[Tuple[int, int], Optional[str]] = {}
+        self._checkpoint_lock: Optional[asyncio.Lock] = None
+        self._task = None
+
+        self.hits = 0
+        self.loaded = 0
+        self.queried = 0
+        self.query_failures = 0
+        self.checkpointed_rows = 0
+
+    def start(self):
+        """Periyodik kayıt görevini başlat"""
+        if self._task is None:
+            self._checkpoint_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Kayıt görevini durdur ve bekleyen adları yaz"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.checkpoint()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception:
+                log.exception('Üye adları kaydedilemedi, sonraki turda tekrar denenecek')
+
+    def _store(self, key: Tuple[int, int], name: Optional[str]):
+        self._names[key] = name
+        self._names.move_to_end(key)
+        while len(self._names) > self.max_entries:
+            self._names.popitem(last=False)
+
+    def remember(self, guild_id: int, user_id: int, name: str):
+        """Gateway olayından gelen görünen adı kaydet (yalnızca değiştiyse yazılır)"""
+        key = (guild_id, user_id)
+        if self._names.get(key) == name:
+            self._names.move_to_end(key)
+            return
+        self._store(key, name)
+        self._dirty[key] = name
+
+    def left(self, guild_id: int, user_id: int):
+        """Kullanıcı sunucudan ayrıldı; sıralamalarda atlanır"""
+        key = (guild_id, user_id)
+        self._store(key, None)
+        self._dirty[key] = None
+
+    async def resolve(self, guild, user_ids: Sequence[int]) -> Dict[int, str]:
+        """Sunucuda olan kullanıcıların görünen adlarını getir; ayrılmış kullanıcılar sonuçta yer almaz"""
+        names: Dict[int, str] = {}
+        missing: List[int] = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member is not None:
+                names[user_id] = member.display_name
+                self.remember(guild.id, user_id, member.display_name)
+                continue
+            key = (guild.id, user_id)
+            if key in self._names:
+                self._names.move_to_end(key)
+                self.hits += 1
+                if self._names[key] is not None:
+                    names[user_id] = self._names[key]
+                continue
+            missing.append(user_id)
+
+        if missing:
+            missing = await self._load(guild.id, missing, names)
+        if missing:
+            await self._query(guild, missing, names)
+        return names
+
+    async def _load(self, guild_id: int, user_ids: List[int], names: Dict[int, str]) -> List[int]:
+        """Adları tablodan toplu yükle, tabloda olmayanları döndür"""
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT user_id, display_name, is_member FROM member_names
+                WHERE guild_id = ? AND user_id IN ({','.join('?' * len(user_ids))})
+            ''', (guild_id, *user_ids)) as cursor:
+                rows = await cursor.fetchall()
+        found = set()
+        for user_id, name, is_member in rows:
+            found.add(user_id)
+            self.loaded += 1
+            if is_member and name:
+                self._store((guild_id, user_id), name)
+                names[user_id] = name
+            elif not is_member:
+                self._store((guild_id, user_id), None)
+        return [user_id for user_id in user_ids if user_id not in found]
+
+    async def _query(self, guild, user_ids: List[int], names: Dict[int, str]):
+        """Bilinmeyen kullanıcıları gateway üzerinden 100'erli gruplar halinde sorgula"""
+        for start in range(0, len(user_ids), QUERY_BATCH):
+            batch = user_ids[start:start + QUERY_BATCH]
+            try:
+                # cache=False: sonuçlar üye önbelleğini büyütmez, yalnızca adlar saklanır
+                members = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+            except Exception:
+                # Üye intent'i kapalı ya da istek zaman aşımına uğradı; bu kullanıcılar bu sefer atlanır
+                self.query_failures += 1
+                log.debug('Üye sorgusu başarısız (sunucu %s)', guild.id, exc_info=True)
+                return
+            self.queried += len(batch)
+            found = {member.id: member.display_name for member in members}
+            for user_id in batch:
+                if user_id in found:
+                    names[user_id] = found[user_id]
+                    self.remember(guild.id, user_id, found[user_id])
+                else:
+                    self.left(guild.id, user_id)
+
+    async def rank(self, guild, fetch: Callable[[int], Awaitable[List[tuple]]],
+                   limit: int = 10, rows: Optional[List[tuple]] = None) -> List[Tuple[str, tuple]]:
+        """Sıralamayı fazladan satırla getir ve ayrılmış kullanıcıları atlayarak `limit` satıra tamamla"""
+        # fetch(n): ilk sütunu user_id olan en fazla n satır döndürür;
+        # rows: elde zaten olan fetch(fetch_size(limit)) sonucu, ilk sorgu yerine kullanılır
+        fetch_limit = fetch_size(limit)
+        while True:
+            if rows is None:
+                rows = await fetch(fetch_limit)
+            names = await self.resolve(guild, [row[0] for row in rows])
+            ranked = [(names[row[0]], row) for row in rows if row[0] in names]
+            if len(ranked) >= limit or len(rows) < fetch_limit or fetch_limit >= MAX_FETCH:
+                return ranked[:limit]
+            fetch_limit = min(fetch_limit * 4, MAX_FETCH)
+            rows = None
+
+    async def checkpoint(self):
+        """Değişen adları member_names tablosuna toplu yaz"""
+        if self._checkpoint_lock is None:
+            return
+        async with self._checkpoint_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            now = datetime.datetime.now()
+            rows = [
+                (guild_id, user_id, name, 1 if name is not None else 0, now)
+                for (guild_id, user_id), name in dirty.items()
+            ]
+            try:
+                async with self.pool.writer() as db:
+                    try:
+                        await db.executemany(UPSERT_NAME, rows)
+                        await db.commit()
+                    except Exception:
+                        await db.rollback()
+                        raise
+            except Exception:
+                # Bu arada gelen daha yeni değerlerin üzerine yazma
+                for key, name in dirty.items():
+                    self._dirty.setdefault(key, name)
+                raise
+            self.checkpointed_rows += len(rows)
+
+    def stats(self) -> Dict:
+        """Ad çözümleme istatistiklerini getir"""
+        return {
+            'cached_names': len(self._names),
+            'dirty_names': len(self._dirty),
+            'hits': self.hits,
+            'loaded': self.loaded,
+            'queried': self.queried,
+            'query_failures': self.query_failures,
+            'checkpointed_rows': self.checkpointed_rows,
+        }
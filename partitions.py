@@ -0,0 +1,350 @@
+import asyncio
+import datetime
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from rollups import parse_timestamp
+
+log = logging.getLogger(__name__)
+
+# Aylık bölümlere ayrılan ham olay tabloları: sütun -> (SQLite tipi, PostgreSQL tipi).
+# Eski (bölümlemeden önceki) satırlar ana tabloda kalır ve sorgulara eklenir.
+PARTITIONED: Dict[str, Tuple[Tuple[str, str, str], ...]] = {
+    'messages': (
+        ('user_id', 'INTEGER', 'BIGINT'),
+        ('channel_id', 'INTEGER', 'BIGINT'),
+        ('guild_id', 'INTEGER', 'BIGINT'),
+        ('timestamp', 'DATETIME', 'TIMESTAMP'),
+    ),
+    'emoji_usage': (
+        ('user_id', 'INTEGER', 'BIGINT'),
+        ('guild_id', 'INTEGER', 'BIGINT'),
+        ('emoji_id', 'TEXT', 'TEXT'),
+        ('emoji_name', 'TEXT', 'TEXT'),
+        ('timestamp', 'DATETIME', 'TIMESTAMP'),
+    ),
+    'role_history': (
+        ('user_id', 'INTEGER', 'BIGINT'),
+        ('guild_id', 'INTEGER', 'BIGINT'),
+        ('role_id', 'INTEGER', 'BIGINT'),
+        ('action', 'TEXT', 'TEXT'),
+        ('timestamp', 'DATETIME', 'TIMESTAMP'),
+    ),
+}
+
+# Her bölümde oluşturulan indeksler (sunucu bazlı saklama silmeleri guild_id + timestamp kullanır)
+PARTITION_INDEXES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    'messages': (('guild_time', 'guild_id, timestamp, user_id'), ('guild_user', 'guild_id, user_id')),
+    'emoji_usage': (('guild_time', 'guild_id, timestamp'), ('guild_user', 'guild_id, user_id')),
+    'role_history': (('guild_user', 'guild_id, user_id, timestamp'), ('guild_time', 'guild_id, timestamp')),
+}
+
+# Bölümlemeye geçiş anı; ana tablolarda yalnızca bundan önceki satırlar bulunur
+SINCE_KEY = 'partitions_since'
+
+# Aynı bölümü birden çok sürecin/yazıcı hattının aynı anda oluşturmaması için
+PARTITION_LOCK_ID = 0x50415254
+
+
+def month_key(timestamp) -> str:
+    """Zaman damgasının ait olduğu ay ('YYYYMM')"""
+    if not isinstance(timestamp, datetime.datetime):
+        timestamp = parse_timestamp(timestamp)
+    return f'{timestamp.year:04d}{timestamp.month:02d}'
+
+
+def month_bounds(month: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Ayın [başlangıç, sonraki ayın başlangıcı) sınırları"""
+    start = datetime.datetime(int(month[:4]), int(month[4:]), 1)
+    return start, (start + datetime.timedelta(days=32)).replace(day=1)
+
+
+def partition_name(base: str, month: str) -> str:
+    return f'{base}_{month}'
+
+
+async def delete_range(pool, table: str, column: str, where: str, params: Sequence,
+                       since, until, chunk_size: int) -> int:
+    """[since, until) aralığını en fazla chunk_size satırlık işlemlerle sil, işlem sayısını döndür"""
+    chunks = 0
+    while True:
+        lower = f' AND {column} >= ?' if since is not None else ''
+        bounds = (*params, since) if since is not None else tuple(params)
+        async with pool.writer() as db:
+            try:
+                # Parçanın üst sınırı: aralıktaki chunk_size'ıncı satırın değeri
+                async with db.execute(f'''
+                    SELECT {column} FROM {table}
+                    WHERE {where}{lower} AND {column} < ?
+                    ORDER BY {column}
+                    LIMIT 1 OFFSET ?
+                ''', (*bounds, until, chunk_size)) as cursor:
+                    row = await cursor.fetchone()
+                boundary = row[0] if row else until
+                if since is not None and boundary == since:
+                    # Aynı değerde chunk_size'tan fazla satır var; o değer tek seferde silinir
+                    await db.execute(f'DELETE FROM {table} WHERE {where} AND {column} = ?',
+                                     (*params, boundary))
+                else:
+                    await db.execute(f'DELETE FROM {table} WHERE {where}{lower} AND {column} < ?',
+                                     (*bounds, boundary))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        chunks += 1
+        if row is None:
+            return chunks
+        since = boundary
+        # Parçalar arasında yazıcı bırakılır; diğer yazıcılar (olay kuyruğu, ses) araya girebilir
+        await asyncio.sleep(0)
+
+
+class PartitionRouter:
+    """Ham olayları aylık tablolara yönlendirir; aralık sorgularını yalnızca ilgili bölümlere yayar"""
+
+    def __init__(self, pool, retention_days: Optional[int] = None, archive: bool = False,
+                 chunk_size: int = 5000):
+        self.pool = pool
+        # Saklama silmelerinde tek işlemde silinecek en fazla satır
+        self.chunk_size = chunk_size
+        # Varsayılan saklama süresi (None: ham olaylar silinmez); sunucular guild_settings'te değiştirebilir
+        self.retention_days = retention_days
+        # Düşürülen bölümler silinmek yerine arşive taşınır
+        self.archive = archive
+        # tablo -> bilinen aylar
+        self._months: Dict[str, Set[str]] = {base: set() for base in PARTITIONED}
+        self._since: Optional[datetime.datetime] = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+        self.created = 0
+        self.dropped = 0
+        self.trimmed_guilds = 0
+        self.chunks = 0
+
+    @property
+    def dialect(self) -> str:
+        return self.pool.dialect
+
+    async def load(self):
+        """Bölüm kaydını ve bölümlemeye geçiş anını yükle"""
+        async with self.pool.writer() as db:
+            await db.execute('''
+                INSERT INTO bot_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO NOTHING
+            ''', (SINCE_KEY, str(datetime.datetime.now())))
+            await db.commit()
+            await self._reload(db)
+
+    async def refresh(self):
+        """Bölüm kaydını yeniden oku (başka bir süreç bölüm eklemiş ya da düşürmüş olabilir)"""
+        async with self.pool.reader() as db:
+            await self._reload(db)
+
+    def forget(self):
+        """Yazma işlemi geri alındığında bellekteki kaydı geçersiz say"""
+        self._loaded = False
+
+    async def prepare(self, now: Optional[datetime.datetime] = None):
+        """Bu ayın ve sonraki ayın bölümlerini önceden oluştur"""
+        now = now or datetime.datetime.now()
+        months = {month_key(now), month_key(month_bounds(month_key(now))[1])}
+        async with self.pool.writer() as db:
+            try:
+                for base in PARTITIONED:
+                    for month in sorted(months):
+                        await self.ensure(db, base, month)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                self.forget()
+                raise
+
+    async def ensure(self, db, base: str, month: str) -> str:
+        """Bölüm tablosunu gerekirse oluştur (çağıranın işlemi içinde), adını döndür"""
+        table = partition_name(base, month)
+        if self._loaded and month in self._months[base]:
+            return table
+        if self.dialect == 'postgres':
+            # İşlem bitene kadar tutulur; diğer süreçler tablo hazır olunca devam eder
+            await db.execute('SELECT pg_advisory_xact_lock(?)', (PARTITION_LOCK_ID,))
+        type_index = 2 if self.dialect == 'postgres' else 1
+        columns = ', '.join(f'{column[0]} {column[type_index]}' for column in PARTITIONED[base])
+        await db.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+        for suffix, indexed in PARTITION_INDEXES[base]:
+            await db.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{suffix} ON {table} ({indexed})')
+        await db.execute('''
+            INSERT INTO event_partitions (base, month) VALUES (?, ?)
+            ON CONFLICT(base, month) DO NOTHING
+        ''', (base, month))
+        if month not in self._months[base]:
+            self._months[base].add(month)
+            self.created += 1
+        return table
+
+    async def route(self, db, base: str, rows: Sequence[tuple]) -> List[Tuple[str, List[tuple]]]:
+        """Satırları (son sütun zaman damgası) aylara göre grupla; (bölüm tablosu, satırlar) döndür"""
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self._reload(db)
+        grouped: Dict[str, List[tuple]] = {}
+        for row in rows:
+            grouped.setdefault(month_key(row[-1]), []).append(row)
+        return [(await self.ensure(db, base, month), month_rows) for month, month_rows in sorted(grouped.items())]
+
+    async def _reload(self, db):
+        # Yazıcı bağlantısı zaten elde; kayıt aynı bağlantıdan okunur (kendi yazdığı bölümleri de görür)
+        async with db.execute('SELECT base, month FROM event_partitions') as cursor:
+            rows = await cursor.fetchall()
+        async with db.execute('SELECT value FROM bot_meta WHERE key = ?', (SINCE_KEY,)) as cursor:
+            row = await cursor.fetchone()
+        self._since = parse_timestamp(row[0]) if row else datetime.datetime.now()
+        for months in self._months.values():
+            months.clear()
+        for base, month in rows:
+            self._months.setdefault(base, set()).add(month)
+        self._loaded = True
+
+    def tables(self, base: str, start: Optional[datetime.datetime] = None,
+               end: Optional[datetime.datetime] = None) -> List[str]:
+        """[start, end) aralığıyla kesişen bölümleri (gerekirse eski ana tabloyla birlikte) getir"""
+        tables = []
+        # Ana tablo yalnızca bölümlemeden önceki satırları tutar
+        if self._since is None or start is None or start < self._since:
+            tables.append(base)
+        for month in sorted(self._months[base]):
+            month_start, month_end = month_bounds(month)
+            if (start is None or month_end > start) and (end is None or month_start < end):
+                tables.append(partition_name(base, month))
+        return tables
+
+    async def _guilds(self, table: str) -> List[int]:
+        """Tablodaki sunucular; guild_id indeksinde atlanarak bulunur (tablo taranmaz)"""
+        guild_ids: List[int] = []
+        async with self.pool.reader() as db:
+            while True:
+                lower = ' WHERE guild_id > ?' if guild_ids else ''
+                async with db.execute(f'SELECT MIN(guild_id) FROM {table}{lower}', tuple(guild_ids[-1:])) as cursor:
+                    row = await cursor.fetchone()
+                if row is None or row[0] is None:
+                    return guild_ids
+                guild_ids.append(row[0])
+
+    async def _retention_overrides(self) -> Dict[int, int]:
+        async with self.pool.reader() as db:
+            async with db.execute('''
+                SELECT guild_id, retention_days FROM guild_settings
+                WHERE retention_days IS NOT NULL
+            ''') as cursor:
+                return {guild_id: days for guild_id, days in await cursor.fetchall()}
+
+    async def apply_retention(self, now: Optional[datetime.datetime] = None) -> Dict[str, int]:
+        """Saklama süresi dolan ham olayları temizle; yalnızca süresi dolmuş sunucuların satırlarını
+        içeren aylık bölümleri düşür, diğerlerinden satırları parça parça sil"""
+        # Özet tabloları ham satırlarla aynı işlemde yazıldığı için silinen olaylar istatistiklerde kalır
+        now = now or datetime.datetime.now()
+        if not self._loaded:
+            await self.load()
+        await self.refresh()
+        overrides = await self._retention_overrides()
+        configured = [days for days in (self.retention_days, *overrides.values()) if days is not None]
+        if not configured:
+            return {'dropped_partitions': 0, 'trimmed_guilds': 0}
+
+        def cutoff(guild_id: int) -> Optional[datetime.datetime]:
+            days = overrides.get(guild_id, self.retention_days)
+            return now - datetime.timedelta(days=days) if days is not None else None
+
+        # En kısa saklama süresinin sınırından sonra başlayan bölümlerde silinecek satır yoktur
+        horizon = now - datetime.timedelta(days=min(configured))
+        dropped: List[str] = []
+        trimmed: Set[int] = set()
+        for base in PARTITIONED:
+            for month in sorted(self._months[base]):
+                month_start, month_end = month_bounds(month)
+                if month_start >= horizon:
+                    continue
+                table = partition_name(base, month)
+                trims: Dict[int, datetime.datetime] = {}
+                keep = False
+                for guild_id in await self._guilds(table):
+                    guild_cutoff = cutoff(guild_id)
+                    if guild_cutoff is None or guild_cutoff < month_end:
+                        # Bu sunucunun bölümde henüz süresi dolmamış satırları var
+                        keep = True
+                    if guild_cutoff is not None and guild_cutoff > month_start:
+                        trims[guild_id] = guild_cutoff
+                if not keep:
+                    # Bölümdeki tüm satırların süresi dolmuş: tablo tek seferde düşürülür
+                    await self._drop(base, month)
+                    dropped.append(table)
+                    continue
+                for guild_id, guild_cutoff in trims.items():
+                    self.chunks += await delete_range(self.pool, table, 'timestamp', 'guild_id = ?', (guild_id,),
+                                                      None, guild_cutoff, self.chunk_size)
+                    trimmed.add(guild_id)
+
+        # Bölümlemeden önceki satırlar tek tablodadır; sunucu sunucu, parça parça silinir
+        for base in PARTITIONED:
+            for guild_id in await self._guilds(base):
+                guild_cutoff = cutoff(guild_id)
+                if guild_cutoff is None:
+                    continue
+                self.chunks += await delete_range(self.pool, base, 'timestamp', 'guild_id = ?', (guild_id,),
+                                                  None, guild_cutoff, self.chunk_size)
+                trimmed.add(guild_id)
+
+        self.dropped += len(dropped)
+        self.trimmed_guilds += len(trimmed)
+        if dropped or trimmed:
+            log.info('Saklama: %d bölüm düşürüldü, %d sunucunun eski olayları silindi', len(dropped), len(trimmed))
+        return {'dropped_partitions': len(dropped), 'trimmed_guilds': len(trimmed)}
+
+    async def _drop(self, base: str, month: str):
+        """Bölümü (arşivleme açıksa arşive taşıyarak) düşür"""
+        table = partition_name(base, month)
+        async with self.pool.writer() as db:
+            try:
+                if self.archive:
+                    await self._archive(db, table)
+                else:
+                    await db.execute(f'DROP TABLE IF EXISTS {table}')
+                await db.execute('DELETE FROM event_partitions WHERE base = ? AND month = ?', (base, month))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        self._months[base].discard(month)
+
+    async def _archive(self, db, table: str):
+        """Bölümü arşive taşı: PostgreSQL'de archive şemasına, SQLite'ta ayrı bir arşiv dosyasına"""
+        if self.dialect == 'postgres':
+            await db.execute('CREATE SCHEMA IF NOT EXISTS archive')
+            await db.execute(f'DROP TABLE IF EXISTS archive.{table}')
+            await db.execute(f'ALTER TABLE {table} SET SCHEMA archive')
+            return
+        # ATTACH işlem içinde yapılamaz; önceki değişiklikler yazılmış olmalı
+        await db.commit()
+        archive_path = os.path.splitext(self.pool.db_name)[0] + '_archive.db'
+        await db.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+        try:
+            await db.execute(f'DROP TABLE IF EXISTS archive.{table}')
+            await db.execute(f'CREATE TABLE archive.{table} AS SELECT * FROM main.{table}')
+            await db.execute(f'DROP TABLE main.{table}')
+            await db.commit()
+        finally:
+            await db.execute('DETACH DATABASE archive')
+
+    def stats(self) -> Dict:
+        """Bölümleme istatistiklerini getir"""
+        return {
+            'partitions': sum(len(months) for months in self._months.values()),
+            'created': self.created,
+            'dropped': self.dropped,
+            'trimmed_guilds': self.trimmed_guilds,
+            'retention_chunks': self.chunks,
+            'retention_days': self.retention_days,
+        }
@@ -0,0 +1,225 @@
+import datetime
+import logging
+from typing import Dict, Optional, Tuple
+
+from connection_pool import ConnectionPool
+from rollups import hour_bucket, parse_timestamp
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python 3.8: sunucu saat dilimi desteklenmez, yerel saat kullanılır
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+log = logging.getLogger(__name__)
+
+# Kayan pencereler: şu andan geriye sabit uzunluk (başlangıç saat başına yuvarlanır)
+ROLLING = {
+    'günlük': datetime.timedelta(days=1),
+    'haftalık': datetime.timedelta(weeks=1),
+    'aylık': datetime.timedelta(days=30),
+}
+
+# Takvim pencereleri: sunucunun saat diliminde günün/haftanın/ayın başından itibaren
+CALENDAR = ('bugün', 'bu-hafta', 'bu-ay')
+
+# Özel aralık: '2024-01-01..2024-01-31' (bitiş günü dahil)
+RANGE_SEPARATOR = '..'
+
+# Önbellekte tutulacak en fazla pencere sayısı
+MAX_WINDOWS = 4096
+
+# Açık uçlu pencerelerin saatlik özet sorgularındaki üst sınırı
+OPEN_END_HOUR = '9999-12-31 23:00:00'
+
+
+class Window:
+    """Bir periyodun yerel saatle [start, end) sınırları"""
+    __slots__ = ('period', 'start', 'end', 'valid_until')
+
+    def __init__(self, period: str, start: datetime.datetime, end: Optional[datetime.datetime] = None,
+                 valid_until: Optional[datetime.datetime] = None):
+        self.period = period
+        self.start = start
+        # None ise pencere şu ana kadar açıktır
+        self.end = end
+        # Bu zamandan sonra sınırlar yeniden hesaplanmalı (None: hiç değişmez)
+        self.valid_until = valid_until
+
+    @property
+    def start_hour(self) -> str:
+        return hour_bucket(self.start)
+
+    @property
+    def end_hour(self) -> str:
+        """Saatlik özet sorguları için üst sınır (hour < end_hour)"""
+        if self.end is None:
+            return OPEN_END_HOUR
+        # Bitiş saat ortasına denk gelirse o saatin dilimi de dahil edilir
+        end_hour = hour_bucket(self.end)
+        if parse_timestamp(end_hour) < self.end:
+            end_hour = hour_bucket(parse_timestamp(end_hour) + datetime.timedelta(hours=1))
+        return end_hour
+
+    @property
+    def hours(self) -> Tuple[str, str]:
+        return self.start_hour, self.end_hour
+
+    def contains(self, timestamp: datetime.datetime) -> bool:
+        return self.start <= timestamp and (self.end is None or timestamp < self.end)
+
+
+def floor_hour(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def weekly_period_bounds(now: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime]:
+    """`now` anını içeren, Pazar 23:30'da biten haftalık periyodu getir"""
+    days_until_sunday = (6 - now.weekday()) % 7
+    period_end = (now + datetime.timedelta(days=days_until_sunday)).replace(
+        hour=23, minute=30, second=0, microsecond=0
+    )
+    # Pazar 23:30'dan sonra yeni hafta başlamıştır
+    if period_end <= now:
+        period_end += datetime.timedelta(days=7)
+    return period_end - datetime.timedelta(days=7), period_end
+
+
+class PeriodEngine:
+    """Periyot adlarını sunucu saat dilimine göre önbelleğe alınmış zaman pencerelerine çevirir"""
+
+    def __init__(self, pool: ConnectionPool, default_timezone: Optional[str] = None):
+        self.pool = pool
+        self.default_timezone = default_timezone
+        # guild_id -> saat dilimi adı (None: botun yerel saati)
+        self._timezones: Dict[int, Optional[str]] = {}
+        # (guild_id, periyot) -> pencere
+        self._windows: Dict[Tuple[int, str], Window] = {}
+        self._weekly: Optional[Tuple[datetime.datetime, datetime.datetime]] = None
+        self._weekly_loaded = False
+
+    def _zone(self, name: Optional[str]):
+        if not name or ZoneInfo is None:
+            return None
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            log.warning('Bilinmeyen saat dilimi %r, yerel saat kullanılacak', name)
+            return None
+
+    async def timezone(self, guild_id: int) -> Optional[str]:
+        """Sunucunun saat dilimini (önbellekten) getir"""
+        if guild_id not in self._timezones:
+            async with self.pool.reader() as db:
+                async with db.execute('SELECT timezone FROM guild_settings WHERE guild_id = ?',
+                                      (guild_id,)) as cursor:
+                    row = await cursor.fetchone()
+            self._timezones[guild_id] = row[0] if row and row[0] else self.default_timezone
+        return self._timezones[guild_id]
+
+    async def set_timezone(self, guild_id: int, name: Optional[str]):
+        """Sunucunun saat dilimini kaydet; hesaplanmış pencereleri geçersiz say"""
+        async with self.pool.writer() as db:
+            await db.execute('''
+                INSERT INTO guild_settings (guild_id, timezone) VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET timezone = excluded.timezone
+            ''', (guild_id, name))
+            await db.commit()
+        self._timezones[guild_id] = name or self.default_timezone
+        for key in [key for key in self._windows if key[0] == guild_id]:
+            del self._windows[key]
+
+    @staticmethod
+    def is_valid_timezone(name: str) -> bool:
+        if ZoneInfo is None:
+            return False
+        try:
+            ZoneInfo(name)
+            return True
+        except (ZoneInfoNotFoundError, ValueError):
+            return False
+
+    async def weekly_period(self) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+        """Mevcut haftalık periyodu (önbellekten) getir"""
+        if self._weekly is not None and datetime.datetime.now() >= self._weekly[1]:
+            # Hafta bitti; yeni kaydı başka bir shard süreci açmış olabilir
+            self._weekly_loaded = False
+        if not self._weekly_loaded:
+            async with self.pool.reader() as db:
+                async with db.execute('''
+                    SELECT start_time, end_time FROM weekly_periods
+                    WHERE is_current = 1
+                    ORDER BY id DESC
+                    LIMIT 1
+                ''') as cursor:
+                    row = await cursor.fetchone()
+            self._weekly = (parse_timestamp(row[0]), parse_timestamp(row[1])) if row else None
+            self._weekly_loaded = True
+        return self._weekly
+
+    def set_weekly_period(self, start: datetime.datetime, end: datetime.datetime):
+        self._weekly = (start, end)
+        self._weekly_loaded = True
+        for key in [key for key in self._windows if key[1] == 'haftalık@weekly']:
+            del self._windows[key]
+
+    def _calendar(self, period: str, now: datetime.datetime, zone) -> Window:
+        """Takvim penceresini sunucu saat diliminde hesaplayıp yerel saate çevir"""
+        local_now = now.astimezone(zone) if zone else now
+        midnight = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == 'bugün':
+            start, next_start = midnight, midnight + datetime.timedelta(days=1)
+        elif period == 'bu-hafta':
+            start = midnight - datetime.timedelta(days=local_now.weekday())
+            next_start = start + datetime.timedelta(days=7)
+        else:
+            start = midnight.replace(day=1)
+            next_start = (start + datetime.timedelta(days=32)).replace(day=1)
+        if zone:
+            # Yaz saati geçişlerinde duvar saati korunur, sonra botun yerel saatine çevrilir
+            start = start.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+            next_start = next_start.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+        return Window(period, start, valid_until=next_start)
+
+    def _range(self, period: str, zone) -> Window:
+        first, _, last = period.partition(RANGE_SEPARATOR)
+        start = datetime.datetime.strptime(first.strip(), '%Y-%m-%d')
+        end = datetime.datetime.strptime(last.strip(), '%Y-%m-%d') + datetime.timedelta(days=1)
+        if zone:
+            start = start.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+            end = end.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+        return Window(period, start, end)
+
+    async def window(self, guild_id: int, period: str, weekly: bool = False,
+                     now: Optional[datetime.datetime] = None) -> Window:
+        """Periyodun pencere sınırlarını getir; sınırlar değişene kadar önbellekte tutulur"""
+        # weekly=True ise 'haftalık' mevcut weekly_periods kaydına göre hesaplanır
+        now = now or datetime.datetime.now()
+        key = (guild_id, f'{period}@weekly' if weekly and period == 'haftalık' else period)
+        window = self._windows.get(key)
+        if window is not None and (window.valid_until is None or now < window.valid_until):
+            return window
+
+        if weekly and period == 'haftalık' and await self.weekly_period():
+            start, end = self._weekly
+            window = Window(period, start, valid_until=end)
+        elif period in ROLLING:
+            # Başlangıç saat başına yuvarlanır; aynı saat içindeki tüm sorgular aynı sınırı kullanır
+            start = floor_hour(now - ROLLING[period])
+            window = Window(period, start, valid_until=floor_hour(now) + datetime.timedelta(hours=1))
+        elif period in CALENDAR:
+            window = self._calendar(period, now, self._zone(await self.timezone(guild_id)))
+        elif RANGE_SEPARATOR in period:
+            try:
+                window = self._range(period, self._zone(await self.timezone(guild_id)))
+            except ValueError:
+                window = Window(period, datetime.datetime.min)
+        else:
+            # Bilinmeyen periyot: tüm zamanlar
+            window = Window(period, datetime.datetime.min)
+
+        # Özel aralıklar sınırsız sayıda anahtar üretebilir
+        if len(self._windows) >= MAX_WINDOWS:
+            self._windows.clear()
+        self._windows[key] = window
+        return window
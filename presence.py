@@ -0,0 +1,111 @@
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# Presence intent'i yokken Discord'un yaklaşık çevrimiçi sayısının önbellekte tutulacağı süre (saniye)
+APPROXIMATE_TTL = 300.0
+
+
+def is_online(member) -> bool:
+    """Üye çevrimiçi mi (durum bilgisi yoksa çevrimdışı sayılır)"""
+    return str(getattr(member, 'status', 'offline')) != 'offline'
+
+
+class GuildCounts:
+    """Bir sunucunun çevrimiçi ve bot sayaçları"""
+    __slots__ = ('online', 'bots')
+
+    def __init__(self, online: int = 0, bots: int = 0):
+        self.online = online
+        self.bots = bots
+
+
+class PresenceCounters:
+    """Sunucu başına çevrimiçi/bot sayaçları; gateway olaylarıyla O(1) güncellenir"""
+
+    def __init__(self, track_presence: bool = True):
+        # False ise presence intent'i kapalıdır; çevrimiçi sayısı REST'ten yaklaşık alınır
+        self.track_presence = track_presence
+        self._counts: Dict[int, GuildCounts] = {}
+        # guild_id -> (geçerlilik sonu, yaklaşık çevrimiçi sayısı)
+        self._approximate: Dict[int, Tuple[float, Optional[int]]] = {}
+
+        self.seeded = 0
+        self.approximate_fetches = 0
+
+    def seed(self, guild):
+        """Sunucu hazır olduğunda üyeleri bir kez say (yalnızca üye önbelleği tamsa)"""
+        if not guild.chunked:
+            # Önbellek eksikse sayım yanlış olur; bot sayısı bilinmez, çevrimiçi sayısı yaklaşık alınır
+            self._counts.pop(guild.id, None)
+            return
+        counts = GuildCounts()
+        for member in guild.members:
+            if member.bot:
+                counts.bots += 1
+            if self.track_presence and is_online(member):
+                counts.online += 1
+        self._counts[guild.id] = counts
+        self.seeded += 1
+
+    def forget(self, guild_id: int):
+        self._counts.pop(guild_id, None)
+        self._approximate.pop(guild_id, None)
+
+    def presence_changed(self, guild_id: int, before, after):
+        counts = self._counts.get(guild_id)
+        if counts is not None and self.track_presence:
+            counts.online += is_online(after) - is_online(before)
+
+    def member_joined(self, guild_id: int, member):
+        counts = self._counts.get(guild_id)
+        if counts is None:
+            return
+        if member.bot:
+            counts.bots += 1
+        if self.track_presence and is_online(member):
+            counts.online += 1
+
+    def member_left(self, guild_id: int, user):
+        """Ayrılan kullanıcı (önbellekteyse Member, değilse durum bilgisi olmayan User)"""
+        counts = self._counts.get(guild_id)
+        if counts is None:
+            return
+        if user.bot:
+            counts.bots = max(0, counts.bots - 1)
+        if self.track_presence and is_online(user):
+            counts.online = max(0, counts.online - 1)
+
+    def bots(self, guild_id: int) -> Optional[int]:
+        """Bot sayısı (bilinmiyorsa None)"""
+        counts = self._counts.get(guild_id)
+        return counts.bots if counts is not None else None
+
+    async def online(self, guild_id: int, fetch_guild: Callable[[], Awaitable]) -> Optional[int]:
+        """Çevrimiçi üye sayısı: sayaçtan, yoksa fetch_guild(with_counts) sonucundan yaklaşık"""
+        counts = self._counts.get(guild_id)
+        if counts is not None and self.track_presence:
+            return counts.online
+        cached = self._approximate.get(guild_id)
+        now = time.monotonic()
+        if cached is not None and now < cached[0]:
+            return cached[1]
+        try:
+            guild = await fetch_guild()
+            online = guild.approximate_presence_count
+        except Exception:
+            log.debug('Yaklaşık çevrimiçi sayısı alınamadı (sunucu %s)', guild_id, exc_info=True)
+            online = None
+        self.approximate_fetches += 1
+        self._approximate[guild_id] = (now + APPROXIMATE_TTL, online)
+        return online
+
+    def stats(self) -> Dict:
+        """Sayaç istatistiklerini getir"""
+        return {
+            'tracked_guilds': len(self._counts),
+            'seeded': self.seeded,
+            'approximate_fetches': self.approximate_fetches,
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Sequence
+
+from partitions import PartitionRouter, delete_range
+from rollups import hour_bucket, parse_timestamp
+from shards import shard_for
+
+log = logging.getLogger(__name__)
+
+# Sıfırlama işaretleri: [since, until) aralığındaki (since NULL ise baştan) kayıtlar
+# sorgularda yok sayılır; fiziksel silme arka planda parça parça yapılır.
+INSERT_MARKER = '''
+    INSERT INTO reset_markers (guild_id, user_id, since, until, since_hour, until_hour)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+class ResetCompactor:
+    """Sıfırlamaları işaret olarak kaydeder; işaretli satırları arka planda küçük işlemlerle siler"""
+
+    def __init__(self, pool, partitions: PartitionRouter, chunk_size: int = 5000, interval: float = 30.0,
+                 sketches=None):
+        self.pool = pool
+        self.partitions = partitions
+        # Verilirse (sketches.ActiveUserSketches) sıfırlanan günlerin taslakları yeniden üretilir
+        self.sketches = sketches
+        self.chunk_size = chunk_size
+        self.interval = interval
+        # guild_id -> henüz sıkıştırılmamış işaret sayısı
+        self._active: Dict[int, int] = {}
+        self.shard_count: Optional[int] = None
+        self.shard_ids: Optional[List[int]] = None
+        self._wake = None
+        self._task = None
+        # Arka plan görevi ile elle çağrılan compact() aynı işaretleri iki kez işlemesin
+        self._lock = asyncio.Lock()
+
+        self.compacted = 0
+        self.chunks = 0
+
+    def configure(self, shard_count: Optional[int], shard_ids: Optional[List[int]] = None):
+        """Yalnızca bu sürecin shard'larındaki sunucuların işaretlerini işle"""
+        self.shard_count = shard_count or None
+        self.shard_ids = list(shard_ids) if shard_ids is not None and shard_count else None
+
+    def _owns(self, guild_id: int) -> bool:
+        return self.shard_ids is None or shard_for(guild_id, self.shard_count) in self.shard_ids
+
+    async def load(self):
+        """Önceki çalışmadan kalan işaretleri yükle"""
+        async with self.pool.reader() as db:
+            async with db.execute('SELECT guild_id, COUNT(*) FROM reset_markers GROUP BY guild_id') as cursor:
+                rows = await cursor.fetchall()
+        self._active = {guild_id: count for guild_id, count in rows if self._owns(guild_id)}
+
+    def pending(self, guild_id: int) -> bool:
+        """Sunucunun henüz sıkıştırılmamış işareti var mı"""
+        return bool(self._active.get(guild_id))
+
+    def visible(self, guild_id: int, table: str) -> str:
+        """Saatlik özet sorgusuna eklenecek, işaretli saatleri dışlayan koşul (işaret yoksa boş)"""
+        if not self._active.get(guild_id):
+            return ''
+        return f'''
+            AND NOT EXISTS (
+                SELECT 1 FROM reset_markers
+                WHERE reset_markers.guild_id = {table}.guild_id
+                  AND (reset_markers.user_id IS NULL OR reset_markers.user_id = {table}.user_id)
+                  AND (reset_markers.since_hour IS NULL OR {table}.hour >= reset_markers.since_hour)
+                  AND {table}.hour < reset_markers.until_hour
+            )
+        '''
+
+    async def mark(self, db, guild_id: int, user_id: Optional[int],
+                   since: Optional[datetime.datetime], until: datetime.datetime):
+        """Çağıranın işlemi içinde işaret ekle; içinde bulunulan saatin özetleri hemen silinir"""
+        # Saatlik özetler saat sınırında gizlenebilir; sıfırlama anının saati ise bölünemez.
+        # O saatin satırları (en fazla bir saatlik veri) doğrudan silinir.
+        until_hour = hour_bucket(until)
+        since_hour = hour_bucket(since) if since is not None else None
+        await db.execute(INSERT_MARKER, (guild_id, user_id, since, until, since_hour, until_hour))
+        user_filter = ' AND user_id = ?' if user_id is not None else ''
+        user_params = (user_id,) if user_id is not None else ()
+        for table in ('message_rollup_hourly', 'voice_rollup_hourly'):
+            await db.execute(f'DELETE FROM {table} WHERE guild_id = ? AND hour >= ?{user_filter}',
+                             (guild_id, until_hour, *user_params))
+
+    def marked(self, guild_id: int):
+        """İşaret commit edildikten sonra sunucuyu işaretli say ve sıkıştırıcıyı uyandır"""
+        self._active[guild_id] = self._active.get(guild_id, 0) + 1
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self):
+        """Arka plan sıkıştırıcı görevini başlat"""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Sıkıştırıcıyı durdur (kalan işaretler sonraki açılışta işlenir)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact()
+            except Exception:
+                log.exception('Sıfırlama işaretleri sıkıştırılamadı, sonraki turda tekrar denenecek')
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def compact(self) -> int:
+        """Bekleyen işaretlerin satırlarını sil ve işaretleri kaldır, işlenen işaret sayısını döndür"""
+        if not any(self._active.values()):
+            return 0
+        async with self._lock:
+            return await self._compact()
+
+    async def _compact(self) -> int:
+        async with self.pool.reader() as db:
+            async with db.execute('''
+                SELECT id, guild_id, user_id, since, until, since_hour, until_hour
+                FROM reset_markers
+                ORDER BY id
+            ''') as cursor:
+                markers = [row for row in await cursor.fetchall() if self._owns(row[1])]
+
+        for marker_id, guild_id, user_id, since, until, since_hour, until_hour in markers:
+            where, params = 'guild_id = ?', (guild_id,)
+            if user_id is not None:
+                where, params = 'guild_id = ? AND user_id = ?', (guild_id, user_id)
+
+            # Ham olaylar yalnızca aralıkla kesişen aylık bölümlerden silinir
+            start = parse_timestamp(since) if since is not None else None
+            bases = ('messages', 'emoji_usage') if user_id is not None else ('messages',)
+            await self.partitions.refresh()
+            for base in bases:
+                for table in self.partitions.tables(base, start, parse_timestamp(until)):
+                    await self._delete_range(table, 'timestamp', where, params, since, until)
+            await self._delete_range('voice_activity', 'join_time', where, params, since, until)
+            for table in ('message_rollup_hourly', 'voice_rollup_hourly'):
+                await self._delete_range(table, 'hour', where, params, since_hour, until_hour)
+            if self.sketches is not None:
+                await self.sketches.rebuild(guild_id, since_hour, until_hour)
+
+            async with self.pool.writer() as db:
+                await db.execute('DELETE FROM reset_markers WHERE id = ?', (marker_id,))
+                await db.commit()
+            remaining = self._active.get(guild_id, 0) - 1
+            if remaining > 0:
+                self._active[guild_id] = remaining
+            else:
+                self._active.pop(guild_id, None)
+            self.compacted += 1
+        return len(markers)
+
+    async def _delete_range(self, table: str, column: str, where: str, params: Sequence,
+                            since, until):
+        """[since, until) aralığını en fazla chunk_size satırlık işlemlerle sil"""
+        self.chunks += await delete_range(self.pool, table, column, where, params, since, until, self.chunk_size)
+
+    def stats(self) -> Dict:
+        """Sıfırlama sıkıştırıcısı istatistiklerini getir"""
+        return {
+            'pending_markers': sum(self._active.values()),
+            'compacted': self.compacted,
+            'chunks': self.chunks,
+        }
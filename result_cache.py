@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# Önbelleğe alınan sonuçların bağlı olduğu veri türleri. Bir türe yazı geldiğinde
+# o sunucunun o türe ait nesil sayacı artar ve eski sonuçlar geçersiz olur.
+KINDS = ('messages', 'voice', 'xp', 'emoji', 'permanent')
+
+
+class ResultCache:
+    """Sunucu bazlı, TTL ve LRU ile sınırlı sorgu sonuç önbelleği"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # anahtar -> (bitiş zamanı, nesil, değer)
+        self._entries: 'OrderedDict[Hashable, Tuple[float, int, Any]]' = OrderedDict()
+        # (guild_id, tür) -> nesil
+        self._generations: Dict[Tuple[int, str], int] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def generation(self, guild_id: int, kind: str) -> int:
+        return self._generations.get((guild_id, kind), 0)
+
+    def bump(self, guild_id: int, kind: str):
+        """Sunucuda bir veri türü değişti, ona bağlı sonuçları geçersiz say"""
+        key = (guild_id, kind)
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def invalidate_guild(self, guild_id: int):
+        """Sunucunun tüm sonuçlarını geçersiz say (sıfırlamalarda kullanılır)"""
+        for kind in KINDS:
+            self.bump(guild_id, kind)
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    async def get_or_load(self, guild_id: int, kind: str, key: Hashable,
+                          loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Geçerli bir sonuç varsa döndür, yoksa loader ile hesaplayıp sakla"""
+        full_key = (guild_id, kind, key)
+        generation = self.generation(guild_id, kind)
+        entry = self._entries.get(full_key)
+        if entry is not None:
+            expires_at, entry_generation, value = entry
+            if entry_generation == generation and expires_at > time.monotonic():
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return value
+            del self._entries[full_key]
+            if entry_generation != generation:
+                self.invalidations += 1
+            else:
+                self.expirations += 1
+
+        self.misses += 1
+        # Aynı sonucu bekleyen eşzamanlı komutlar tek sorguyu paylaşsın
+        pending = self._inflight.get(full_key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Bekleyen yoksa uyarı üretmesin
+            raise
+        finally:
+            del self._inflight[full_key]
+        future.set_result(value)
+
+        # Sorgu sürerken yazı geldiyse sonucu saklama
+        if self.generation(guild_id, kind) == generation:
+            self._entries[full_key] = (time.monotonic() + self.ttl, generation, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict:
+        """Önbellek isabet/ıska istatistiklerini getir"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+def cached(kind: str):
+    """İlk argümanı guild_id olan Database metodunu self.cache üzerinden önbelleğe al"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, guild_id: int, *args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            return await self.cache.get_or_load(
+                guild_id, kind, key, lambda: func(self, guild_id, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple, Union
+
+import aiosqlite
+
+# Saatlik özet tabloları: ham satırları saymak yerine (sunucu, kanal, kullanıcı, saat)
+# anahtarlı sayaçlar olay yazılırken artırılır. Upsert'lerde mevcut satırın sütunları
+# tablo adıyla yazılır; PostgreSQL niteliksiz adı excluded ile karıştırır.
+
+UPSERT_MESSAGE_ROLLUP = '''
+    INSERT INTO message_rollup_hourly (guild_id, channel_id, user_id, hour, message_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, hour, channel_id, user_id) DO UPDATE SET
+        message_count = message_rollup_hourly.message_count + excluded.message_count
+'''
+
+UPSERT_VOICE_ROLLUP = '''
+    INSERT INTO voice_rollup_hourly (guild_id, channel_id, user_id, hour, voice_seconds)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, hour, channel_id, user_id) DO UPDATE SET
+        voice_seconds = voice_rollup_hourly.voice_seconds + excluded.voice_seconds
+'''
+
+# Emoji kullanımları saat olmadan (sunucu, emoji, kullanıcı) bazında toplanır; ham emoji
+# kayıtları saklama süresiyle silindiğinde de sayılar korunur
+UPSERT_EMOJI_ROLLUP = '''
+    INSERT INTO emoji_rollup (guild_id, emoji_name, user_id, usage_count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(guild_id, emoji_name, user_id) DO UPDATE SET
+        usage_count = emoji_rollup.usage_count + excluded.usage_count
+'''
+
+
+def parse_timestamp(value: Union[str, datetime.datetime]) -> datetime.datetime:
+    """Veritabanından okunan zaman damgasını datetime'a çevir"""
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+def hour_bucket(value: Union[str, datetime.datetime]) -> str:
+    """Zaman damgasının ait olduğu saat dilimini 'YYYY-MM-DD HH:00:00' olarak getir"""
+    dt = parse_timestamp(value)
+    # strftime yıl 1000'den küçükse sıfır doldurmuyor (datetime.min gibi)
+    return f'{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:00:00'
+
+
+def split_into_hours(start: datetime.datetime, end: datetime.datetime) -> Dict[str, int]:
+    """Bir zaman aralığını saat dilimlerine bölüp her dilimdeki saniyeyi getir"""
+    seconds = {}
+    cursor = start
+    while cursor < end:
+        next_hour = cursor.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        chunk_end = min(next_hour, end)
+        seconds[hour_bucket(cursor)] = round((chunk_end - cursor).total_seconds())
+        cursor = chunk_end
+    return seconds
+
+
+def message_rollup_rows(messages: Iterable[tuple]) -> List[tuple]:
+    """(user_id, channel_id, guild_id, timestamp) satırlarını saatlik sayaçlara indir"""
+    counts: Dict[Tuple[int, int, int, str], int] = defaultdict(int)
+    for user_id, channel_id, guild_id, timestamp in messages:
+        counts[(guild_id, channel_id, user_id, hour_bucket(timestamp))] += 1
+    return [key + (count,) for key, count in counts.items()]
+
+
+def emoji_rollup_rows(emojis: Iterable[tuple]) -> List[tuple]:
+    """(user_id, guild_id, emoji_id, emoji_name, timestamp) satırlarını emoji sayaçlarına indir"""
+    totals: Dict[Tuple[int, str, int], int] = defaultdict(int)
+    for user_id, guild_id, _emoji_id, emoji_name, _timestamp in emojis:
+        totals[(guild_id, emoji_name, user_id)] += 1
+    return [key + (count,) for key, count in totals.items()]
+
+
+def voice_rollup_rows(sessions: Iterable[tuple]) -> List[tuple]:
+    """(user_id, channel_id, guild_id, join_time, leave_time) oturumlarını saatlik saniyelere indir"""
+    totals: Dict[Tuple[int, int, int, str], int] = defaultdict(int)
+    for user_id, channel_id, guild_id, join_time, leave_time in sessions:
+        start, end = parse_timestamp(join_time), parse_timestamp(leave_time)
+        for hour, seconds in split_into_hours(start, end).items():
+            totals[(guild_id, channel_id, user_id, hour)] += seconds
+    return [key + (seconds,) for key, seconds in totals.items() if seconds > 0]
+
+
+async def backfill(db: aiosqlite.Connection):
+    """Mevcut ham kayıtlardan özet tablolarını doldur (şema geçişinde çalışır)"""
+    await db.execute('''
+        INSERT INTO message_rollup_hourly (guild_id, channel_id, user_id, hour, message_count)
+        SELECT COALESCE(guild_id, 0), COALESCE(channel_id, 0), COALESCE(user_id, 0),
+               strftime('%Y-%m-%d %H:00:00', timestamp), COUNT(*)
+        FROM messages
+        WHERE timestamp IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    ''')
+
+    async with db.execute('''
+        SELECT user_id, channel_id, guild_id, join_time, leave_time
+        FROM voice_activity
+        WHERE join_time IS NOT NULL AND leave_time IS NOT NULL
+    ''') as cursor:
+        while True:
+            sessions = await cursor.fetchmany(5000)
+            if not sessions:
+                break
+            await db.executemany(UPSERT_VOICE_ROLLUP, voice_rollup_rows(sessions))
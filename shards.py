@@ -0,0 +1,99 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+from typing import List, Optional, Sequence
+
+log = logging.getLogger(__name__)
+
+# PostgreSQL'de bir süreçteki shard kuyruklarına ayrılan en fazla yazıcı bağlantısı
+MAX_SHARD_WRITERS = 8
+
+
+def shard_for(guild_id: int, shard_count: Optional[int]) -> int:
+    """Sunucunun bağlı olduğu shard (Discord'un kullandığı formül)"""
+    if not shard_count:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+def parse_shard_ids(value: Optional[str]) -> Optional[List[int]]:
+    """'0,1,2' ya da '0-3' biçimindeki shard listesini çöz"""
+    if not value or not value.strip():
+        return None
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+
+def shard_groups(shard_count: int, processes: int) -> List[List[int]]:
+    """Shard'ları süreçlere ardışık ve olabildiğince eşit gruplar halinde dağıt"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    groups, start = [], 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+async def recommended_shard_count(token: str) -> int:
+    """Discord'un bot için önerdiği shard sayısını getir"""
+    import discord
+
+    client = discord.Client(intents=discord.Intents.none())
+    try:
+        await client.login(token)
+        shard_count, _ = await client.http.get_bot_gateway()
+        return shard_count
+    finally:
+        await client.close()
+
+
+def run_shard_processes(script: str, shard_count: int, processes: int,
+                        extra_env: Optional[dict] = None) -> int:
+    """Her shard grubu için botu ayrı bir süreçte başlat ve hepsi bitene kadar bekle"""
+    children = []
+    for shard_ids in shard_groups(shard_count, processes):
+        env = dict(os.environ, **(extra_env or {}))
+        env.update({
+            'SHARD_COUNT': str(shard_count),
+            'SHARD_IDS': ','.join(map(str, shard_ids)),
+            'SHARD_PROCESSES': '1',
+        })
+        log.info('Shard süreci başlatılıyor: %s/%d', env['SHARD_IDS'], shard_count)
+        children.append(subprocess.Popen([sys.executable, script], env=env))
+
+    exit_code = 0
+    try:
+        for child in children:
+            exit_code = child.wait() or exit_code
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Biri durduğunda (ya da Ctrl+C) diğerlerini de düzgün kapat
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signal.SIGINT)
+        for child in children:
+            try:
+                child.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                child.kill()
+    return exit_code
+
+
+def describe(shard_count: Optional[int], shard_ids: Optional[Sequence[int]]) -> str:
+    """Shard düzenini kayıtlar için kısa bir metne çevir"""
+    if not shard_count:
+        return 'tek bağlantı'
+    owned = shard_ids if shard_ids is not None else range(shard_count)
+    return f"shard {','.join(map(str, owned))} / {shard_count}"
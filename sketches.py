@@ -0,0 +1,450 @@
+import asyncio
+import datetime
+import logging
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from rollups import hour_bucket
+from shards import shard_for
+
+log = logging.getLogger(__name__)
+
+# 2^12 yazmaç: standart hata ~%1.6, yoğun biçimde 4 KB
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+_WIDTH = 64 - PRECISION
+_MASK64 = (1 << 64) - 1
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+_POWERS = [2.0 ** -rank for rank in range(_WIDTH + 2)]
+# Yazmaçlar 7 bite sığar; her baytın üst biti büyük tamsayı üzerinde bayt bazında karşılaştırma sağlar
+_HIGH_BITS = int.from_bytes(b'\x80' * REGISTERS, 'little')
+
+# Taslak taneciği: saatlik taslaklar pencere kenarlarını, günlük taslaklar tam günleri kapsar
+GRAIN_HOUR = 0
+GRAIN_DAY = 1
+
+# Sunucu geneli taslakların channel_id değeri
+GUILD_WIDE = 0
+
+# Eski özet satırlarından taslak üretiminin hangi saate kadar gerektiğini tutan bot_meta anahtarı
+SINCE_KEY = 'sketches_since'
+DONE_KEY = 'sketches_backfilled'
+
+UPSERT_SKETCH = '''
+    INSERT INTO active_user_sketches (guild_id, channel_id, grain, bucket, registers)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, grain, bucket, channel_id) DO UPDATE SET registers = excluded.registers
+'''
+
+
+def hash64(value: int) -> int:
+    """Kullanıcı kimliğini 64 bitlik karışık değere çevir (splitmix64; süreçten bağımsız)"""
+    z = (value + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+class HyperLogLog:
+    """Farklı kullanıcı sayısı taslağı; birleştirme yazmaç bazında en büyük değeri almaktır"""
+    __slots__ = ('registers',)
+
+    def __init__(self, registers: Optional[bytearray] = None):
+        self.registers = registers if registers is not None else bytearray(REGISTERS)
+
+    @staticmethod
+    def position(value: int) -> Tuple[int, int]:
+        """Değerin düştüğü yazmaç ve o yazmaçtaki sırası"""
+        hashed = hash64(value)
+        return hashed >> _WIDTH, _WIDTH - (hashed & ((1 << _WIDTH) - 1)).bit_length() + 1
+
+    def add(self, value: int):
+        index, rank = self.position(value)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[int]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'HyperLogLog'):
+        self.registers = self.union([self, other]).registers
+
+    @classmethod
+    def union(cls, sketches: List['HyperLogLog']) -> 'HyperLogLog':
+        """Taslakları yazmaçları tek tamsayıda tutarak bayt bazında en büyük değerle birleştir"""
+        if not sketches:
+            return cls()
+        merged = int.from_bytes(sketches[0].registers, 'little')
+        for sketch in sketches[1:]:
+            other = int.from_bytes(sketch.registers, 'little')
+            # (a | 0x80) - b baytlar arası borç üretmez; üst bit a >= b olan baytlarda kalır
+            keep = ((((merged | _HIGH_BITS) - other) & _HIGH_BITS) >> 7) * 0xFF
+            merged = (merged & keep) | (other & ~keep)
+        return cls(bytearray(merged.to_bytes(REGISTERS, 'little')))
+
+    def count(self) -> int:
+        """Tahmini farklı değer sayısı (küçük sayılarda doğrusal sayım)"""
+        registers = self.registers
+        zeros = registers.count(0)
+        if zeros == REGISTERS:
+            return 0
+        estimate = _ALPHA * REGISTERS * REGISTERS / sum(map(_POWERS.__getitem__, registers))
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        """Az dolu taslaklar (index, değer) çiftleri olarak, diğerleri yoğun saklanır"""
+        pairs = [(index, rank) for index, rank in enumerate(self.registers) if rank]
+        if len(pairs) * 3 < REGISTERS:
+            data = bytearray(b'\x00')
+            for index, rank in pairs:
+                data += bytes((index >> 8, index & 0xFF, rank))
+            return bytes(data)
+        return b'\x01' + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        data = bytes(data)
+        if data[:1] == b'\x01':
+            return cls(bytearray(data[1:]))
+        registers = bytearray(REGISTERS)
+        for offset in range(1, len(data), 3):
+            registers[(data[offset] << 8) | data[offset + 1]] = data[offset + 2]
+        return cls(registers)
+
+
+def day_bucket(hour: str) -> str:
+    """'YYYY-MM-DD HH:00:00' saatinin günü"""
+    return hour[:10]
+
+
+def next_day(day: str) -> str:
+    return (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+
+
+def sketch_users(rows: Iterable[Tuple[int, int, str]]) -> Dict[Tuple[int, int, str], Set[int]]:
+    """(channel_id, user_id, hour) satırlarını (kanal, tanecik, dilim) -> kullanıcılar kümelerine indir"""
+    users: Dict[Tuple[int, int, str], Set[int]] = defaultdict(set)
+    for channel_id, user_id, hour in rows:
+        day = day_bucket(hour)
+        for channel in (channel_id, GUILD_WIDE):
+            users[(channel, GRAIN_HOUR, hour)].add(user_id)
+            users[(channel, GRAIN_DAY, day)].add(user_id)
+    return users
+
+
+def build_sketches(users: Dict[Tuple[int, int, str], Set[int]]) -> Dict[Tuple[int, int, str], HyperLogLog]:
+    """Kullanıcı kümelerinden (kanal, tanecik, dilim) taslakları üret"""
+    sketches = {}
+    for key, user_ids in users.items():
+        sketch = sketches[key] = HyperLogLog()
+        sketch.update(user_ids)
+    return sketches
+
+
+async def merge_sketches(db, guild_id: int, sketches: Dict[Tuple[int, int, str], HyperLogLog]):
+    """Taslakları çağıranın işlemi içinde kayıtlı taslaklarla birleştirip yaz"""
+    buckets: Dict[Tuple[int, str], List[int]] = defaultdict(list)
+    for channel_id, grain, bucket in sketches:
+        buckets[(grain, bucket)].append(channel_id)
+
+    rows = []
+    for (grain, bucket), channel_ids in buckets.items():
+        # Yalnızca değişen kanalların kayıtlı taslakları okunur
+        async with db.execute(f'''
+            SELECT channel_id, registers FROM active_user_sketches
+            WHERE guild_id = ? AND grain = ? AND bucket = ? AND channel_id IN ({','.join('?' * len(channel_ids))})
+        ''', (guild_id, grain, bucket, *channel_ids)) as cursor:
+            existing = {channel_id: registers for channel_id, registers in await cursor.fetchall()}
+        for channel_id in channel_ids:
+            sketch = sketches[(channel_id, grain, bucket)]
+            if channel_id in existing:
+                sketch = HyperLogLog.union([sketch, HyperLogLog.from_bytes(existing[channel_id])])
+            rows.append((guild_id, channel_id, grain, bucket, sketch.to_bytes()))
+    await db.executemany(UPSERT_SKETCH, rows)
+
+
+class ActiveUserSketches:
+    """Sunucu ve kanal başına saatlik/günlük aktif kullanıcı taslakları; herhangi bir pencere birleştirilerek sayılır"""
+
+    def __init__(self, pool, checkpoint_interval: float = 5.0):
+        self.pool = pool
+        self.checkpoint_interval = checkpoint_interval
+        self.shard_count: Optional[int] = None
+        self.shard_ids: Optional[List[int]] = None
+        # Eski özet satırlarından taslağı henüz üretilmemiş sunucular (None: henüz bilinmiyor)
+        self._pending: Optional[Set[int]] = None
+        self._since: Optional[str] = None
+        # Yazılan mesajlardan henüz kaydedilmemiş taslaklar: sunucu -> (kanal, tanecik, dilim) -> taslak
+        self._deltas: Dict[int, Dict[Tuple[int, int, str], HyperLogLog]] = {}
+        # Kaydı süren taslaklar; yazılana kadar tahminlere katılır
+        self._writing: Dict[int, Dict[Tuple[int, int, str], HyperLogLog]] = {}
+        self._checkpoint_lock: Optional[asyncio.Lock] = None
+        self._task = None
+        self._checkpoint_task = None
+
+        self.estimates = 0
+        self.merged_sketches = 0
+        self.backfilled_days = 0
+        self.rebuilt_days = 0
+        self.checkpoints = 0
+        self.checkpointed_sketches = 0
+
+    def configure(self, shard_count: Optional[int], shard_ids: Optional[List[int]] = None):
+        """Yalnızca bu sürecin shard'larındaki sunucuların taslaklarını üret"""
+        self.shard_count = shard_count or None
+        self.shard_ids = list(shard_ids) if shard_ids is not None and shard_count else None
+
+    def _owns(self, guild_id: int) -> bool:
+        return self.shard_ids is None or shard_for(guild_id, self.shard_count) in self.shard_ids
+
+    def _lane(self, guild_id: int) -> Optional[int]:
+        # Olay kuyruğuyla aynı yazıcı hattı: aynı taslağa yapılan yazmalar sıraya girer
+        return shard_for(guild_id, self.shard_count) if self.shard_count else None
+
+    def ready(self, guild_id: int) -> bool:
+        """Sunucunun taslakları geçmiş özet satırlarını da kapsıyor mu"""
+        return self._pending is not None and guild_id not in self._pending
+
+    def start(self):
+        """Geçmiş özet satırlarından taslak üretimini ve periyodik kaydı arka planda başlat"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._checkpoint_task = asyncio.create_task(self._run_checkpoints())
+
+    async def close(self):
+        """Taslak üretimini durdur (yarım kalan sunucular sonraki açılışta sürdürülür) ve bellekteki taslakları yaz"""
+        for task in (self._task, self._checkpoint_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._checkpoint_task = None
+        await self.checkpoint()
+
+    async def _run(self):
+        try:
+            await self.backfill()
+        except Exception:
+            log.exception('Aktif kullanıcı taslakları üretilemedi; sayımlar tam sorguyla yapılacak')
+
+    async def _run_checkpoints(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception:
+                log.exception('Aktif kullanıcı taslakları kaydedilemedi, sonraki turda tekrar denenecek')
+
+    def record(self, messages: Iterable[tuple]):
+        """Yazılan (user_id, channel_id, guild_id, timestamp) mesajlarını bellekteki taslaklara ekle"""
+        for user_id, channel_id, guild_id, timestamp in messages:
+            hour = hour_bucket(timestamp)
+            day = day_bucket(hour)
+            index, rank = HyperLogLog.position(user_id)
+            sketches = self._deltas.setdefault(guild_id, {})
+            for key in ((channel_id, GRAIN_HOUR, hour), (channel_id, GRAIN_DAY, day),
+                        (GUILD_WIDE, GRAIN_HOUR, hour), (GUILD_WIDE, GRAIN_DAY, day)):
+                sketch = sketches.get(key)
+                if sketch is None:
+                    sketch = sketches[key] = HyperLogLog()
+                if rank > sketch.registers[index]:
+                    sketch.registers[index] = rank
+
+    def checkpoint_lock(self) -> asyncio.Lock:
+        """Bellekteki taslakların kayıtlarını sıralayan kilit"""
+        if self._checkpoint_lock is None:
+            self._checkpoint_lock = asyncio.Lock()
+        return self._checkpoint_lock
+
+    async def checkpoint(self):
+        """Bellekteki taslakları kayıtlı taslaklarla sunucu başına tek işlemde birleştirip yaz"""
+        async with self.checkpoint_lock():
+            if not self._deltas:
+                return
+            self._writing, self._deltas = self._deltas, {}
+            try:
+                for guild_id in list(self._writing):
+                    sketches = self._writing[guild_id]
+                    async with self.pool.writer(self._lane(guild_id)) as db:
+                        try:
+                            await merge_sketches(db, guild_id, sketches)
+                            await db.commit()
+                        except Exception:
+                            await db.rollback()
+                            raise
+                    del self._writing[guild_id]
+                    self.checkpointed_sketches += len(sketches)
+            except Exception:
+                # Yazılamayan taslaklar sonraki kayda kalır
+                for guild_id, sketches in self._writing.items():
+                    pending = self._deltas.setdefault(guild_id, {})
+                    for key, sketch in sketches.items():
+                        if key in pending:
+                            sketch = HyperLogLog.union([pending[key], sketch])
+                        pending[key] = sketch
+                raise
+            finally:
+                self._writing = {}
+            self.checkpoints += 1
+
+    async def backfill(self):
+        """Taslak tablosundan önceki özet satırlarının taslaklarını sunucu sunucu, gün gün üret"""
+        async with self.pool.writer() as db:
+            # Bu saatten sonraki mesajlar olay kuyruğu tarafından zaten taslaklara eklenir
+            await db.execute('''
+                INSERT INTO bot_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO NOTHING
+            ''', (SINCE_KEY, hour_bucket(datetime.datetime.now())))
+            await db.commit()
+        async with self.pool.reader() as db:
+            async with db.execute('SELECT value FROM bot_meta WHERE key = ?', (SINCE_KEY,)) as cursor:
+                self._since = (await cursor.fetchone())[0]
+            async with db.execute('SELECT key FROM bot_meta WHERE key LIKE ?', (f'{DONE_KEY}:%',)) as cursor:
+                done = {int(key.rsplit(':', 1)[1]) for key, in await cursor.fetchall()}
+            # Sunucuları birincil anahtar üzerinde atlayarak bul (tabloyu taramadan)
+            guild_ids = []
+            previous = -1
+            while True:
+                async with db.execute('''
+                    SELECT MIN(guild_id) FROM message_rollup_hourly WHERE guild_id > ?
+                ''', (previous,)) as cursor:
+                    previous = (await cursor.fetchone())[0]
+                if previous is None:
+                    break
+                if previous not in done and self._owns(previous):
+                    guild_ids.append(previous)
+        self._pending = set(guild_ids)
+
+        for guild_id in guild_ids:
+            until = hour_bucket(datetime.datetime.fromisoformat(self._since) + datetime.timedelta(hours=1))
+            await self._rebuild(guild_id, None, day_bucket(self._since), until, replace=False)
+            async with self.pool.writer(self._lane(guild_id)) as db:
+                await db.execute('''
+                    INSERT INTO bot_meta (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO NOTHING
+                ''', (f'{DONE_KEY}:{guild_id}', str(datetime.datetime.now())))
+                await db.commit()
+            self._pending.discard(guild_id)
+            log.info('Aktif kullanıcı taslakları hazır (sunucu %s)', guild_id)
+
+    async def rebuild(self, guild_id: int, since_hour: Optional[str], until_hour: str):
+        """Sıfırlanan aralığın taslaklarını kalan özet satırlarından yeniden üret"""
+        # Taslaktan kullanıcı çıkarılamaz; aralığa değen günler kalan satırlardan baştan hesaplanır.
+        # Bellekteki taslaklar önce yazılır ki yeniden üretilen günlere sonradan eklenmesinler
+        await self.checkpoint()
+        first_day = day_bucket(since_hour) if since_hour is not None else None
+        await self._rebuild(guild_id, first_day, day_bucket(until_hour), None, replace=True)
+
+    async def _rebuild(self, guild_id: int, first_day: Optional[str], last_day: str,
+                       until_hour: Optional[str], replace: bool):
+        """Gün gün: (replace ise) günün taslaklarını sil, özet satırlarından (hour < until_hour) üretip birleştir"""
+        day = first_day
+        while True:
+            day = await self._next_day(guild_id, day, last_day, replace)
+            if day is None:
+                return
+            upper = f'{next_day(day)} 00:00:00'
+            if until_hour is not None:
+                upper = min(upper, until_hour)
+            async with self.pool.writer(self._lane(guild_id)) as db:
+                try:
+                    if replace:
+                        await db.execute('''
+                            DELETE FROM active_user_sketches
+                            WHERE guild_id = ? AND ((grain = ? AND bucket >= ? AND bucket < ?)
+                                                    OR (grain = ? AND bucket = ?))
+                        ''', (guild_id, GRAIN_HOUR, f'{day} 00:00:00', f'{next_day(day)} 00:00:00',
+                              GRAIN_DAY, day))
+                    async with db.execute('''
+                        SELECT channel_id, user_id, hour FROM message_rollup_hourly
+                        WHERE guild_id = ? AND hour >= ? AND hour < ?
+                    ''', (guild_id, f'{day} 00:00:00', upper)) as cursor:
+                        rows = await cursor.fetchall()
+                    if rows:
+                        await merge_sketches(db, guild_id, build_sketches(sketch_users(rows)))
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+            if replace:
+                self.rebuilt_days += 1
+            else:
+                self.backfilled_days += 1
+            day = next_day(day)
+            # Günler arasında olay kuyruğu araya girebilir
+            await asyncio.sleep(0)
+
+    async def _next_day(self, guild_id: int, day: Optional[str], last_day: str,
+                        replace: bool) -> Optional[str]:
+        """[day, last_day] aralığında özet satırı (replace ise taslağı da) olan ilk gün"""
+        lower = f'{day} 00:00:00' if day is not None else ''
+        upper = f'{next_day(last_day)} 00:00:00'
+        candidates = []
+        async with self.pool.reader() as db:
+            async with db.execute('''
+                SELECT MIN(hour) FROM message_rollup_hourly
+                WHERE guild_id = ? AND hour >= ? AND hour < ?
+            ''', (guild_id, lower, upper)) as cursor:
+                candidates.append((await cursor.fetchone())[0])
+            if replace:
+                async with db.execute('''
+                    SELECT MIN(bucket) FROM active_user_sketches
+                    WHERE guild_id = ? AND grain = ? AND bucket >= ? AND bucket < ?
+                ''', (guild_id, GRAIN_HOUR, lower, upper)) as cursor:
+                    candidates.append((await cursor.fetchone())[0])
+        candidates = [hour for hour in candidates if hour is not None]
+        return day_bucket(min(candidates)) if candidates else None
+
+    async def estimate(self, guild_id: int, start_hour: str, end_hour: str,
+                       channel_id: int = GUILD_WIDE) -> int:
+        """[start_hour, end_hour) penceresindeki tahmini farklı kullanıcı sayısı"""
+        # Tam günler günlük taslaklardan, pencere kenarlarındaki saatler saatlik taslaklardan
+        first_day = day_bucket(start_hour)
+        if start_hour != f'{first_day} 00:00:00':
+            first_day = next_day(first_day)
+        end_day = day_bucket(end_hour)
+        if first_day < end_day:
+            ranges = [
+                (GRAIN_DAY, first_day, end_day),
+                (GRAIN_HOUR, start_hour, f'{first_day} 00:00:00'),
+                (GRAIN_HOUR, f'{end_day} 00:00:00', end_hour),
+            ]
+        else:
+            ranges = [(GRAIN_HOUR, start_hour, end_hour)]
+        # Henüz kaydedilmemiş taslaklar da pencereye eklenir (kayıt sorgu sürerken biterse de sayılsınlar)
+        sketches = [sketch for deltas in (self._writing.get(guild_id), self._deltas.get(guild_id))
+                    for (channel, grain, bucket), sketch in (deltas or {}).items()
+                    if channel == channel_id and any(grain == kind and lower <= bucket < upper
+                                                     for kind, lower, upper in ranges)]
+        condition = ' OR '.join('(grain = ? AND bucket >= ? AND bucket < ?)' for _ in ranges)
+        params = [value for bounds in ranges for value in bounds]
+        async with self.pool.reader() as db:
+            async with db.execute(f'''
+                SELECT registers FROM active_user_sketches
+                WHERE guild_id = ? AND channel_id = ? AND ({condition})
+            ''', (guild_id, channel_id, *params)) as cursor:
+                rows = await cursor.fetchall()
+        sketches.extend(HyperLogLog.from_bytes(registers) for registers, in rows)
+        self.estimates += 1
+        self.merged_sketches += len(rows)
+        return HyperLogLog.union(sketches).count()
+
+    def stats(self) -> Dict:
+        """Taslak istatistiklerini getir"""
+        return {
+            'pending_guilds': len(self._pending) if self._pending is not None else -1,
+            'estimates': self.estimates,
+            'merged_sketches': self.merged_sketches,
+            'backfilled_days': self.backfilled_days,
+            'rebuilt_days': self.rebuilt_days,
+            'pending_sketches': sum(len(sketches) for sketches in self._deltas.values()),
+            'checkpoints': self.checkpoints,
+            'checkpointed_sketches': self.checkpointed_sketches,
+        }
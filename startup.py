@@ -0,0 +1,51 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Başlangıç aşamalarının sürelerini ölçer ve raporlar"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._begun: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    def begin(self, name: str):
+        """Farklı yerlerde başlayıp biten bir aşamayı başlat"""
+        self._begun[name] = time.perf_counter()
+
+    def end(self, name: str) -> bool:
+        """begin() ile başlatılan aşamayı bitir; ilk bitişte True döndür"""
+        began = self._begun.pop(name, None)
+        if began is None:
+            return False
+        self.record(name, time.perf_counter() - began)
+        return True
+
+    @contextmanager
+    def phase(self, name: str):
+        """Bloğun süresini verilen aşama adıyla kaydet"""
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - began)
+
+    def elapsed(self) -> float:
+        """Sürecin başından bu yana geçen süre"""
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        parts = [f'{name}={seconds * 1000:.0f}ms' for name, seconds in self.phases.items()]
+        parts.append(f'toplam={self.elapsed() * 1000:.0f}ms')
+        return ' '.join(parts)
+
+    def log(self):
+        log.info('Başlangıç süreleri: %s', self.report())
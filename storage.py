@@ -0,0 +1,25 @@
+from typing import Optional
+
+from connection_pool import ConnectionPool
+
+# Depolama arka uçları aynı havuz arayüzünü sağlar:
+#   open() / close() / is_open / migrate() / stats() ve SQL lehçesi için dialect ('sqlite' / 'postgres')
+#   writer(shard=None) ve reader(): aiosqlite benzeri bağlantı veren bağlam yöneticileri
+#   (execute, executemany, commit, rollback; toplu ekleme için isteğe bağlı copy_records)
+#   shard verilirse arka uç o shard için ayrı bir yazıcı hattı kullanabilir
+# Database ve yardımcı motorlar yalnızca bu arayüzü ve iki arka ucun da anladığı SQL'i kullanır.
+BACKENDS = ('sqlite', 'postgres')
+
+
+def create_pool(backend: str = 'sqlite', db_name: str = 'discord_stats.db', dsn: Optional[str] = None,
+                readers: int = 4, profile: str = 'throughput',
+                cache_mb: Optional[int] = None, mmap_mb: Optional[int] = None):
+    """Seçilen arka uç için bağlantı havuzunu oluştur"""
+    if backend == 'sqlite':
+        return ConnectionPool(db_name, readers=readers, profile=profile, cache_mb=cache_mb, mmap_mb=mmap_mb)
+    if backend == 'postgres':
+        if not dsn:
+            raise ValueError('PostgreSQL arka ucu için DATABASE_URL gerekli')
+        from storage_postgres import PostgresPool
+        return PostgresPool(dsn, readers=readers)
+    raise ValueError(f"Bilinmeyen depolama arka ucu: {backend} ({', '.join(BACKENDS)})")
@@ -0,0 +1,439 @@
+import asyncio
+import itertools
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import asyncpg
+except ImportError:  # PostgreSQL arka ucu isteğe bağlıdır
+    asyncpg = None
+
+log = logging.getLogger(__name__)
+
+# Sürüm numaraları migrations.MIGRATIONS ile aynıdır; PostgreSQL şeması SQLite'ın
+# 6. sürümüyle eşdeğer bir temelden başlar, sonraki değişiklikler iki listeye de eklenir.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (6, 'Temel şema', [
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            channel_id BIGINT,
+            guild_id BIGINT,
+            timestamp TIMESTAMP,
+            content_length INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS voice_activity (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            channel_id BIGINT,
+            guild_id BIGINT,
+            join_time TIMESTAMP,
+            leave_time TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS emoji_usage (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            guild_id BIGINT,
+            emoji_id TEXT,
+            emoji_name TEXT,
+            timestamp TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS role_history (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            guild_id BIGINT,
+            role_id BIGINT,
+            action TEXT,
+            timestamp TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_levels (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            guild_id BIGINT,
+            xp DOUBLE PRECISION DEFAULT 0,
+            level INTEGER DEFAULT 0,
+            last_message_time TIMESTAMP
+        )
+        ''',
+        # is_current sorgularda 0/1 ile karşılaştırıldığı için tam sayı tutulur
+        '''
+        CREATE TABLE IF NOT EXISTS weekly_periods (
+            id BIGSERIAL PRIMARY KEY,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            is_current INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS permanent_stats (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            guild_id BIGINT,
+            total_messages INTEGER DEFAULT 0,
+            total_voice_minutes INTEGER DEFAULT 0,
+            last_updated TIMESTAMP,
+            UNIQUE(user_id, guild_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS xp_rates (
+            guild_id BIGINT PRIMARY KEY,
+            xp_per_message DOUBLE PRECISION DEFAULT 10.0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS message_rollup_hourly (
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            hour TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, channel_id, user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS voice_rollup_hourly (
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            hour TEXT NOT NULL,
+            voice_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, channel_id, user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            timezone TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_messages_guild_time ON messages (guild_id, timestamp, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_messages_guild_user ON messages (guild_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_voice_guild_user ON voice_activity (guild_id, user_id, channel_id, leave_time)',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_voice_open ON voice_activity (guild_id, user_id, join_time, channel_id)
+        WHERE leave_time IS NULL
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_emoji_guild_name ON emoji_usage (guild_id, emoji_name)',
+        'CREATE INDEX IF NOT EXISTS idx_roles_guild_user ON role_history (guild_id, user_id, timestamp)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_levels_user_guild ON user_levels (user_id, guild_id)',
+        'CREATE INDEX IF NOT EXISTS idx_levels_guild_rank ON user_levels (guild_id, level DESC, xp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_weekly_current ON weekly_periods (is_current)',
+        'CREATE INDEX IF NOT EXISTS idx_msg_rollup_channel ON message_rollup_hourly (guild_id, channel_id, hour)',
+        'CREATE INDEX IF NOT EXISTS idx_msg_rollup_user ON message_rollup_hourly (guild_id, user_id, hour)',
+        'CREATE INDEX IF NOT EXISTS idx_voice_rollup_user ON voice_rollup_hourly (guild_id, user_id, hour)',
+    ]),
+    (7, 'Aylık ham olay bölümleri, saklama süresi ve emoji özeti', [
+        '''
+        CREATE TABLE IF NOT EXISTS event_partitions (
+            base TEXT NOT NULL,
+            month TEXT NOT NULL,
+            PRIMARY KEY (base, month)
+        )
+        ''',
+        'ALTER TABLE guild_settings ADD COLUMN IF NOT EXISTS retention_days INTEGER',
+        '''
+        CREATE TABLE IF NOT EXISTS emoji_rollup (
+            guild_id BIGINT NOT NULL,
+            emoji_name TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, emoji_name, user_id)
+        )
+        ''',
+        '''
+        INSERT INTO emoji_rollup (guild_id, emoji_name, user_id, usage_count)
+        SELECT COALESCE(guild_id, 0), COALESCE(emoji_name, ''), COALESCE(user_id, 0), COUNT(*)
+        FROM emoji_usage
+        GROUP BY 1, 2, 3
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_emoji_rollup_user ON emoji_rollup (guild_id, user_id)',
+    ]),
+    (8, 'Sıfırlama işaretleri', [
+        '''
+        CREATE TABLE IF NOT EXISTS reset_markers (
+            id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT,
+            since TIMESTAMP,
+            until TIMESTAMP NOT NULL,
+            since_hour TEXT,
+            until_hour TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_reset_markers_guild ON reset_markers (guild_id, user_id)',
+    ]),
+    (9, 'Üye adları', [
+        '''
+        CREATE TABLE IF NOT EXISTS member_names (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            display_name TEXT,
+            is_member INTEGER NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        ''',
+    ]),
+    (10, 'Aktif kullanıcı taslakları', [
+        '''
+        CREATE TABLE IF NOT EXISTS active_user_sketches (
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            grain INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            registers BYTEA NOT NULL,
+            PRIMARY KEY (guild_id, grain, bucket, channel_id)
+        )
+        ''',
+    ]),
+]
+
+# Aynı anda başlayan shard'ların şemayı birlikte yükseltmemesi için
+MIGRATION_LOCK_ID = 0x5354415453
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> str:
+    """SQLite '?' parametrelerini PostgreSQL '$n' biçimine çevir"""
+    counter = itertools.count(1)
+    return re.sub(r'\?', lambda _: f'${next(counter)}', sql)
+
+
+class PgCursor:
+    """aiosqlite imlecinin kullanılan kısmını taklit eden sonuç listesi"""
+
+    def __init__(self, rows: List[tuple]):
+        self._rows = rows
+        self._position = 0
+
+    async def fetchone(self) -> Optional[tuple]:
+        if self._position >= len(self._rows):
+            return None
+        row = self._rows[self._position]
+        self._position += 1
+        return row
+
+    async def fetchmany(self, size: int) -> List[tuple]:
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    async def fetchall(self) -> List[tuple]:
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+
+class PgQuery:
+    """aiosqlite gibi hem await hem async with ile kullanılabilen sorgu"""
+
+    def __init__(self, conn: 'PgConnection', sql: str, params: Sequence):
+        self.conn = conn
+        self.sql = sql
+        self.params = params
+
+    async def _run(self) -> PgCursor:
+        rows = await self.conn.fetch(self.sql, self.params)
+        return PgCursor([tuple(row) for row in rows])
+
+    def __await__(self):
+        return self._run().__await__()
+
+    async def __aenter__(self) -> PgCursor:
+        return await self._run()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class PgConnection:
+    """asyncpg bağlantısını aiosqlite arayüzüyle sunar (execute/executemany/commit/rollback)"""
+
+    def __init__(self, conn, readonly: bool = False):
+        self._conn = conn
+        self._readonly = readonly
+        self._transaction = None
+
+    async def _begin(self):
+        # sqlite3 gibi ilk yazma komutunda örtük işlem başlatılır
+        if self._transaction is None and not self._readonly:
+            transaction = self._conn.transaction()
+            # Başlatma iptal edilir ya da başarısız olursa geri alınacak işlem yoktur (bağlantı havuza
+            # dönerken sıfırlanır); geri alma denemesi asıl hatanın (ör. CancelledError) yerini almasın
+            await transaction.start()
+            self._transaction = transaction
+
+    async def fetch(self, sql: str, params: Sequence = ()) -> list:
+        await self._begin()
+        return await self._conn.fetch(translate(sql), *params)
+
+    def execute(self, sql: str, params: Sequence = ()) -> PgQuery:
+        return PgQuery(self, sql, params)
+
+    async def executemany(self, sql: str, rows: Iterable[Sequence]):
+        rows = list(rows)
+        if not rows:
+            return
+        await self._begin()
+        await self._conn.executemany(translate(sql), rows)
+
+    async def copy_records(self, table: str, columns: Sequence[str], rows: List[tuple]):
+        """Eklenen satırları tek COPY ile yaz"""
+        await self._begin()
+        await self._conn.copy_records_to_table(table, records=rows, columns=list(columns))
+
+    async def commit(self):
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            await transaction.commit()
+
+    async def rollback(self):
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            await transaction.rollback()
+
+
+class PostgresPool:
+    """Birden çok bot sürecinin (shard) paylaşabileceği asyncpg havuzu; ConnectionPool ile aynı arayüz"""
+
+    dialect = 'postgres'
+
+    def __init__(self, dsn: str, readers: int = 4, min_size: int = 1, shard_writers: int = 0):
+        self.dsn = dsn
+        self.profile = 'postgres'
+        self.journal_mode = None
+        self.reader_count = max(1, readers)
+        self.min_size = min_size
+        # Shard kuyrukları için ayrı yazıcı hatları (0: hepsi ortak yazıcıyı kullanır)
+        self.shard_writers = shard_writers
+        self._pool = None
+        # Süreç içinde yazıcılar SQLite'taki gibi sıralıdır; süreçler arası eşzamanlıdır
+        self._writer_lock: Optional[asyncio.Lock] = None
+        # Her shard hattı kendi bağlantısıyla ortak yazıcıdan bağımsız yazar.
+        # Bir sunucu tek bir shard'a ait olduğundan hatlar aynı satırlara dokunmaz.
+        self._shard_locks: List[asyncio.Lock] = []
+
+        self._checkouts = {'writer': 0, 'reader': 0}
+        self._wait_total = {'writer': 0.0, 'reader': 0.0}
+        self._wait_max = {'writer': 0.0, 'reader': 0.0}
+
+    @property
+    def is_open(self) -> bool:
+        return self._pool is not None
+
+    async def open(self):
+        """Bağlantı havuzunu aç"""
+        if self.is_open:
+            return
+        if asyncpg is None:
+            raise RuntimeError('PostgreSQL arka ucu için asyncpg gerekli: pip install -r requirements-postgres.txt')
+        self._writer_lock = asyncio.Lock()
+        self._shard_locks = [asyncio.Lock() for _ in range(max(0, self.shard_writers))]
+        # Okuyucular + ortak yazıcı + shard yazıcıları
+        max_size = self.reader_count + 1 + len(self._shard_locks)
+        self._pool = await asyncpg.create_pool(
+            self.dsn, min_size=min(self.min_size, max_size), max_size=max_size
+        )
+
+    async def close(self):
+        """Tüm bağlantıları kapat"""
+        if not self.is_open:
+            return
+        # Süren yazma işlemlerinin bitmesini bekle
+        for lock in self._shard_locks:
+            await lock.acquire()
+        try:
+            async with self._writer_lock:
+                await self._pool.close()
+                self._pool = None
+        finally:
+            for lock in self._shard_locks:
+                lock.release()
+
+    async def migrate(self) -> List[int]:
+        """Bekleyen şema sürümlerini uygula, uygulanan sürümleri döndür"""
+        applied = []
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('SELECT pg_advisory_xact_lock($1)', MIGRATION_LOCK_ID)
+                await conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+                current = await conn.fetchval('SELECT MAX(version) FROM schema_version') or 0
+                for version, description, steps in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    log.info('PostgreSQL şema sürümü %d uygulanıyor: %s', version, description)
+                    for step in steps:
+                        await conn.execute(step)
+                    await conn.execute('INSERT INTO schema_version (version) VALUES ($1)', version)
+                    applied.append(version)
+        return applied
+
+    def _record(self, kind: str, waited: float):
+        self._checkouts[kind] += 1
+        self._wait_total[kind] += waited
+        if waited > self._wait_max[kind]:
+            self._wait_max[kind] = waited
+
+    def _lane(self, shard: Optional[int]) -> asyncio.Lock:
+        if shard is None or not self._shard_locks:
+            return self._writer_lock
+        return self._shard_locks[shard % len(self._shard_locks)]
+
+    @asynccontextmanager
+    async def writer(self, shard: Optional[int] = None):
+        """Yazma bağlantısı ödünç al; commit edilmeden bırakılan işlem geri alınır"""
+        started = time.perf_counter()
+        async with self._lane(shard):
+            async with self._pool.acquire() as conn:
+                self._record('writer', time.perf_counter() - started)
+                wrapped = PgConnection(conn)
+                try:
+                    yield wrapped
+                finally:
+                    await wrapped.rollback()
+
+    @asynccontextmanager
+    async def reader(self):
+        """Okuma bağlantısı ödünç al"""
+        started = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            self._record('reader', time.perf_counter() - started)
+            yield PgConnection(conn, readonly=True)
+
+    def stats(self) -> Dict:
+        """Havuz kullanım istatistiklerini getir"""
+        stats = {
+            'profile': self.profile,
+            'journal_mode': self.journal_mode,
+            'readers': self.reader_count,
+            'idle_readers': self._pool.get_idle_size() if self._pool else 0,
+            'writer_busy': self._writer_lock.locked() if self._writer_lock else False,
+            'shard_writers': len(self._shard_locks),
+        }
+        for kind in ('writer', 'reader'):
+            checkouts = self._checkouts[kind]
+            stats[f'{kind}_checkouts'] = checkouts
+            stats[f'{kind}_wait_total_ms'] = round(self._wait_total[kind] * 1000, 3)
+            stats[f'{kind}_wait_avg_ms'] = round(self._wait_total[kind] * 1000 / checkouts, 3) if checkouts else 0.0
+            stats[f'{kind}_wait_max_ms'] = round(self._wait_max[kind] * 1000, 3)
+        return stats
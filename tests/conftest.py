@@ -0,0 +1,90 @@
+"""Database testleri için ortak düzen.
+
+Her test SQLite ile çalışır; DATABASE_URL yerel bir PostgreSQL sunucusunu gösteriyorsa
+aynı testler PostgreSQL ile de çalışır. PostgreSQL testleri DATABASE_URL'deki veritabanına
+dokunmaz: aynı sunucuda geçici bir test veritabanı oluşturulur ve oturum sonunda silinir.
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres python -m pytest
+"""
+import asyncio
+import os
+import urllib.parse
+from typing import Awaitable, Callable
+
+import pytest
+
+from database import Database
+
+TEST_DATABASE = 'discord_stats_test'
+LOCAL_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+
+
+def postgres_url() -> str:
+    """Testlerin kullanabileceği yerel PostgreSQL adresi (yoksa boş)"""
+    url = os.getenv('DATABASE_URL', '')
+    if not url.startswith(('postgres://', 'postgresql://')):
+        return ''
+    parts = urllib.parse.urlsplit(url)
+    # Unix soketi (?host=/yol) ya da yerel adres
+    host = urllib.parse.parse_qs(parts.query).get('host', [parts.hostname or ''])[0]
+    return url if host.startswith('/') or host in LOCAL_HOSTS else ''
+
+
+BACKENDS = [
+    'sqlite',
+    pytest.param('postgres', marks=pytest.mark.skipif(
+        not postgres_url(), reason='DATABASE_URL yerel bir PostgreSQL sunucusunu göstermiyor')),
+]
+
+
+async def _admin(url: str, *statements: str):
+    import asyncpg
+
+    conn = await asyncpg.connect(url)
+    try:
+        for statement in statements:
+            await conn.execute(statement)
+    finally:
+        await conn.close()
+
+
+@pytest.fixture(scope='session')
+def postgres_dsn():
+    """Oturum boyunca kullanılan geçici PostgreSQL test veritabanının adresi"""
+    pytest.importorskip('asyncpg')
+    url = postgres_url()
+    drop = f'DROP DATABASE IF EXISTS {TEST_DATABASE}'
+    asyncio.run(_admin(url, drop, f'CREATE DATABASE {TEST_DATABASE}'))
+    yield urllib.parse.urlsplit(url)._replace(path=f'/{TEST_DATABASE}').geturl()
+    asyncio.run(_admin(url, drop))
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def database(backend, tmp_path, request) -> Callable[..., None]:
+    """Senaryoyu açılmış bir Database ile çalıştıran fonksiyon.
+
+    database(senaryo, **ayarlar): senaryo(db) bir coroutine fonksiyonudur; aynı testte tekrar
+    çağrılırsa aynı veritabanı yeniden açılır (kalıcılık testleri için).
+    """
+    options = {'db_name': str(tmp_path / 'stats.db')}
+    if backend == 'postgres':
+        dsn = request.getfixturevalue('postgres_dsn')
+        asyncio.run(_admin(dsn, 'DROP SCHEMA IF EXISTS archive CASCADE',
+                           'DROP SCHEMA public CASCADE', 'CREATE SCHEMA public'))
+        options = {'backend': 'postgres', 'dsn': dsn}
+
+    def run(scenario: Callable[[Database], Awaitable[None]], **settings):
+        async def main():
+            db = Database(**options, **settings)
+            await db.setup()
+            try:
+                await scenario(db)
+            finally:
+                await db.close()
+        asyncio.run(main())
+    return run
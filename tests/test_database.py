@@ -0,0 +1,266 @@
+"""Database'in genel metotlarının SQLite ve PostgreSQL'de aynı sonuçları verdiğini doğrular."""
+import datetime
+from collections import Counter
+
+from names import fetch_size
+from rollups import hour_bucket, split_into_hours
+
+GUILD = 1
+OTHER_GUILD = 2
+USERS = (1, 2, 3, 4)
+# Her periyoda farklı düşen mesaj zamanları (şu andan geriye)
+OFFSETS = (
+    datetime.timedelta(minutes=5),
+    datetime.timedelta(hours=30),
+    datetime.timedelta(days=3),
+    datetime.timedelta(days=20),
+    datetime.timedelta(days=60),
+)
+
+
+def periods(now: datetime.datetime):
+    """Kayan, takvim, tüm zamanlar ve özel aralık periyotları"""
+    date_range = f'{(now - datetime.timedelta(days=25)).date()}..{(now - datetime.timedelta(days=2)).date()}'
+    return ('günlük', 'haftalık', 'aylık', 'bugün', 'bu-hafta', 'bu-ay', 'tümü', date_range)
+
+
+async def log_messages(db, now: datetime.datetime):
+    """Kullanıcı başına farklı sayıda mesaj kaydet; (user_id, channel_id, zaman) listesini döndür"""
+    events = []
+    for user_id in USERS:
+        for index, offset in enumerate(OFFSETS):
+            for count in range(user_id + index):
+                timestamp = now - offset - datetime.timedelta(seconds=user_id * 10 + count)
+                channel_id = 10 + count % 2
+                await db.log_message(user_id, channel_id, GUILD, timestamp)
+                events.append((user_id, channel_id, timestamp))
+    # Başka sunucunun olayları sonuçlara karışmamalı
+    await db.log_message(1, 10, OTHER_GUILD, now)
+    await db.ingest.flush()
+    return events
+
+
+async def in_window(db, period: str, events):
+    """Olaylardan periyodun saatlik penceresine düşenleri seç"""
+    start_hour, end_hour = (await db.periods.window(GUILD, period)).hours
+    return [event for event in events if start_hour <= hour_bucket(event[-1]) < end_hour]
+
+
+def test_message_counts_and_leaderboards_for_every_period(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        events = await log_messages(db, now)
+        for period in periods(now):
+            selected = await in_window(db, period, events)
+            per_user = Counter(user_id for user_id, _, _ in selected)
+
+            assert await db.get_message_count(GUILD, period) == len(selected), period
+            assert await db.get_active_users_count(GUILD, period, exact=True) == len(per_user), period
+            leaderboard = await db.get_message_leaderboard(GUILD, period)
+            assert [tuple(row) for row in leaderboard] == per_user.most_common(), period
+            assert [tuple(row) for row in await db.get_message_leaderboard(GUILD, period, limit=2)] \
+                == per_user.most_common(2), period
+
+        for user_id in USERS:
+            expected = sum(1 for event in events if event[0] == user_id)
+            assert await db.get_user_message_count(user_id, GUILD) == expected
+        assert await db.get_message_count(OTHER_GUILD, 'tümü') == 1
+
+    database(scenario)
+
+
+def test_record_message_updates_names_permanent_stats_and_xp(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        for _ in range(3):
+            leveled_up, level = await db.record_message(7, 10, GUILD, 'Ayşe', now)
+            assert (leveled_up, level) == (False, 0)
+        await db.ingest.flush()
+
+        assert await db.get_message_count(GUILD, 'günlük') == 3
+        assert [tuple(row) for row in await db.get_permanent_stats(GUILD)] == [(7, 3, 0)]
+        assert await db.get_user_level(7, GUILD) == (30.0, 0)
+        await db.names.checkpoint()
+        async with db.pool.reader() as conn:
+            async with conn.execute('''
+                SELECT display_name FROM member_names WHERE guild_id = ? AND user_id = ?
+            ''', (GUILD, 7)) as cursor:
+                assert await cursor.fetchone() == ('Ayşe',)
+
+    database(scenario)
+
+
+def test_channel_stats(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        events = await log_messages(db, now)
+        for period in ('günlük', 'aylık'):
+            selected = await in_window(db, period, events)
+            overview = await db.get_channels_stats(GUILD, None, period)
+            assert set(overview) == {channel_id for _, channel_id, _ in selected}
+            for channel_id in (10, 11):
+                per_user = Counter(user_id for user_id, channel, _ in selected if channel == channel_id)
+                per_hour = Counter(timestamp.strftime('%H') for _, channel, timestamp in selected
+                                   if channel == channel_id)
+                stats = await db.get_channel_stats(channel_id, GUILD, period)
+                assert stats.message_count == sum(per_user.values())
+                assert stats.active_users == len(per_user)
+                # Eşit sayılarda sıra belirsizdir; sayılar ve her girdinin değeri karşılaştırılır
+                for ranked, totals in ((stats.top_users, per_user), (stats.peak_hours, per_hour)):
+                    assert [count for _, count in ranked] == sorted(totals.values(), reverse=True)[:5]
+                    assert all(totals[key] == count for key, count in ranked)
+
+        # Mesajı olmayan kanal boş istatistik döner
+        empty = await db.get_channel_stats(99, GUILD, 'günlük')
+        assert (empty.message_count, empty.active_users, empty.top_users) == (0, 0, [])
+
+    database(scenario)
+
+
+class Member:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.display_name = f'üye {user_id}'
+
+
+class Guild:
+    """Yalnızca `members` kümesindeki kullanıcıların hâlâ üye olduğu sunucu"""
+
+    def __init__(self, guild_id: int, members):
+        self.id = guild_id
+        self.members = set(members)
+
+    def get_member(self, user_id: int):
+        return Member(user_id) if user_id in self.members else None
+
+    async def query_members(self, user_ids, limit, cache):
+        return []
+
+
+def test_rank_reuses_prefetched_channel_top_users(database):
+    async def scenario(db):
+        await log_messages(db, datetime.datetime.now())
+        fetches = []
+
+        async def fetch(limit):
+            fetches.append(limit)
+            return (await db.get_channel_stats(10, GUILD, 'aylık', limit)).top_users
+
+        # !kanal istatistikleri ve en aktif kullanıcıları tek sorguda getirir
+        stats = await db.get_channel_stats(10, GUILD, 'aylık', fetch_size(2))
+        leaders = [row[0] for row in stats.top_users]
+        ranked = await db.names.rank(Guild(GUILD, leaders[1:]), fetch, limit=2, rows=stats.top_users)
+        assert [row for _, row in ranked] == stats.top_users[1:3] and fetches == []
+
+        # Yeterli üye kalmazsa sıralama daha fazla satırla yeniden istenir
+        # (ad önbelleği sunucu başına tutulduğu için üyelik başka bir sunucu kimliğiyle değişir)
+        ranked = await db.names.rank(Guild(OTHER_GUILD, leaders[-1:]), fetch, limit=2, rows=stats.top_users)
+        assert [row for _, row in ranked] == stats.top_users[-1:] and fetches == [fetch_size(2) * 4]
+
+    database(scenario)
+
+
+def test_voice_join_move_leave(database):
+    async def scenario(db):
+        now = datetime.datetime.now().replace(microsecond=0)
+        joined = now - datetime.timedelta(minutes=70)
+        moved = now - datetime.timedelta(minutes=30)
+
+        await db.record_voice_update(1, GUILD, None, 50, joined)
+        # Açık oturum sorgularda bellekten sayılır
+        assert await db.get_user_voice_time(1, GUILD) >= 69
+        assert await db.log_voice_move(1, 51, GUILD, moved) == 40
+        assert await db.log_voice_leave(1, 51, GUILD, now) == 30
+        await db.ingest.flush()
+
+        assert await db.get_user_voice_time(1, GUILD) == 70
+        assert [tuple(row) for row in await db.get_permanent_stats(GUILD)] == [(1, 0, 70)]
+        for period in ('günlük', 'haftalık', 'aylık', 'tümü', 'bugün'):
+            start_hour, end_hour = (await db.periods.window(GUILD, period, weekly=True)).hours
+            seconds = sum(seconds for hour, seconds in split_into_hours(joined, now).items()
+                          if start_hour <= hour < end_hour)
+            expected = [(1, int(seconds // 60))] if seconds else []
+            assert await db.get_voice_leaderboard(GUILD, period) == expected, period
+
+        # Ayrılmadan önce tekrar katılma eski oturumu kapatır
+        await db.log_voice_join(2, 50, GUILD, moved)
+        await db.log_voice_join(2, 51, GUILD, now)
+        assert await db.get_user_voice_time(2, GUILD) == 30
+
+    database(scenario)
+
+
+def test_xp_levels_and_rates(database):
+    async def first(db):
+        level_ups = []
+        for _ in range(12):
+            level_ups.append(await db.update_user_xp(1, GUILD, 10.5))
+        # 100 XP'yi geçen mesajda seviye atlanır, yalnızca bir kez
+        assert level_ups.count((True, 1)) == 1 and level_ups[9] == (True, 1)
+        assert await db.get_user_level(1, GUILD) == (126.0, 1)
+
+        await db.update_xp_rate(GUILD, 15)
+        assert await db.get_xp_rate(GUILD) == 15
+        await db.update_user_xp(2, GUILD)
+        await db.xp.checkpoint()
+        assert [tuple(row) for row in await db.get_top_users(GUILD)] == [(1, 126.0, 1), (2, 15.0, 0)]
+
+    async def second(db):
+        # Yeniden açılışta değerler tablodan, bellekteki ile aynı biçimde okunur
+        assert await db.get_user_level(1, GUILD) == (126.0, 1)
+        assert await db.get_user_level(2, GUILD) == (15.0, 0)
+        assert await db.get_user_level(3, GUILD) == (0.0, 0)
+        assert await db.get_xp_rate(GUILD) == 15
+
+    database(first)
+    database(second)
+
+
+def test_reset_user_stats(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        events = await log_messages(db, now)
+        await db.log_emoji_usage(1, GUILD, None, '👍')
+        await db.log_emoji_usage(2, GUILD, None, '🎉')
+        await db.update_permanent_stats(1, GUILD, messages=5, voice_minutes=3)
+        await db.update_user_xp(1, GUILD, 150)
+        await db.xp.checkpoint()
+        await db.ingest.flush()
+
+        await db.reset_user_stats(1, GUILD)
+
+        remaining = [event for event in events if event[0] != 1]
+        assert await db.get_message_count(GUILD, 'tümü') == len(remaining)
+        assert await db.get_user_message_count(1, GUILD) == 0
+        assert 1 not in dict(await db.get_message_leaderboard(GUILD, 'tümü'))
+        assert await db.get_emoji_stats(GUILD) == {'🎉': 1}
+        assert await db.get_user_level(1, GUILD) == (0.0, 0)
+        assert [tuple(row) for row in await db.get_permanent_stats(GUILD)] == [(1, 0, 0)]
+
+        # Sıfırlamadan sonraki olaylar sayılır
+        await db.log_message(1, 10, GUILD, datetime.datetime.now())
+        await db.ingest.flush()
+        assert await db.get_user_message_count(1, GUILD) == 1
+
+    database(scenario)
+
+
+def test_reset_period_stats(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        events = await log_messages(db, now)
+        window = await db.periods.window(GUILD, 'haftalık')
+
+        # Desteklenmeyen periyotlar hiçbir şeyi silmez
+        await db.reset_period_stats(GUILD, 'günlük')
+        assert await db.get_message_count(GUILD, 'tümü') == len(events)
+
+        await db.reset_period_stats(GUILD, 'haftalık')
+        kept = [event for event in events if hour_bucket(event[-1]) < window.start_hour]
+        assert await db.get_message_count(GUILD, 'haftalık') == 0
+        assert await db.get_message_count(GUILD, 'tümü') == len(kept)
+        assert [tuple(row) for row in await db.get_message_leaderboard(GUILD, 'aylık')] == \
+            Counter(user_id for user_id, _, _ in await in_window(db, 'aylık', kept)).most_common()
+        assert await db.get_message_count(OTHER_GUILD, 'tümü') == 1
+
+    database(scenario)
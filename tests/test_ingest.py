@@ -0,0 +1,78 @@
+"""Olay kuyruğunun süren trafikte partileri küçültmeden yazdığını ve kapanışta boşaldığını doğrular."""
+import asyncio
+import datetime
+
+import pytest
+
+import ingest
+from rollups import message_rollup_rows
+
+GUILD = 1
+
+
+def test_flush_returns_under_traffic_and_close_drains(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        queue = db.ingest.queue(GUILD)
+        sent = 0
+
+        async def traffic():
+            nonlocal sent
+            while True:
+                queue.add_message(sent % 50, 10, GUILD, now)
+                sent += 1
+                await asyncio.sleep(0)
+
+        for _ in range(500):
+            queue.add_message(sent % 50, 10, GUILD, now)
+            sent += 1
+        task = asyncio.create_task(traffic())
+        try:
+            # Yazma sürerken gelen olaylar beklenmez; flush trafik kesilmeden döner
+            await asyncio.wait_for(db.ingest.flush(), timeout=10)
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        await db.ingest.flush()
+        assert len(db.ingest) == 0
+        assert await db.get_message_count(GUILD, 'tümü') == sent
+        # Her yazma en fazla bir parti; partiler olay başına değil, birikmiş olaylarla yazılır
+        assert queue.flushed_rows / queue.flushes > 10
+
+    database(scenario)
+
+
+def test_failed_retry_does_not_lose_or_merge_new_events(database, monkeypatch):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        queue = db.ingest.queue(GUILD)
+        attempts = []
+
+        def failing(messages):
+            # İlk iki yazma işlemin içinde başarısız olur ve geri alınır
+            attempts.append(len(messages))
+            if len(attempts) <= 2:
+                raise RuntimeError('yazma hatası')
+            return message_rollup_rows(messages)
+
+        monkeypatch.setattr(ingest, 'message_rollup_rows', failing)
+        queue.add_message(1, 10, GUILD, now)
+        with pytest.raises(RuntimeError):
+            await queue.flush()
+        queue.add_message(2, 10, GUILD, now)
+        queue.add_message(3, 10, GUILD, now)
+        # Tekrar denenen parti yine yazılamazsa yeni olaylar denenmeden kuyruğa geri döner
+        with pytest.raises(RuntimeError):
+            await queue.flush()
+        assert attempts == [1, 1] and len(queue) == 3
+
+        await queue.flush()
+        # Parti ve yeni olaylar ayrı işlemlerde yazılır
+        assert attempts == [1, 1, 1, 2] and len(queue) == 0
+        assert await db.get_message_count(GUILD, 'tümü') == 3
+
+    database(scenario)
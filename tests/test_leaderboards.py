@@ -0,0 +1,107 @@
+"""Bellekteki sıralamaların kapasite içindeki her limit için özet tablolarıyla birebir aynı olduğunu doğrular."""
+import datetime
+import random
+from collections import Counter
+
+import pytest
+
+from leaderboards import TopK
+from rollups import hour_bucket
+
+GUILD = 1
+
+
+def zipf_stream(keys: int, length: int, seed: int):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    return rng.choices(range(keys), weights=weights, k=length)
+
+
+def assert_exact(ranked, counts: Counter, limit: int):
+    """Sonuç gerçek sayılarla ve gerçek ilk `limit` sayılarıyla aynı olmalı (eşitlikte sıra serbest)"""
+    assert all(counts[key] == count for key, count in ranked)
+    assert [count for _, count in ranked] == sorted(counts.values(), reverse=True)[:limit]
+
+
+@pytest.mark.parametrize('limit', [1, 10, 50])
+def test_exact_when_capacity_covers_all_keys(limit):
+    board = TopK(capacity=50)
+    stream = zipf_stream(50, 5000, seed=limit)
+    for key in stream:
+        board.add(key)
+    ranked = board.top(limit)
+    assert ranked is not None
+    assert_exact(ranked, Counter(stream), limit)
+
+
+def test_answers_are_exact_or_refused_under_eviction():
+    board = TopK(capacity=40)
+    counts = Counter()
+    answered = 0
+    for step, key in enumerate(zipf_stream(400, 20000, seed=1)):
+        board.add(key)
+        counts[key] += 1
+        if step % 500 == 499:
+            for limit in (1, 5, 20, 40):
+                ranked = board.top(limit)
+                if ranked is not None:
+                    answered += 1
+                    assert_exact(ranked, counts, limit)
+    # Eğik dağılımda baştaki anahtarlar tahliyelerden etkilenmez
+    assert answered > 0
+
+
+def test_from_rows_and_subtract_stay_exact():
+    counts = Counter({key: 100 - key for key in range(30)})
+    rows = counts.most_common(11)
+    board = TopK.from_rows(10, rows)
+    assert board.floor == rows[10][1]
+    assert_exact(board.top(10), counts, 10)
+
+    # Pencereden çıkan sayımlar düşülür; sıralama değişince kesinlik korunamıyorsa None
+    for key in range(5):
+        board.subtract(key, 50)
+        counts[key] -= 50
+    ranked = board.top(5)
+    if ranked is not None:
+        assert_exact(ranked, counts, 5)
+    assert_exact(board.top(3), counts, 3)
+
+
+def test_database_leaderboards_match_rollups(database):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        counts = {period: Counter() for period in ('günlük', 'haftalık', 'aylık', 'tümü')}
+        # Kullanıcı i, i mesaj gönderir; kapasite kullanıcı sayısından küçük
+        for user_id in range(1, 61):
+            for index in range(user_id):
+                age = datetime.timedelta(hours=(user_id * 7 + index * 13) % (24 * 40))
+                await db.log_message(user_id, 10, GUILD, now - age)
+                for period in counts:
+                    start_hour, end_hour = (await db.periods.window(GUILD, period)).hours
+                    if start_hour <= hour_bucket(now - age) < end_hour:
+                        counts[period][user_id] += 1
+        await db.ingest.flush()
+
+        async def check():
+            for period, expected in counts.items():
+                for limit in (1, 5, 10, 20, 30):
+                    ranked = await db.get_message_leaderboard(GUILD, period, limit)
+                    assert_exact([tuple(row) for row in ranked], expected, limit)
+
+        await check()
+        served = db.leaderboards.served
+        assert served > 0
+
+        # Sonraki mesajlar izlenen sıralamalara kuyruktan eklenir
+        for user_id in (1, 2, 3):
+            for _ in range(100):
+                await db.log_message(user_id, 10, GUILD, now)
+        await db.ingest.flush()
+        for expected in counts.values():
+            for user_id in (1, 2, 3):
+                expected[user_id] += 100
+        await check()
+        assert db.leaderboards.served > served
+
+    database(scenario, leaderboard_capacity=20)
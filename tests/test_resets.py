@@ -0,0 +1,121 @@
+"""Sıfırlama işaretlerinin verileri hemen gizlediğini ve sıkıştırmanın sonuçları değiştirmediğini doğrular."""
+import datetime
+from collections import Counter
+
+import pytest
+
+from resets import ResetCompactor
+from rollups import hour_bucket
+
+GUILD = 1
+PERIODS = ('günlük', 'haftalık', 'aylık', 'tümü')
+
+
+@pytest.fixture
+def manual_compaction(monkeypatch):
+    """Arka plan sıkıştırıcısını kapat; işaretler yalnızca compact() çağrılınca işlenir"""
+    monkeypatch.setattr(ResetCompactor, 'start', lambda self: None)
+
+
+async def fill(db, now: datetime.datetime):
+    """Mesaj, emoji ve ses kayıtları oluştur; mesajların (user_id, zaman) listesini döndür"""
+    messages = []
+    for user_id in (1, 2, 3):
+        for days in (0, 2, 10, 40):
+            for count in range(user_id + days % 3):
+                timestamp = now - datetime.timedelta(days=days, minutes=5 + count)
+                await db.log_message(user_id, 10 + count % 2, GUILD, timestamp)
+                messages.append((user_id, timestamp))
+        await db.log_emoji_usage(user_id, GUILD, None, f'e{user_id}')
+        joined = now - datetime.timedelta(days=3, hours=user_id)
+        await db.log_voice_join(user_id, 50, GUILD, joined)
+        await db.log_voice_leave(user_id, 50, GUILD, joined + datetime.timedelta(minutes=20 * user_id))
+    await db.ingest.flush()
+    return messages
+
+
+async def snapshot(db) -> dict:
+    """Sıfırlamalardan etkilenen tüm sorguların sonuçları (önbellek ve bellekteki sıralamalar atlanarak)"""
+    db.cache.clear()
+    db.leaderboards.forget(GUILD)
+    result = {}
+    for period in PERIODS:
+        result[period] = (
+            await db.get_message_count(GUILD, period),
+            await db.get_active_users_count(GUILD, period, exact=True),
+            [tuple(row) for row in await db.get_message_leaderboard(GUILD, period)],
+            await db.get_voice_leaderboard(GUILD, period),
+            {channel_id: (stats.message_count, stats.active_users)
+             for channel_id, stats in (await db.get_channels_stats(GUILD, None, period)).items()},
+        )
+    for user_id in (1, 2, 3):
+        result[user_id] = (await db.get_user_message_count(user_id, GUILD),
+                           await db.get_user_voice_time(user_id, GUILD))
+    result['emoji'] = await db.get_emoji_stats(GUILD)
+    return result
+
+
+async def raw_rows(db, user_id: int) -> int:
+    total = 0
+    async with db.pool.reader() as conn:
+        for table in db.partitions.tables('messages'):
+            async with conn.execute(f'SELECT COUNT(*) FROM {table} WHERE guild_id = ? AND user_id = ?',
+                                    (GUILD, user_id)) as cursor:
+                total += (await cursor.fetchone())[0]
+    return total
+
+
+def test_markers_hide_data_before_compaction_and_compaction_keeps_results(database, manual_compaction):
+    async def scenario(db):
+        now = datetime.datetime.now()
+        messages = await fill(db, now)
+        week_start = (await db.periods.window(GUILD, 'haftalık')).start_hour
+
+        await db.reset_user_stats(1, GUILD)
+        await db.reset_period_stats(GUILD, 'haftalık')
+        assert db.resets.pending(GUILD)
+        # Ham satırlar henüz silinmedi, ama hiçbir sorguda görünmez
+        assert await raw_rows(db, 1) > 0
+        hidden = await snapshot(db)
+
+        assert hidden[1] == (0, 0)
+        assert 'e1' not in hidden['emoji']
+        for period in PERIODS:
+            count, active, leaderboard, voice, channels = hidden[period]
+            assert 1 not in dict(leaderboard) and 1 not in dict(voice)
+            assert count == sum(sent for _, sent in leaderboard)
+            assert sum(sent for sent, _ in channels.values()) == count
+        assert hidden['haftalık'][0] == 0 and hidden['günlük'][0] == 0
+        # Haftadan eski kayıtlar korunur
+        kept = [user_id for user_id, timestamp in messages
+                if user_id != 1 and hour_bucket(timestamp) < week_start]
+        assert hidden['tümü'][0] == len(kept)
+        assert hidden['tümü'][2] == Counter(kept).most_common()
+        # Tahmini sayım işaret beklerken tam sayıma düşer
+        assert await db.get_active_users_count(GUILD, 'tümü') == hidden['tümü'][1]
+
+        assert await db.resets.compact() == 2
+        assert not db.resets.pending(GUILD)
+        assert await raw_rows(db, 1) == 0
+        assert await snapshot(db) == hidden
+        # Taslaklar kalan özetlerden yeniden üretildi
+        assert await db.get_active_users_count(GUILD, 'tümü') == hidden['tümü'][1]
+
+    database(scenario)
+
+
+def test_markers_survive_restart(database, manual_compaction):
+    async def first(db):
+        await fill(db, datetime.datetime.now())
+        await db.reset_user_stats(2, GUILD)
+
+    async def second(db):
+        # Yeniden açılışta bekleyen işaretler yüklenir ve sorgular hemen filtrelenir
+        assert db.resets.pending(GUILD)
+        assert await db.get_user_message_count(2, GUILD) == 0
+        hidden = await snapshot(db)
+        await db.resets.compact()
+        assert await snapshot(db) == hidden
+
+    database(first)
+    database(second)
@@ -0,0 +1,117 @@
+"""Önbelleğe alınan sonuçların yazma ve sıfırlamalardan sonra geçersiz olduğunu doğrular."""
+import asyncio
+import datetime
+
+from result_cache import ResultCache
+
+GUILD = 1
+OTHER_GUILD = 2
+
+
+def test_generations_ttl_and_shared_loads():
+    async def scenario():
+        cache = ResultCache(ttl=60)
+        loads = []
+
+        async def loader(value):
+            loads.append(value)
+            await asyncio.sleep(0)
+            return value
+
+        # Eşzamanlı istekler tek yüklemeyi paylaşır, sonraki istek önbellekten döner
+        first = await asyncio.gather(*(cache.get_or_load(GUILD, 'messages', 'k', lambda: loader(1))
+                                       for _ in range(5)))
+        assert first == [1] * 5 and loads == [1]
+        assert await cache.get_or_load(GUILD, 'messages', 'k', lambda: loader(2)) == 1
+
+        # Başka tür ya da başka sunucu yazısı sonucu etkilemez
+        cache.bump(GUILD, 'voice')
+        cache.bump(OTHER_GUILD, 'messages')
+        assert await cache.get_or_load(GUILD, 'messages', 'k', lambda: loader(2)) == 1
+
+        cache.bump(GUILD, 'messages')
+        assert await cache.get_or_load(GUILD, 'messages', 'k', lambda: loader(3)) == 3
+        cache.invalidate_guild(GUILD)
+        assert await cache.get_or_load(GUILD, 'messages', 'k', lambda: loader(4)) == 4
+
+        # Yükleme sürerken gelen yazı, eski sonucun saklanmasını engeller
+        async def racing():
+            cache.bump(GUILD, 'xp')
+            return 5
+        assert await cache.get_or_load(GUILD, 'xp', 'k', racing) == 5
+        assert await cache.get_or_load(GUILD, 'xp', 'k', lambda: loader(6)) == 6
+
+        expired = ResultCache(ttl=0)
+        await expired.get_or_load(GUILD, 'messages', 'k', lambda: loader(7))
+        assert await expired.get_or_load(GUILD, 'messages', 'k', lambda: loader(8)) == 8
+        assert expired.stats()['expirations'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_database_results_refresh_after_flush_and_reset(database):
+    async def scenario(db):
+        now = datetime.datetime.now().replace(microsecond=0)
+
+        async def results():
+            return (
+                [tuple(row) for row in await db.get_message_leaderboard(GUILD, 'günlük')],
+                (await db.get_channel_stats(10, GUILD, 'günlük')).message_count,
+                await db.get_emoji_stats(GUILD),
+                [tuple(row) for row in await db.get_permanent_stats(GUILD)],
+                await db.get_voice_leaderboard(GUILD, 'günlük'),
+                [tuple(row) for row in await db.get_top_users(GUILD)],
+            )
+
+        await db.record_message(1, 10, GUILD, 'a', now)
+        await db.log_emoji_usage(1, GUILD, None, 'x')
+        await db.ingest.flush()
+        await db.xp.checkpoint()
+        cached = await results()
+        hits = db.cache.stats()['hits']
+        assert await results() == cached
+        assert db.cache.stats()['hits'] == hits + 6
+
+        # Kapanan ses oturumu ses sıralamasını, kuyruk yazımı mesaj, emoji ve kalıcı
+        # istatistikleri, XP kaydı seviye sıralamasını yeniler
+        await db.record_message(2, 10, GUILD, 'b', now)
+        await db.record_message(2, 10, GUILD, 'b', now)
+        await db.log_emoji_usage(2, GUILD, None, 'y')
+        await db.log_voice_join(3, 50, GUILD, now - datetime.timedelta(minutes=10))
+        await db.log_voice_leave(3, 50, GUILD, now)
+        await db.ingest.flush()
+        await db.xp.checkpoint()
+        assert await results() == (
+            [(2, 2), (1, 1)],
+            3,
+            {'x': 1, 'y': 1},
+            [(3, 0, 10), (2, 2, 0), (1, 1, 0)],
+            [(3, 10)],
+            [(2, 20.0, 0), (1, 10.0, 0)],
+        )
+
+        # Başka sunucunun yazıları bu sunucunun önbelleğini boşaltmaz
+        hits = db.cache.stats()['hits']
+        await db.log_message(1, 10, OTHER_GUILD, now)
+        await db.ingest.flush()
+        await results()
+        assert db.cache.stats()['hits'] == hits + 6
+
+        # Sıfırlamalar sunucunun tüm sonuçlarını geçersiz kılar
+        await db.reset_user_stats(2, GUILD)
+        assert await results() == (
+            [(1, 1)],
+            1,
+            {'x': 1},
+            [(3, 0, 10), (1, 1, 0), (2, 0, 0)],
+            [(3, 10)],
+            [(1, 10.0, 0), (2, 0.0, 0)],
+        )
+        await db.reset_period_stats(GUILD, 'haftalık')
+        leaderboard, channel_messages, emojis, permanent, voice, levels = await results()
+        assert (leaderboard, channel_messages, voice) == ([], 0, [])
+        # Periyot sıfırlaması emoji, kalıcı istatistik ve seviyelere dokunmaz
+        assert (emojis, permanent, levels) == ({'x': 1}, [(3, 0, 10), (1, 1, 0), (2, 0, 0)],
+                                               [(1, 10.0, 0), (2, 0.0, 0)])
+
+    database(scenario, cache_ttl=3600)
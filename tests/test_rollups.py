@@ -0,0 +1,93 @@
+"""Saatlik özet tablolarının ham olay tablolarıyla aynı toplamları verdiğini doğrular."""
+import datetime
+import random
+from collections import Counter
+
+from rollups import hour_bucket, parse_timestamp, split_into_hours
+
+GUILD = 1
+
+
+async def fetch(db, query: str, params=()):
+    async with db.pool.reader() as conn:
+        async with conn.execute(query, params) as cursor:
+            return await cursor.fetchall()
+
+
+def test_split_into_hours_keeps_total_duration():
+    start = datetime.datetime(2024, 3, 31, 22, 47, 13)
+    end = datetime.datetime(2024, 4, 1, 1, 5, 2)
+    hours = split_into_hours(start, end)
+    assert list(hours) == ['2024-03-31 22:00:00', '2024-03-31 23:00:00',
+                           '2024-04-01 00:00:00', '2024-04-01 01:00:00']
+    assert sum(hours.values()) == (end - start).total_seconds()
+    assert split_into_hours(end, start) == {}
+
+
+def test_message_and_emoji_rollups_match_raw_events(database):
+    async def scenario(db):
+        rng = random.Random(5)
+        now = datetime.datetime.now()
+        # Birden çok saate, güne ve aylık bölüme dağılmış olaylar
+        for _ in range(1500):
+            timestamp = now - datetime.timedelta(minutes=rng.randrange(60 * 24 * 70))
+            await db.log_message(rng.randrange(1, 30), rng.randrange(10, 14), GUILD, timestamp)
+        for _ in range(300):
+            await db.log_emoji_usage(rng.randrange(1, 30), GUILD, None, rng.choice('abcde'))
+        await db.ingest.flush()
+
+        raw = Counter()
+        for table in db.partitions.tables('messages'):
+            rows = await fetch(db, f'SELECT user_id, channel_id, timestamp FROM {table} WHERE guild_id = ?',
+                               (GUILD,))
+            raw.update((user_id, channel_id, hour_bucket(timestamp)) for user_id, channel_id, timestamp in rows)
+        rollup = await fetch(db, '''
+            SELECT user_id, channel_id, hour, message_count FROM message_rollup_hourly WHERE guild_id = ?
+        ''', (GUILD,))
+        assert {(user_id, channel_id, str(hour)): count for user_id, channel_id, hour, count in rollup} == dict(raw)
+        assert sum(raw.values()) == 1500
+
+        raw_emojis = Counter()
+        for table in db.partitions.tables('emoji_usage'):
+            raw_emojis.update(await fetch(db, f'SELECT user_id, emoji_name FROM {table} WHERE guild_id = ?',
+                                          (GUILD,)))
+        emoji_rollup = await fetch(db, '''
+            SELECT user_id, emoji_name, SUM(usage_count) FROM emoji_rollup WHERE guild_id = ?
+            GROUP BY user_id, emoji_name
+        ''', (GUILD,))
+        assert {(user_id, name): count for user_id, name, count in emoji_rollup} == \
+            {tuple(key): count for key, count in raw_emojis.items()}
+
+    database(scenario)
+
+
+def test_voice_rollup_matches_closed_sessions(database):
+    async def scenario(db):
+        rng = random.Random(7)
+        now = datetime.datetime.now().replace(microsecond=0)
+        for user_id in range(1, 6):
+            moment = now - datetime.timedelta(hours=rng.randrange(10, 50))
+            for _ in range(4):
+                await db.log_voice_join(user_id, 50, GUILD, moment)
+                moment += datetime.timedelta(seconds=rng.randrange(60, 3 * 3600))
+                await db.log_voice_move(user_id, 51, GUILD, moment)
+                moment += datetime.timedelta(seconds=rng.randrange(60, 3600))
+                await db.log_voice_leave(user_id, 51, GUILD, moment)
+                moment += datetime.timedelta(seconds=rng.randrange(60, 600))
+        await db.ingest.flush()
+
+        raw = Counter()
+        sessions = await fetch(db, '''
+            SELECT user_id, join_time, leave_time FROM voice_activity WHERE guild_id = ?
+        ''', (GUILD,))
+        assert len(sessions) == 5 * 4 * 2
+        for user_id, join_time, leave_time in sessions:
+            for hour, seconds in split_into_hours(parse_timestamp(join_time), parse_timestamp(leave_time)).items():
+                raw[(user_id, hour)] += seconds
+        rollup = await fetch(db, '''
+            SELECT user_id, hour, SUM(voice_seconds) FROM voice_rollup_hourly WHERE guild_id = ?
+            GROUP BY user_id, hour
+        ''', (GUILD,))
+        assert {(user_id, str(hour)): seconds for user_id, hour, seconds in rollup} == dict(raw)
+
+    database(scenario)
@@ -0,0 +1,121 @@
+"""HyperLogLog aktif kullanıcı tahminlerinin hata sınırını ve tam sayıma geri dönüşü doğrular."""
+import datetime
+import math
+import random
+
+import pytest
+
+from sketches import REGISTERS, ActiveUserSketches, HyperLogLog
+
+GUILD = 1
+# Standart hata 1.04 / sqrt(m) (~%1.6); testler 3 standart hatayı sınır kabul eder
+ERROR_BOUND = 3 * 1.04 / math.sqrt(REGISTERS)
+
+
+def users(count: int, seed: int):
+    # Discord kimliklerine benzeyen büyük, seyrek sayılar
+    rng = random.Random(seed)
+    return rng.sample(range(10 ** 17, 10 ** 18), count)
+
+
+@pytest.mark.parametrize('cardinality', [1, 50, 1000, 10000, 100000])
+def test_estimate_within_error_bound(cardinality):
+    sketch = HyperLogLog()
+    sketch.update(users(cardinality, cardinality))
+    # Küçük sayılarda doğrusal sayım neredeyse kesindir
+    assert abs(sketch.count() - cardinality) <= max(1, ERROR_BOUND * cardinality)
+
+
+def test_union_and_serialization():
+    first, second = users(3000, 1), users(3000, 2)
+    overlap = first[:1000]
+    sketches = [HyperLogLog(), HyperLogLog(), HyperLogLog()]
+    for sketch, values in zip(sketches, (first, second, overlap)):
+        sketch.update(values)
+    merged = HyperLogLog.union(sketches)
+    expected = len(set(first) | set(second))
+    assert abs(merged.count() - expected) <= ERROR_BOUND * expected
+
+    # Birleştirme sıradan ve tekrardan bağımsızdır
+    assert merged.registers == HyperLogLog.union(sketches[::-1] + sketches[:1]).registers
+    # Az dolu (seyrek) ve yoğun biçimler kayıpsız geri okunur
+    small = HyperLogLog()
+    small.update(overlap[:20])
+    for sketch in (small, merged):
+        data = sketch.to_bytes()
+        assert HyperLogLog.from_bytes(data).registers == sketch.registers
+    assert len(small.to_bytes()) < REGISTERS < len(merged.to_bytes())
+    assert HyperLogLog().count() == 0
+
+
+def test_exact_count_until_backfill_finishes_then_estimate(database, monkeypatch):
+    # Geçmiş satırların taslak üretimi elle başlatılır
+    monkeypatch.setattr(ActiveUserSketches, 'start', lambda self: None)
+
+    async def scenario(db):
+        now = datetime.datetime.now()
+        active = users(3000, 3)
+        for index, user_id in enumerate(active):
+            timestamp = now - datetime.timedelta(hours=index % 200)
+            await db.log_message(user_id, 10 + index % 3, GUILD, timestamp)
+        await db.ingest.flush()
+        # Taslaklardan önceki (geçmiş) kayıtlar gibi davranması için olay kuyruğunun eklediği taslaklar silinir
+        await db.sketches.checkpoint()
+        async with db.pool.writer() as conn:
+            await conn.execute('DELETE FROM active_user_sketches')
+            await conn.commit()
+
+        assert not db.sketches.ready(GUILD)
+        for period in ('günlük', 'haftalık', 'aylık'):
+            exact = await db.get_active_users_count(GUILD, period, exact=True)
+            assert await db.get_active_users_count(GUILD, period) == exact
+            assert await db.get_active_users_count(GUILD, period, channel_id=11) == \
+                await db.get_active_users_count(GUILD, period, channel_id=11, exact=True)
+        assert db.sketches.estimates == 0
+
+        await db.sketches.backfill()
+        assert db.sketches.ready(GUILD)
+        for period in ('günlük', 'haftalık', 'aylık', 'tümü'):
+            exact = await db.get_active_users_count(GUILD, period, exact=True)
+            estimate = await db.get_active_users_count(GUILD, period)
+            assert abs(estimate - exact) <= max(1, ERROR_BOUND * exact), period
+            exact = await db.get_active_users_count(GUILD, period, channel_id=11, exact=True)
+            estimate = await db.get_active_users_count(GUILD, period, channel_id=11)
+            assert abs(estimate - exact) <= max(1, ERROR_BOUND * exact), period
+        assert db.sketches.estimates == 8
+
+        # Yeni mesajlar bellekteki farklara eklenir; tahminler kayıttan önce de onları sayar
+        newcomers = users(500, 4)
+        for user_id in newcomers:
+            await db.log_message(user_id, 10, GUILD, now)
+        await db.ingest.flush()
+        exact = await db.get_active_users_count(GUILD, 'günlük', exact=True)
+        estimate = await db.get_active_users_count(GUILD, 'günlük')
+        assert abs(estimate - exact) <= ERROR_BOUND * exact
+        assert db.sketches.stats()['pending_sketches'] > 0
+        await db.sketches.checkpoint()
+        assert db.sketches.stats()['pending_sketches'] == 0
+        assert await db.get_active_users_count(GUILD, 'günlük') == estimate
+
+    database(scenario)
+
+
+def test_pending_sketches_are_written_on_close(database, monkeypatch):
+    monkeypatch.setattr(ActiveUserSketches, 'start', lambda self: None)
+    now = datetime.datetime.now()
+    counts = {}
+
+    async def first(db):
+        await db.sketches.backfill()
+        for user_id in users(2000, 5):
+            await db.log_message(user_id, 10, GUILD, now)
+        await db.ingest.flush()
+        counts['estimate'] = await db.get_active_users_count(GUILD, 'günlük')
+
+    async def second(db):
+        # Kapanışta yazılan farklar yeniden açılışta kayıtlı taslaklardan okunur
+        await db.sketches.backfill()
+        assert await db.get_active_users_count(GUILD, 'günlük') == counts['estimate']
+
+    database(first)
+    database(second)
@@ -0,0 +1,360 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import aiosqlite
+
+from connection_pool import ConnectionPool
+from ingest import UPSERT_PERMANENT, IngestQueue, ShardedIngest
+from result_cache import ResultCache
+from rollups import UPSERT_VOICE_ROLLUP, parse_timestamp, voice_rollup_rows
+from shards import shard_for
+
+log = logging.getLogger(__name__)
+
+# Botun en son çalıştığı an; yeniden başlatmada açık kalan oturumlar bu ana kadar sayılır
+HEARTBEAT_KEY = 'voice_heartbeat'
+
+
+class VoiceSession:
+    """Bellekte tutulan açık bir sesli kanal oturumu"""
+    __slots__ = ('row_id', 'channel_id', 'join_time')
+
+    def __init__(self, row_id: int, channel_id: int, join_time: datetime.datetime):
+        self.row_id = row_id
+        self.channel_id = channel_id
+        self.join_time = join_time
+
+
+class VoiceSessionTracker:
+    """Açık oturumları bellekte tutar; ayrılma/taşınmada yalnızca o oturumu kapatıp süresini işler"""
+
+    def __init__(self, pool: ConnectionPool, ingest: Union[IngestQueue, ShardedIngest],
+                 cache: ResultCache, heartbeat_interval: float = 60.0, recovery_chunk: int = 5000):
+        self.pool = pool
+        self.ingest = ingest
+        self.cache = cache
+        self.heartbeat_interval = heartbeat_interval
+        self.recovery_chunk = recovery_chunk
+        # guild_id -> user_id -> açık oturum
+        self._open: Dict[int, Dict[int, VoiceSession]] = {}
+        self._task = None
+        # Bu sürecin sahip olduğu shard'lar (None: tüm sunucular)
+        self.shard_count: Optional[int] = None
+        self.shard_ids: Optional[List[int]] = None
+
+        self.recovered = 0
+        self.reconciled = 0
+
+    def __len__(self) -> int:
+        return sum(len(sessions) for sessions in self._open.values())
+
+    def get(self, guild_id: int, user_id: int) -> Optional[VoiceSession]:
+        return self._open.get(guild_id, {}).get(user_id)
+
+    def open_sessions(self, guild_id: int) -> List[Tuple[int, VoiceSession]]:
+        """Sunucudaki açık oturumları (user_id, oturum) olarak getir"""
+        return list(self._open.get(guild_id, {}).items())
+
+    def _shard(self, guild_id: int) -> Optional[int]:
+        """Sunucunun yazıcı hattı; ses yazmaları aynı sunucunun olay kuyruğuyla aynı hattı kullanır"""
+        return shard_for(guild_id, self.shard_count) if self.shard_count else None
+
+    def _remember(self, guild_id: int, user_id: int, session: Optional[VoiceSession]):
+        sessions = self._open.setdefault(guild_id, {})
+        if session is not None:
+            sessions[user_id] = session
+        else:
+            sessions.pop(user_id, None)
+            if not sessions:
+                del self._open[guild_id]
+
+    async def _insert(self, db: aiosqlite.Connection, guild_id: int, user_id: int,
+                      channel_id: int, timestamp: datetime.datetime) -> VoiceSession:
+        async with db.execute('''
+            INSERT INTO voice_activity (user_id, channel_id, guild_id, join_time)
+            VALUES (?, ?, ?, ?)
+            RETURNING id
+        ''', (user_id, channel_id, guild_id, timestamp)) as cursor:
+            (row_id,) = await cursor.fetchone()
+        return VoiceSession(row_id, channel_id, timestamp)
+
+    async def _close(self, db: aiosqlite.Connection, guild_id: int, user_id: int,
+                     timestamp: datetime.datetime) -> int:
+        """Kullanıcının tek açık oturumunu kapat, süresini dakika olarak döndür"""
+        session = self.get(guild_id, user_id)
+        if session is not None:
+            await db.execute('UPDATE voice_activity SET leave_time = ? WHERE id = ?',
+                             (timestamp, session.row_id))
+            channel_id, join_time = session.channel_id, session.join_time
+        else:
+            # Bellekte yoksa (ör. yeniden başlatma) tablodaki en son açık kaydı kapat
+            async with db.execute('''
+                UPDATE voice_activity
+                SET leave_time = ?
+                WHERE id = (
+                    SELECT id FROM voice_activity
+                    WHERE guild_id = ? AND user_id = ? AND leave_time IS NULL
+                    ORDER BY join_time DESC
+                    LIMIT 1
+                )
+                RETURNING channel_id, join_time
+            ''', (timestamp, guild_id, user_id)) as cursor:
+                row = await cursor.fetchone()
+            if row is None or row[1] is None:
+                return 0
+            channel_id, join_time = row[0], parse_timestamp(row[1])
+
+        if timestamp <= join_time:
+            return 0
+        await db.executemany(UPSERT_VOICE_ROLLUP, voice_rollup_rows(
+            [(user_id, channel_id, guild_id, join_time, timestamp)]
+        ))
+        return int((timestamp - join_time).total_seconds() // 60)
+
+    def _credit(self, guild_id: int, user_id: int, minutes: int):
+        """Kapanan oturumun süresini kalıcı istatistiklere ekle"""
+        if minutes > 0:
+            self.ingest.add_permanent(user_id, guild_id, voice_minutes=minutes)
+        self.cache.bump(guild_id, 'voice')
+
+    async def _transition(self, guild_id: int, user_id: int, timestamp: datetime.datetime,
+                          close: bool, channel_id: Optional[int] = None) -> int:
+        """Gerekirse açık oturumu kapatıp yeni oturumu tek işlemde aç"""
+        session = None
+        async with self.pool.writer(self._shard(guild_id)) as db:
+            try:
+                minutes = await self._close(db, guild_id, user_id, timestamp) if close else 0
+                if channel_id is not None:
+                    session = await self._insert(db, guild_id, user_id, channel_id, timestamp)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        # Bellek yalnızca işlem başarılı olunca güncellenir
+        self._remember(guild_id, user_id, session)
+        self._credit(guild_id, user_id, minutes)
+        return minutes
+
+    async def join(self, guild_id: int, user_id: int, channel_id: int, timestamp: datetime.datetime):
+        """Sesli kanala katılma; açık bir oturum kalmışsa önce onu kapat"""
+        await self._transition(guild_id, user_id, timestamp,
+                               close=self.get(guild_id, user_id) is not None, channel_id=channel_id)
+
+    async def leave(self, guild_id: int, user_id: int, timestamp: datetime.datetime) -> int:
+        """Sesli kanaldan ayrılma; kapanan oturumun dakikasını döndür"""
+        return await self._transition(guild_id, user_id, timestamp, close=True)
+
+    async def move(self, guild_id: int, user_id: int, channel_id: int, timestamp: datetime.datetime) -> int:
+        """Kanal değiştirme; eski oturumu kapatıp yenisini aynı işlemde aç"""
+        return await self._transition(guild_id, user_id, timestamp, close=True, channel_id=channel_id)
+
+    async def restart(self, db: aiosqlite.Connection, guild_id: int, timestamp: datetime.datetime,
+                      user_id: Optional[int] = None) -> Dict[int, VoiceSession]:
+        """Sıfırlamada açık oturumları süre işlemeden kapatıp yeniden aç (commit sonrası `adopt` edilir)"""
+        restarted = {}
+        for member_id, session in self.open_sessions(guild_id):
+            if user_id is not None and member_id != user_id:
+                continue
+            await db.execute('UPDATE voice_activity SET leave_time = ? WHERE id = ?',
+                             (timestamp, session.row_id))
+            restarted[member_id] = await self._insert(db, guild_id, member_id, session.channel_id, timestamp)
+        return restarted
+
+    def adopt(self, guild_id: int, sessions: Dict[int, VoiceSession]):
+        """Yeniden açılan oturumları belleğe al"""
+        for user_id, session in sessions.items():
+            self._remember(guild_id, user_id, session)
+
+    def open_seconds(self, guild_id: int, since: datetime.datetime,
+                     now: datetime.datetime) -> Dict[int, float]:
+        """Açık oturumların `since` sonrasındaki sürelerini kullanıcı bazında getir"""
+        totals = {}
+        for user_id, session in self.open_sessions(guild_id):
+            start = max(session.join_time, since)
+            if now > start:
+                totals[user_id] = (now - start).total_seconds()
+        return totals
+
+    def configure(self, shard_count: Optional[int], shard_ids: Optional[List[int]] = None):
+        """Kalp atışı ve kurtarmayı bu sürecin shard'larıyla sınırla"""
+        self.shard_count = shard_count or None
+        self.shard_ids = list(shard_ids) if shard_ids is not None and shard_count else None
+
+    @property
+    def owned_shards(self) -> List[int]:
+        if not self.shard_count:
+            return []
+        return self.shard_ids if self.shard_ids is not None else list(range(self.shard_count))
+
+    def start(self):
+        """Kalp atışı görevini başlat"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Kalp atışı görevini durdur ve kapanış anını kaydet"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.heartbeat()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception:
+                log.exception('Ses kalp atışı yazılamadı')
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def heartbeat(self, timestamp: Optional[datetime.datetime] = None):
+        """Botun hâlâ çalıştığını kaydet"""
+        timestamp = timestamp or datetime.datetime.now()
+        # Shard'lı çalışmada her shard kendi kalp atışını yazar; süreçler birbirinin oturumunu kapatmaz
+        keys = [f'{HEARTBEAT_KEY}:{shard}' for shard in self.owned_shards] or [HEARTBEAT_KEY]
+        async with self.pool.writer() as db:
+            await db.executemany('''
+                INSERT INTO bot_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', [(key, str(timestamp)) for key in keys])
+            await db.commit()
+
+    async def last_heartbeat(self, shard: Optional[int] = None) -> Optional[datetime.datetime]:
+        """Shard'ın (verilmezse herhangi bir shard'ın) en son kalp atışını getir"""
+        async with self.pool.reader() as db:
+            if shard is None:
+                query = 'SELECT MAX(value) FROM bot_meta WHERE key = ? OR key LIKE ?'
+                params = (HEARTBEAT_KEY, f'{HEARTBEAT_KEY}:%')
+            else:
+                # Shard'lı çalışmaya geçilmeden önceki ortak kayıt yedek olarak kullanılır
+                query = '''
+                    SELECT value FROM bot_meta WHERE key IN (?, ?)
+                    ORDER BY CASE WHEN key = ? THEN 0 ELSE 1 END
+                    LIMIT 1
+                '''
+                params = (f'{HEARTBEAT_KEY}:{shard}', HEARTBEAT_KEY, f'{HEARTBEAT_KEY}:{shard}')
+            async with db.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+        return parse_timestamp(row[0]) if row and row[0] else None
+
+    async def recover(self) -> int:
+        """Önceki çalışmadan açık kalan oturumları son kalp atışında kapat, kapatılan sayıyı döndür"""
+        if not self.shard_count:
+            return await self._recover(None)
+        # Yalnızca bu sürecin shard'larındaki oturumlar; diğer süreçlerin açık oturumlarına dokunulmaz
+        closed = 0
+        for shard in self.owned_shards:
+            closed += await self._recover(shard)
+        return closed
+
+    async def _recover(self, shard: Optional[int]) -> int:
+        # Kalp atışı hiç yazılmamışsa oturumların ne zaman bittiği bilinmez; süre işlenmez
+        cutoff = await self.last_heartbeat(shard)
+        if shard is None:
+            query = '''
+                SELECT id, user_id, channel_id, guild_id, join_time
+                FROM voice_activity
+                WHERE leave_time IS NULL
+                LIMIT ?
+            '''
+            params = (self.recovery_chunk,)
+        else:
+            query = '''
+                SELECT id, user_id, channel_id, guild_id, join_time
+                FROM voice_activity
+                WHERE leave_time IS NULL AND (guild_id >> 22) % ? = ?
+                LIMIT ?
+            '''
+            params = (self.shard_count, shard, self.recovery_chunk)
+
+        closed = 0
+        while True:
+            # Her parça ayrı işlemde yazılır; yazıcı bağlantısı parçalar arasında serbest kalır.
+            # Kapanan satırlar kısmi indeksten düştüğü için sorgu hep kalan açık oturumları getirir.
+            async with self.pool.writer(shard) as db:
+                try:
+                    async with db.execute(query, params) as cursor:
+                        rows = await cursor.fetchall()
+                    if not rows:
+                        break
+
+                    updates, sessions, minutes = [], [], {}
+                    for row_id, user_id, channel_id, guild_id, join_time in rows:
+                        join_time = parse_timestamp(join_time) if join_time else None
+                        if join_time is None:
+                            updates.append((cutoff or datetime.datetime.now(), row_id))
+                            continue
+                        leave_time = max(join_time, cutoff) if cutoff else join_time
+                        updates.append((leave_time, row_id))
+                        if leave_time > join_time:
+                            sessions.append((user_id, channel_id, guild_id, join_time, leave_time))
+                            key = (user_id, guild_id)
+                            minutes[key] = minutes.get(key, 0) + int((leave_time - join_time).total_seconds() // 60)
+
+                    await db.executemany('UPDATE voice_activity SET leave_time = ? WHERE id = ?', updates)
+                    if sessions:
+                        await db.executemany(UPSERT_VOICE_ROLLUP, voice_rollup_rows(sessions))
+                    now = datetime.datetime.now()
+                    await db.executemany(UPSERT_PERMANENT, [
+                        (user_id, guild_id, 0, total, now)
+                        for (user_id, guild_id), total in minutes.items() if total > 0
+                    ])
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+            closed += len(rows)
+
+        if closed:
+            if cutoff is None:
+                log.warning('Kalp atışı kaydı yok, %d açık ses oturumu süre işlenmeden kapatıldı', closed)
+            else:
+                log.info('%d açık ses oturumu kapatıldı (son kalp atışı: %s)', closed, cutoff)
+            self.cache.clear()
+        self.recovered += closed
+        return closed
+
+    async def reconcile(self, guild_id: int, members: Dict[int, int], timestamp: datetime.datetime):
+        """Sunucunun anlık ses durumuna (user_id -> channel_id) göre oturumları toplu aç/kapat"""
+        current = dict(self._open.get(guild_id, {}))
+        to_close = [user_id for user_id, session in current.items()
+                    if members.get(user_id) != session.channel_id]
+        to_open = [(user_id, channel_id) for user_id, channel_id in members.items()
+                   if user_id not in current or current[user_id].channel_id != channel_id]
+        if not to_close and not to_open:
+            return
+
+        minutes, opened = {}, {}
+        async with self.pool.writer(self._shard(guild_id)) as db:
+            try:
+                for user_id in to_close:
+                    minutes[user_id] = await self._close(db, guild_id, user_id, timestamp)
+                for user_id, channel_id in to_open:
+                    opened[user_id] = await self._insert(db, guild_id, user_id, channel_id, timestamp)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        for user_id in to_close:
+            self._remember(guild_id, user_id, None)
+        self.adopt(guild_id, opened)
+        for user_id, total in minutes.items():
+            if total > 0:
+                self.ingest.add_permanent(user_id, guild_id, voice_minutes=total)
+        self.cache.bump(guild_id, 'voice')
+        self.reconciled += len(to_close) + len(to_open)
+
+    def stats(self) -> Dict:
+        """Ses oturumu istatistiklerini getir"""
+        return {
+            'open_sessions': len(self),
+            'recovered': self.recovered,
+            'reconciled': self.reconciled,
+        }
@@ -0,0 +1,238 @@
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from connection_pool import ConnectionPool
+from result_cache import ResultCache
+
+log = logging.getLogger(__name__)
+
+XP_PER_LEVEL = 100  # Her 100 XP'de bir seviye
+DEFAULT_XP_RATE = 10.0
+
+
+class XPState:
+    """Bir kullanıcının bellekteki XP durumu"""
+    __slots__ = ('xp', 'level', 'last_message_time')
+
+    def __init__(self, xp: float, level: int, last_message_time: Optional[datetime.datetime] = None):
+        self.xp = xp
+        self.level = level
+        self.last_message_time = last_message_time
+
+
+class XPEngine:
+    """XP ve seviye hesaplarını bellekte yapıp user_levels tablosuna toplu kaydeden motor"""
+
+    def __init__(self, pool: ConnectionPool, checkpoint_interval: float = 5.0, max_entries: int = 50000,
+                 cache: Optional[ResultCache] = None):
+        self.pool = pool
+        self.cache = cache
+        self.checkpoint_interval = checkpoint_interval
+        self.max_entries = max_entries
+
+        # (guild_id, user_id) -> XPState, en son kullanılan sonda
+        self._states: 'OrderedDict[Tuple[int, int], XPState]' = OrderedDict()
+        self._dirty: Set[Tuple[int, int]] = set()
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+        # Yüklenirken sıfırlanan kullanıcılar; yüklenen eski durum belleğe alınmaz
+        self._stale: Set[Tuple[int, int]] = set()
+        self._rates: Dict[int, float] = {}
+        self._checkpoint_lock: Optional[asyncio.Lock] = None
+        self._task = None
+
+        self.checkpoints = 0
+        self.checkpointed_rows = 0
+
+    def start(self):
+        """Periyodik kayıt görevini başlat"""
+        if self._task is None:
+            self._checkpoint_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Kayıt görevini durdur ve kirli kayıtları yaz"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.checkpoint()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception:
+                log.exception('XP durumu kaydedilemedi, sonraki turda tekrar denenecek')
+
+    async def rate(self, guild_id: int) -> float:
+        """Sunucunun XP oranını (önbellekten) getir"""
+        rate = self._rates.get(guild_id)
+        if rate is None:
+            async with self.pool.reader() as db:
+                async with db.execute('''
+                    SELECT xp_per_message FROM xp_rates WHERE guild_id = ?
+                ''', (guild_id,)) as cursor:
+                    result = await cursor.fetchone()
+            rate = float(result[0]) if result else DEFAULT_XP_RATE
+            self._rates[guild_id] = rate
+        return rate
+
+    def set_rate(self, guild_id: int, xp_rate: float):
+        self._rates[guild_id] = float(xp_rate)
+
+    async def _load(self, key: Tuple[int, int], xp_amount: float) -> XPState:
+        """Kullanıcıyı ilk görüldüğünde tek sorguda oluştur/XP ekle ve durumunu yükle"""
+        guild_id, user_id = key
+        now = datetime.datetime.now()
+        async with self.pool.writer() as db:
+            async with db.execute('''
+                INSERT INTO user_levels (user_id, guild_id, xp, level, last_message_time)
+                VALUES (?, ?, ROUND(CAST(? AS NUMERIC), 2), 0, ?)
+                ON CONFLICT(user_id, guild_id) DO UPDATE SET
+                    xp = ROUND(CAST(user_levels.xp + excluded.xp AS NUMERIC), 2),
+                    last_message_time = excluded.last_message_time
+                RETURNING xp, level
+            ''', (user_id, guild_id, xp_amount, now)) as cursor:
+                xp, level = await cursor.fetchone()
+            await db.commit()
+        return XPState(float(xp), int(level), now)
+
+    async def _state(self, key: Tuple[int, int], xp_amount: float) -> Tuple[XPState, bool]:
+        """Durumu getir; ikinci değer XP'nin yükleme sırasında eklenip eklenmediği"""
+        state = self._states.get(key)
+        if state is not None:
+            self._states.move_to_end(key)
+            return state, False
+
+        # Aynı kullanıcı için eşzamanlı yüklemeleri tek sorguda birleştir
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            state = await self._load(key, xp_amount)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Bekleyen yoksa uyarı üretmesin
+            raise
+        finally:
+            del self._loading[key]
+            stale = key in self._stale
+            self._stale.discard(key)
+
+        if stale:
+            future.set_result(state)
+            return state, True
+        self._states[key] = state
+        self._evict()
+        future.set_result(state)
+        return state, True
+
+    def _evict(self):
+        """Sınır aşıldıysa kaydedilmiş en eski durumları bellekten at"""
+        if len(self._states) <= self.max_entries:
+            return
+        for key in list(self._states):
+            if len(self._states) <= self.max_entries:
+                break
+            if key not in self._dirty:
+                del self._states[key]
+
+    async def add_xp(self, guild_id: int, user_id: int, xp_amount: Optional[float] = None) -> Tuple[bool, int]:
+        """XP ekle, seviye atlandıysa (True, yeni_seviye) döndür"""
+        if xp_amount is None:
+            xp_amount = await self.rate(guild_id)
+
+        key = (guild_id, user_id)
+        state, applied = await self._state(key, xp_amount)
+        if not applied:
+            state.xp = round(state.xp + xp_amount, 2)
+            state.last_message_time = datetime.datetime.now()
+            self._dirty.add(key)
+
+        new_level = int(state.xp / XP_PER_LEVEL)
+        if new_level > state.level:
+            state.level = new_level
+            self._dirty.add(key)
+            return True, new_level
+        return False, 0
+
+    def peek(self, guild_id: int, user_id: int) -> Optional[Tuple[float, int]]:
+        """Bellekte yüklü ise kullanıcının (xp, seviye) bilgisini getir"""
+        state = self._states.get((guild_id, user_id))
+        return (state.xp, state.level) if state is not None else None
+
+    def checkpoint_lock(self) -> asyncio.Lock:
+        """Kayıtların araya girmemesi gereken işlemler (sıfırlama gibi) için kayıt kilidi"""
+        if self._checkpoint_lock is None:
+            self._checkpoint_lock = asyncio.Lock()
+        return self._checkpoint_lock
+
+    def forget(self, guild_id: int, user_id: int):
+        """Kullanıcının bellekteki durumunu at (sıfırlamalarda checkpoint_lock altında kullanılır)"""
+        key = (guild_id, user_id)
+        self._states.pop(key, None)
+        self._dirty.discard(key)
+        if key in self._loading:
+            self._stale.add(key)
+
+    async def checkpoint(self):
+        """Kirli durumları user_levels tablosuna toplu yaz"""
+        if self._checkpoint_lock is None:
+            return
+        async with self._checkpoint_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+
+            rows = []
+            for key in dirty:
+                state = self._states.get(key)
+                if state is not None:
+                    guild_id, user_id = key
+                    rows.append((user_id, guild_id, state.xp, state.level, state.last_message_time))
+
+            try:
+                async with self.pool.writer() as db:
+                    try:
+                        await db.executemany('''
+                            INSERT INTO user_levels (user_id, guild_id, xp, level, last_message_time)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(user_id, guild_id) DO UPDATE SET
+                                xp = excluded.xp,
+                                level = excluded.level,
+                                last_message_time = excluded.last_message_time
+                        ''', rows)
+                        await db.commit()
+                    except Exception:
+                        await db.rollback()
+                        raise
+            except Exception:
+                self._dirty |= dirty
+                raise
+
+            self.checkpoints += 1
+            self.checkpointed_rows += len(rows)
+
+            if self.cache is not None:
+                for guild_id in {guild_id for guild_id, _ in dirty}:
+                    self.cache.bump(guild_id, 'xp')
+
+    def stats(self) -> Dict:
+        """Motor istatistiklerini getir"""
+        return {
+            'loaded_users': len(self._states),
+            'dirty_users': len(self._dirty),
+            'checkpoints': self.checkpoints,
+            'checkpointed_rows': self.checkpointed_rows,
+        }